@@ -0,0 +1,280 @@
+"""Precomputed aggregates behind the Key Insights charts.
+
+Everything the stakeholder tabs plot is reduced once per dataset version into
+a small store keyed by (chart, metal, hormone). A rerun then only looks up a
+few hundred bytes instead of rescanning the full frame, so page latency no
+longer depends on the number of rows. A second, survey-weighted store (see
+weighted.py) backs the dashboards' weighting toggle, and cohort stores (see
+cohort.py) are built lazily over a cohort's rows.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from backend import load_backend
+from correlation import pearson_from_moments
+from data_loader import (AGE_BINS, AGE_LABELS, HORMONE_COLUMNS, METAL_COLUMNS, WEIGHT_COLUMN, build_derived_view,
+                         data_path, dataset_version)
+from profiling import span
+from shared_cache import shared_result
+from trendlines import trendlines_from_moments
+from weighted import effective_n, weighted_means, weighted_quantiles, weighted_std
+
+BOX_STATS = ['n', 'mean', 'q1', 'median', 'q3', 'lowerfence', 'upperfence']
+# Raw columns build_derived_view needs, besides the ones the charts plot
+DERIVED_SOURCE_COLUMNS = ['infertility_1yr', 'age_years', 'first_period_age', 'last_period_age']
+KDE_POINTS = 100
+KDE_BINS = 512
+POINT_CAP = 200
+
+
+# --- Box-plot summaries ---
+def _melt(groups, values, weights=None):
+    """Long (group, column, value[, weight]) rows of the present values (and positive weights)."""
+    id_vars = ['_group'] + (['_weight'] if weights is not None else [])
+    frame = values.assign(_group=groups.to_numpy())
+    if weights is not None:
+        frame['_weight'] = weights.to_numpy()
+    long = frame.melt(id_vars=id_vars, var_name='_column').dropna()
+    return long[long['_weight'] > 0] if weights is not None else long
+
+
+def box_summary(groups, values, weights=None):
+    """Box-plot statistics of every column in `values` for each group.
+
+    `groups` is a Series of group labels aligned with `values` (a DataFrame).
+    Returns a frame indexed by (group, column) with the BOX_STATS columns.
+    Quartiles use linear interpolation and the whiskers are the most extreme
+    points within 1.5 IQR of the box, the same rules Plotly applies in the
+    browser, so a box drawn from these numbers matches px.box. With row
+    `weights` the mean and quartiles are survey-weighted.
+    """
+    long = _melt(groups, values, weights)
+    grouped = long.groupby(['_group', '_column'], observed=True)['value']
+
+    if weights is None:
+        stats = grouped.agg(n='count', mean='mean')
+        quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    else:
+        stats = grouped.agg(n='count')
+        codes, value, weight = grouped.ngroup().to_numpy(), long['value'].to_numpy(), long['_weight'].to_numpy()
+        stats['mean'] = weighted_means(codes, value, weight, len(stats))
+        quartiles = pd.DataFrame(weighted_quantiles(codes, value, weight, [0.25, 0.5, 0.75], len(stats)),
+                                 index=stats.index, columns=[0.25, 0.5, 0.75])
+    stats['q1'], stats['median'], stats['q3'] = quartiles[0.25], quartiles[0.5], quartiles[0.75]
+
+    iqr = stats['q3'] - stats['q1']
+    bounds = pd.DataFrame({'lo': stats['q1'] - 1.5 * iqr, 'hi': stats['q3'] + 1.5 * iqr})
+    long = long.join(bounds, on=['_group', '_column'])
+    inside = long[(long['value'] >= long['lo']) & (long['value'] <= long['hi'])]
+    fences = inside.groupby(['_group', '_column'], observed=True)['value'].agg(['min', 'max'])
+    stats['lowerfence'], stats['upperfence'] = fences['min'], fences['max']
+
+    stats.index.names = ['group', 'column']
+    return stats[BOX_STATS]
+
+
+def thin(values, cap=POINT_CAP):
+    """At most `cap` evenly spaced order statistics of `values` (extremes kept)."""
+    values = np.sort(values)
+    if len(values) <= cap:
+        return values
+    return values[np.linspace(0, len(values) - 1, cap).round().astype(int)]
+
+
+def kde_curve(values, points=KDE_POINTS, bins=KDE_BINS, weights=None):
+    """Gaussian KDE of `values` with Plotly's violin defaults, as (grid, density).
+
+    Bandwidth is Silverman's rule and the curve spans min - 2bw .. max + 2bw,
+    like go.Violin's spanmode='soft'. The values are first binned into `bins`
+    fine bins, so the cost does not grow with the number of rows. With
+    `weights` the bins hold weight instead of counts and the bandwidth uses
+    the weighted spread and the effective sample size.
+    """
+    n = len(values)
+    if n == 0:
+        return np.array([]), np.array([])
+    if weights is None:
+        q1, q3 = np.percentile(values, [25, 75])
+        spread = min(values.std(ddof=1) if n > 1 else 0.0, (q3 - q1) / 1.349)
+        total = n
+    else:
+        q1, q3 = weighted_quantiles(np.zeros(n, dtype=int), values, weights, [0.25, 0.75])[0]
+        spread = min(weighted_std(values, weights), (q3 - q1) / 1.349)
+        n, total = effective_n(weights), weights.sum()
+    bandwidth = 1.059 * spread * n ** -0.2
+    if not bandwidth > 0:
+        bandwidth = max(abs(values.max()), 1.0) * 1e-3
+    lo, hi = values.min() - 2 * bandwidth, values.max() + 2 * bandwidth
+    counts, edges = np.histogram(values, bins=bins, range=(lo, hi), weights=weights)
+    centers = (edges[:-1] + edges[1:]) / 2
+    grid = np.linspace(lo, hi, points)
+    z = (grid[:, None] - centers[None, :]) / bandwidth
+    density = (np.exp(-0.5 * z ** 2) @ counts) / (total * bandwidth * np.sqrt(2 * np.pi))
+    return grid, density
+
+
+def distribution_details(groups, values, summary, cap=POINT_CAP, weights=None):
+    """Per-group KDE curve, capped outliers and a capped point sample.
+
+    One groupby pass over the melted values. `summary` is the matching
+    box_summary, whose whiskers decide what counts as an outlier. With row
+    `weights` the KDE is weighted; the points are always the raw values.
+    Returns {(group, column): {'kde': (grid, density), 'outliers': array, 'points': array}}.
+    """
+    long = _melt(groups, values, weights)
+    details = {}
+    for key, part in long.groupby(['_group', '_column'], observed=True):
+        vals = part['value'].to_numpy(dtype=float)
+        kde = kde_curve(vals, weights=part['_weight'].to_numpy(dtype=float) if weights is not None else None)
+        stats = summary.loc[key]
+        outliers = vals[(vals < stats['lowerfence']) | (vals > stats['upperfence'])]
+        details[key] = {'kde': kde, 'outliers': thin(outliers, cap), 'points': thin(vals, cap)}
+    return details
+
+
+def _file_distributions(groups, values, chart, store, weights=None):
+    """Stores box stats under (chart, metal) and details under (chart + '_detail', metal)."""
+    summary = box_summary(groups, values, weights)
+    details = distribution_details(groups, values, summary, weights=weights)
+    for metal, per_metal in summary.groupby(level='column'):
+        per_metal = per_metal.droplevel('column')
+        store[chart, metal, None] = per_metal
+        store[f"{chart}_detail", metal, None] = {group: details[group, metal] for group in per_metal.index}
+
+
+# --- Store construction ---
+AGGREGATE_SECTIONS = ['hormone_corr', 'infertility_rate', 'fertility_box', 'menstrual_box', 'menarche_box',
+                      'trendline']
+
+
+def build_insight_aggregates(backend, weighted=False, sections=None):
+    """Computes every aggregate the Key Insights tabs render from a query backend.
+
+    Correlations, trendline fits and infertility rates are pushed down to
+    the backend. The box and violin summaries need the metal values of each
+    group (weighted quartiles, KDE curves, thinned outliers and points), so
+    those columns and the grouping columns are fetched, also from DuckDB. With
+    `weighted=True` every statistic is weighted by WEIGHT_COLUMN. `sections`
+    limits the store to some of the AGGREGATE_SECTIONS (the first key part).
+
+    Keys are (chart, metal, hormone) with None for an unused dimension:
+      * ('hormone_corr', None, None)      - hormone x metal Pearson matrix
+      * ('hormone_corr', metal, hormone)  - a single r from that matrix
+      * ('infertility_rate', None, None)  - infertility rate by age_group
+      * ('fertility_box', metal, None)    - box stats by infertility_status
+      * ('menstrual_box', metal, None)    - box stats by regular_periods
+      * ('menarche_box', metal, None)     - box stats by first_period_age
+      * ('<chart>_detail', metal, None)   - for each box chart above: per-group KDE
+                                            curve, capped outliers and point sample
+      * ('trendline', metal, outcome)     - OLS fit of a hormone or last_period_age on a metal
+    """
+    store = {}
+    sections = set(sections or AGGREGATE_SECTIONS)
+    weights = WEIGHT_COLUMN if weighted else None
+    columns = backend.columns()
+    metals = [col for col in METAL_COLUMNS if col in columns]
+    hormones = [col for col in HORMONE_COLUMNS if col in columns]
+
+    if 'hormone_corr' in sections:
+        corr, _ = pearson_from_moments(backend.pair_moments(hormones, metals, weights=weights))
+        corr = pd.DataFrame(corr, index=hormones, columns=metals)
+        store['hormone_corr', None, None] = corr
+        for hormone in hormones:
+            for metal in metals:
+                store['hormone_corr', metal, hormone] = corr.loc[hormone, metal]
+
+    if 'infertility_rate' in sections:
+        # Share of infertile women per age band (see data_loader.build_derived_view)
+        rate = backend.rate_by_bins('age_years', AGE_BINS, AGE_LABELS, ('infertility_1yr', '==', 1),
+                                    weights=weights)
+        rate = rate.rename('is_infertile').rename_axis('age_group').reset_index()
+        rate['Infertility Rate (%)'] = rate['is_infertile'] * 100
+        store['infertility_rate', None, None] = rate
+
+    if sections & {'fertility_box', 'menstrual_box', 'menarche_box'}:
+        frame = backend.fetch(list(dict.fromkeys(metals + DERIVED_SOURCE_COLUMNS + ['regular_periods']
+                                                 + ([weights] if weights else []))))
+        derived = build_derived_view(frame)
+        row_weights = frame[weights] if weights else None
+        groupings = {'fertility_box': derived['infertility_status'], 'menstrual_box': frame['regular_periods'],
+                     'menarche_box': derived['first_period_age']}
+        for chart, groups in groupings.items():
+            if chart in sections:
+                _file_distributions(groups, frame[metals], chart, store, row_weights)
+
+    if 'trendline' in sections:
+        # All metal x outcome regressions in batched passes; menopause ages only where valid (< 100)
+        fits = [
+            trendlines_from_moments(backend.pair_moments(metals, hormones, ranges=True, weights=weights),
+                                    metals, hormones),
+            trendlines_from_moments(backend.pair_moments(metals, ['last_period_age'], ranges=True,
+                                                         filters=[('last_period_age', '<', 100)],
+                                                         weights=weights),
+                                    metals, ['last_period_age']),
+        ]
+        for (metal, outcome), fit in pd.concat(fits).iterrows():
+            store['trendline', metal, outcome] = fit
+    return store
+
+
+class LazyStore:
+    """Read-only store whose sections are built on first access.
+
+    A key's section is its chart part without a '_detail' suffix;
+    `build(section)` returns every entry of that section. Used for cohorts
+    (see cohort.py), where only the charts on screen should be computed.
+    """
+
+    def __init__(self, build, name='store'):
+        self._build = build
+        self.name = name
+        self._store = {}
+        self._built = set()
+        self._lock = threading.Lock()
+
+    def _section(self, key):
+        section = key[0].removesuffix('_detail')
+        with self._lock:
+            if section not in self._built:
+                with span(f"compute:{self.name} {section}", 'compute'):
+                    self._store.update(self._build(section))
+                self._built.add(section)
+
+    def __getitem__(self, key):
+        self._section(key)
+        return self._store[key]
+
+    def get(self, key, default=None):
+        self._section(key)
+        return self._store.get(key, default)
+
+
+@st.cache_resource(show_spinner="Precomputing insights ...", max_entries=2)
+def _load_insight_aggregates_cached(path, version, weighted):
+    def build():
+        with span("compute:insight aggregates", 'compute'):
+            return build_insight_aggregates(load_backend(path), weighted)
+    return shared_result("insight aggregates", path, version, build, (weighted,))
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _load_cohort_aggregates_cached(path, version, weighted, cohort):
+    from cohort import cohort_backend
+
+    return LazyStore(lambda section: build_insight_aggregates(cohort_backend(cohort, path), weighted, [section]),
+                     'cohort aggregates')
+
+
+def load_insight_aggregates(path=None, weighted=False, cohort=()):
+    """Returns the shared aggregate store for the current dataset version, optionally survey-weighted.
+
+    With a `cohort` (see cohort.py) the store covers the cohort's rows only
+    and builds each section when a chart first asks for it.
+    """
+    path = path or data_path()
+    if cohort:
+        return _load_cohort_aggregates_cached(path, dataset_version(path), weighted, cohort)
+    return _load_insight_aggregates_cached(path, dataset_version(path), weighted)
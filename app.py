@@ -1,12 +1,24 @@
-import pandas as pd
+import os
+import time
+
 import numpy as np
 # import matplotlib.pyplot as plt
-import seaborn as sns
 import streamlit as st
-import altair as alt
-import plotly.express as px
-from scipy.stats import pearsonr
-import plotly.graph_objects as go
+
+from aggregates import load_insight_aggregates
+from backend import load_backend
+from bootstrap import COHORT_BOOTSTRAP_ROWS
+from charts import (category_figure, crosstab_figure, figure_stats, histogram_figure, scatter_figure,
+                    summary_box_figure)
+from cohort import cohort_controls, load_cohort_index
+from correlation import load_correlations, load_screening, pearson_from_moments
+from data_loader import (HORMONE_COLUMNS, METAL_COLUMNS, METAL_MEASUREMENT_COLUMNS, WEIGHT_COLUMN,
+                         load_dataset)
+from figure_cache import clear_figures, load_figure_cache
+from insight_figures import insight_figure
+from prewarm import start_prewarm
+from profiling import name_span, payload_size, performance_page, plotly_chart, span
+from univariate import BIN_CHOICES, load_column_summaries
 
 # --- PAGE CONFIG ---
 st.set_page_config(
@@ -17,7 +29,16 @@ st.set_page_config(
 )
 
 
-df = pd.read_csv('final_cleaned.csv')
+# Query engine behind the dashboards (see backend.py): the cached in-memory frame,
+# or DuckDB over the Parquet copy with REPROSIGHT_BACKEND=duckdb
+with span("load:backend", 'load'):
+    backend = load_backend()
+# Renders every Key Insights figure in the background, once per dataset version
+# (see prewarm.py), so the first stakeholder to open a tab finds it cached
+prewarm_job = start_prewarm()
+# The admin panel can clear the caches every session shares, so it is only
+# shown on servers started with REPROSIGHT_ADMIN=1
+ADMIN = os.environ.get('REPROSIGHT_ADMIN', '0') != '0'
 
 
 # --- A. Function to display the Landing Page (with new card design) ---
@@ -181,46 +202,45 @@ def show_stakeholder_dashboard():
     st.title("ReproSight: Key Insights")
     st.markdown("### Explore key findings across different aspects of reproductive health.")
 
-# --- 4 TABS FOR MAIN DOMAINS ---
-    tab1, tab2, tab3, tab4 = st.tabs([
+    # Correlations, rates and box-plot summaries for every chart below, computed
+    # once per dataset version and keyed by (chart, metal, hormone)
+    aggregates = load_insight_aggregates(weighted=weighted, cohort=cohort)
+    if cohort:
+        cohort_rows = load_cohort_index().count(cohort)
+        st.caption(f"Cohort: {cohort_rows:,} of {load_cohort_index().rows:,} participants"
+                   + (f" · confidence intervals are only drawn for cohorts of up to {COHORT_BOOTSTRAP_ROWS:,}"
+                      if cohort_rows > COHORT_BOOTSTRAP_ROWS else ""))
+        if not cohort_rows:
+            st.warning("No participants match the cohort filters in the sidebar.")
+            return
+
+# --- 4 SECTIONS FOR MAIN DOMAINS ---
+    # st.tabs would run the code of all four tabs on every rerun; with a
+    # section selector only the visible analysis is computed
+    section = st.radio("Section", [
         "Hormonal Patterns", 
         "Fertility Analysis", 
         "Menstrual Cycle Insights", 
         "Menopause Trends"
-    ])
+    ], horizontal=True, label_visibility="collapsed", key="insights_section")
+    name_span(f"Key Insights/{section}")
 
-    with tab1:
+    if section == "Hormonal Patterns":
         st.header("Analyzing Hormonal Patterns")
 
         # st.markdown("This heatmap shows the linear relationship between various heavy metals and key reproductive hormones. Bright red indicates a strong negative correlation, while bright blue indicates a strong positive correlation.")
 
-        # Define the lists of columns for the heatmap
-        hormone_cols = ['testosterone', 'estradiol', 'shbg']
-        metal_cols = ['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L']
-
         # Ensure all selected columns exist in the dataframe
-        valid_hormone_cols = [col for col in hormone_cols if col in df.columns]
-        valid_metal_cols = [col for col in metal_cols if col in df.columns]
+        valid_hormone_cols = [col for col in HORMONE_COLUMNS if col in backend.columns()]
+        valid_metal_cols = [col for col in METAL_COLUMNS if col in backend.columns()]
 
         if not valid_hormone_cols or not valid_metal_cols:
             st.warning("Some hormone or metal columns were not found in the dataset.")
         else:
-            # Calculate the full correlation matrix for the selected columns
-            corr_matrix = df[valid_hormone_cols + valid_metal_cols].corr()
-
-            # Isolate the part of the matrix that shows metals vs. hormones
-            metal_hormone_corr = corr_matrix.loc[valid_hormone_cols, valid_metal_cols]
-
-            # Create the heatmap
-            fig_heatmap = px.imshow(
-                metal_hormone_corr,
-                text_auto=".2f",
-                aspect="auto",
-                title="Correlation Heatmap: Heavy Metals vs. Hormones",
-                color_continuous_scale='RdBu_r', # Red-Blue diverging scale
-                zmin=-1, zmax=1 # Set the color scale to be from -1 to 1
-            )
-            st.plotly_chart(fig_heatmap, use_container_width=True)
+            # The metals vs. hormones part of the correlation matrix (precomputed); every
+            # insight figure is built once and then served from the shared figure cache
+            fig_heatmap = insight_figure("hormone_heatmap", weighted=weighted, cohort=cohort)
+            plotly_chart(fig_heatmap, 'hormone_heatmap', use_container_width=True)
 
             st.markdown("This heatmap shows the linear relationship between various heavy metals and key reproductive hormones. Bright red indicates a strong negative correlation, while bright blue indicates a strong positive correlation.")
             # --- The Drill-Down Scatter Plot ---
@@ -232,24 +252,16 @@ def show_stakeholder_dashboard():
             hormone_to_plot = st.selectbox("Select a hormone to plot:", options=valid_hormone_cols, key="hormone_scatter_select")
         
         if metal_to_plot and hormone_to_plot:
-            fig_scatter = px.scatter(
-                df, 
-                x=metal_to_plot, y=hormone_to_plot,
-                trendline="ols",
-                title=f"Relationship between {metal_to_plot} and {hormone_to_plot}",
-                labels={
-                    metal_to_plot: f"Blood {metal_to_plot.split('_')[0].capitalize()} Concentration",
-                    hormone_to_plot: f"{hormone_to_plot.capitalize()} Level"
-                },
-                trendline_color_override="red"   # ← change trendline color here
-
-
-            )
-            st.plotly_chart(fig_scatter, use_container_width=True)
+            # Plain scatter for small data, server-side binned density above the threshold
+            build_start = time.perf_counter()
+            fig_scatter = insight_figure("hormone_scatter", metal_to_plot, hormone_to_plot, weighted=weighted, cohort=cohort)
+            build_seconds = time.perf_counter() - build_start
+            plotly_chart(fig_scatter, 'hormone_scatter', use_container_width=True)
+            st.caption(figure_stats(fig_scatter, build_seconds, payload_size(fig_scatter)))
 
 
     # --- Tab 2: Fertility Analysis ---    
-    with tab2:
+    if section == "Fertility Analysis":
         st.header("Infertility Insights")
         # st.markdown("""
         # This section explores how environmental heavy metal exposure, demographic variables, 
@@ -259,30 +271,16 @@ def show_stakeholder_dashboard():
         # --- Insight: Heavy Metal Exposure in Fertile vs. Infertile Groups ---
         st.subheader("How does heavy metal exposure differ between fertile and infertile groups?")
         
-        # Create a copy with readable labels
-        df['infertility_status'] = df['infertility_1yr'].map({1: 'Yes', 2: 'No'})
-
         metal_to_analyze = st.selectbox(
             "Select a heavy metal to compare:",
-            options=['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L'],
+            options=METAL_COLUMNS,
             key="fertility_metal_select"
         )
 
         if metal_to_analyze:
-            fig_title = f"Distribution of {metal_to_analyze} for Fertile and Infertile Groups"
-            fig = px.box(
-                df,
-                x='infertility_status',   # Use the new mapped column here
-                y=metal_to_analyze,
-                color='infertility_status',
-                title=fig_title,
-                labels={
-                    "infertility_status": "Reported Infertility (1 Year+)",
-                    metal_to_analyze: f"Blood {metal_to_analyze.split('_')[0].capitalize()} Concentration"
-                },
-                category_orders={"infertility_status": ["Yes", "No"]}
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            # Boxes drawn from precomputed quartiles/whiskers instead of every raw point
+            fig = insight_figure("fertility_box", metal_to_analyze, weighted=weighted, cohort=cohort)
+            plotly_chart(fig, 'fertility_box', use_container_width=True)
 
             st.info(
                 """
@@ -296,43 +294,25 @@ def show_stakeholder_dashboard():
             
             # --- Insight 2: Infertility Rate by Age Group (NEW) ---
             st.subheader("Infertility Rate by Age Group")
-            df_fertility = df.copy()
-            df_fertility['infertility_status'] = df_fertility['infertility_1yr'].map({1: 'Yes', 2: 'No'}).fillna('Unknown')
-            # 1. Define age bins and labels for reproductive years
-            bins = [18, 25, 30, 35, 40, 45, 50]
-            labels = ['18-24', '25-29', '30-34', '35-39', '40-44', '45-50']
-            
-            # 2. Create age group column (filtering out ages > 50)
-            df_age_analysis = df_fertility[(df_fertility['age_years'] >= 18) & (df_fertility['age_years'] < 50)].copy()
-            df_age_analysis['age_group'] = pd.cut(df_age_analysis['age_years'], bins=bins, labels=labels, right=False)
-            
-            # 3. Create a boolean column for infertility
-            df_age_analysis['is_infertile'] = (df_age_analysis['infertility_status'] == 'Yes')
-            
-            # 4. Calculate the mean infertility rate for each age group
-            infertility_rate_by_age = df_age_analysis.groupby('age_group')['is_infertile'].mean().reset_index()
-            infertility_rate_by_age['Infertility Rate (%)'] = infertility_rate_by_age['is_infertile'] * 100
+            # 1. Mean infertility rate for each age group (18-24 ... 45-50), precomputed
+            #    from the derived view's age_group and is_infertile columns
+            infertility_rate_by_age = aggregates['infertility_rate', None, None]
 
-            # 5. Create the bar chart
+            # 2. Create the bar chart
             if not infertility_rate_by_age.empty:
-                fig_age = px.bar(
-                    infertility_rate_by_age,
-                    x='age_group',
-                    y='Infertility Rate (%)',
-                    title='Infertility Rate by Age Group',
-                    labels={'age_group': 'Age Group', 'Infertility Rate (%)': 'Infertility Rate (%)'}
-                )
-                st.plotly_chart(fig_age, use_container_width=True)
+                fig_age = insight_figure("infertility_rate", weighted=weighted, cohort=cohort)
+                plotly_chart(fig_age, 'infertility_rate', use_container_width=True)
                 st.info(
                     """
                     **How to Interpret This Chart:**
                     This chart shows the percentage of women in each age group who reported experiencing infertility for at least one year.
+                    The error bars are 95% bootstrap confidence intervals: where two age groups' intervals overlap heavily, the difference between them may well be chance.
                     """
                 )
             else:
                 st.warning("Not enough data in the 18-50 age range to display infertility rates by age group.")
 
-    with tab3:
+    if section == "Menstrual Cycle Insights":
         st.header("Analysing Menstrual Cycle Patterns")
         # st.markdown("This section analyzes factors related to period regularity.")
         
@@ -341,20 +321,15 @@ def show_stakeholder_dashboard():
         # Let the user select a metal to analyze
         metal_menstrual = st.selectbox(
             "Select a heavy metal to compare:",
-            options=['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L'],
+            options=METAL_COLUMNS,
             key="menstrual_metal_select" # Use a unique key
         )
+        show_rain = st.checkbox("Show a sample of individual points", value=True, key="menstrual_points")
         if metal_menstrual:
-            fig_rain = go.Figure()
-            # Loop for Raincloud plot
-            for status in df['regular_periods'].unique():
-                df_filtered = df[df['regular_periods'] == status]
-                fig_rain.add_trace(go.Violin(
-                    x=df_filtered['regular_periods'], y=df_filtered[metal_menstrual], name=status,
-                    box_visible=True, meanline_visible=True, points='all', jitter=0.3, pointpos=-1.8
-                ))
-            fig_rain.update_layout(title_text=f"Raincloud Plot: {metal_menstrual} for Regular vs. Irregular Cycles", xaxis_title="Regular Menstrual Periods", showlegend=False)
-            st.plotly_chart(fig_rain, use_container_width=True)
+            # Raincloud plot from precomputed KDE curves, box stats and a capped point sample per
+            # regular_periods code, instead of shipping every row and estimating the KDE in the browser
+            fig_rain = insight_figure("menstrual_raincloud", metal_menstrual, show_rain, weighted=weighted, cohort=cohort)
+            plotly_chart(fig_rain, 'menstrual_raincloud', use_container_width=True)
 
         st.markdown("---")
 
@@ -362,33 +337,16 @@ def show_stakeholder_dashboard():
         # --- Insight 2: Age of First Period vs. Metal Exposure (NEW BOX PLOT) ---
         st.subheader("How heavy Metal Exposure affects the Age of First Period")
         
-        # Filter for realistic first period ages
-        df_menarche = df[df['first_period_age'].between(8, 20)].copy()
-        
-        # --- FIX ---
-        # Convert the age column to a string so Plotly treats it as a category, not a number
-        df_menarche['first_period_age'] = df_menarche['first_period_age'].astype(str)
 
         metal_menarche = st.selectbox(
             "Select a heavy metal to investigate:",
-            options=['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L'],
+            options=METAL_COLUMNS,
             key="menarche_metal_select"
         )
         if metal_menarche:
-            fig_menarche_box = px.box(
-                df_menarche,
-                y='first_period_age',  # X-axis is now the discrete age
-                x=metal_menarche,      # Y-axis is the continuous metal level
-                color='first_period_age', # Color by age for clarity
-                title=f"Distribution of {metal_menarche} by Age of First Period",
-                labels={
-                    "first_period_age": "Age of First Period",
-                    metal_menarche: f"Blood {metal_menarche.split('_')[0].capitalize()} Concentration"
-                }
-            )
-            # Sort the x-axis to be in numerical order (e.g., 11, 12, 13)
-            fig_menarche_box.update_xaxes(categoryorder='category ascending')
-            st.plotly_chart(fig_menarche_box, use_container_width=True)
+            # Realistic first period ages (8-20), summarised per age label
+            fig_menarche_box = insight_figure("menarche_box", metal_menarche, weighted=weighted, cohort=cohort)
+            plotly_chart(fig_menarche_box, 'menarche_box', use_container_width=True)
             st.info("This chart helps explore if metal exposure levels differ by the age of first menstruation. You can look for a trend (e.g., rising or falling) in the boxes as age increases.")
         # if metal_menstrual:
         #     fig = go.Figure()
@@ -420,39 +378,28 @@ def show_stakeholder_dashboard():
             
 
 
-    with tab4:
+    if section == "Menopause Trends":
         st.header("Menopause Trends")
         st.subheader("Investigating the Link Between Toxin Exposure and Menopause Age")
         
-        # Filter the dataframe to only include rows with valid 'last_period_age' data
-        df_menopause = df.dropna(subset=['last_period_age'])
-        # 2. Then, filter out the unrealistic ages greater than 100
-        df_menopause = df_menopause[df_menopause['last_period_age'] < 100]
-
         # Let the user select a metal to investigate
         metal_menopause = st.selectbox(
             "Select a heavy metal to investigate:",
-            options=['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L'],
+            options=METAL_COLUMNS,
             key="menopause_metal_select" # Use a unique key
         )
 
         if metal_menopause:
-            fig = px.scatter(
-                df_menopause, 
-                x=metal_menopause, 
-                y='last_period_age', 
-                trendline="ols", # Ordinary Least Squares trendline
-                title=f"Relationship between {metal_menopause} and Age of Last Period",
-                labels={
-                    "last_period_age": "Age of Last Menstrual Period",
-                    metal_menopause: f"Blood {metal_menopause.split('_')[0].capitalize()} Concentration"
-                },
-                trendline_color_override="red"   # ← change trendline color here
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            build_start = time.perf_counter()
+            # Only rows with a valid 'last_period_age' (present and below the 999 "don't know" code)
+            fig = insight_figure("menopause_scatter", metal_menopause, weighted=weighted, cohort=cohort)
+            build_seconds = time.perf_counter() - build_start
+            plotly_chart(fig, 'menopause_scatter', use_container_width=True)
+            st.caption(figure_stats(fig, build_seconds, payload_size(fig)))
             st.info(
                 """
                 **How to Interpret This Chart:** A downward-sloping trendline could suggest an association between higher exposure to a metal and an earlier age of menopause.
+                The shaded band is the 95% bootstrap confidence interval of the line; a band that could as well slope upward means the trend is not established.
                 """
             )
 
@@ -464,17 +411,31 @@ def show_scientist_dashboard():
 
     st.markdown("### Interactive EDA Toolkit for Deep-Dive Analysis")
 
+    # Cached, columnar load (see data_loader.py) for the row-level views below;
+    # the Key Insights dashboard only queries the backend
+    with span("load:dataset", 'load'):
+        df = load_dataset()
+        # Histograms, value counts and quantiles of every column, computed in one
+        # pass per dataset version (see univariate.py)
+        summaries = load_column_summaries()
 
-# --- THE TABBED INTERFACE ---
-    tab1, tab2, tab3, tab4 = st.tabs([
+
+# --- THE SECTION SELECTOR ---
+    # Only the selected section runs on a rerun, unlike st.tabs
+    section = st.radio("Section", [
         "Data Overview",
         "Univariate Explorer",
         "Bivariate Explorer",
         "Correlation Matrix"
-    ])
+    ], horizontal=True, label_visibility="collapsed", key="explore_section")
+    name_span(f"Explore Dataset/{section}")
 
     # --- Tab 1: Data Overview ---
-    with tab1:
+    if section == "Data Overview":
+        # Modules only this section uses are imported on first use, not on startup
+        import plotly.express as px
+        from inspector import column_range, inspector_page
+        from missingness import load_missingness
         # st.header("Dataset Quick Look")
         
         st.subheader("Shape and Size")
@@ -484,48 +445,100 @@ def show_scientist_dashboard():
         col2.metric("Number of Columns", f"{cols}")
  
 
-        # Raw dataset inspector
+        # Raw dataset inspector: only the visible page is sent to the browser; sorting and
+        # filtering run server-side against cached per-column sort indexes
         st.subheader("Raw Data Inspector")
-        st.dataframe(df)
+        numeric_columns = df.select_dtypes(include=np.number).columns.tolist()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            sort_column = st.selectbox("Sort by", options=[None] + df.columns.tolist(), key="inspector_sort")
+            ascending = st.toggle("Ascending", value=True, key="inspector_ascending")
+        with col2:
+            filter_column = st.selectbox("Filter column (range)", options=[None] + numeric_columns, key="inspector_filter")
+            low = high = None
+            if filter_column:
+                col_min, col_max = column_range(filter_column)
+                if col_min < col_max:
+                    low, high = st.slider("Keep values between", min_value=col_min, max_value=col_max,
+                                          value=(col_min, col_max), key=f"inspector_range_{filter_column}")
+                else:
+                    low, high = col_min, col_max
+                    st.caption(f"{filter_column} only takes the value {col_min:g}.")
+        with col3:
+            page_size = st.selectbox("Rows per page", options=[25, 50, 100, 250], index=1, key="inspector_page_size")
+
+        first_page, total_rows = inspector_page(0, page_size, sort_column, ascending, filter_column, low, high)
+        n_pages = max(1, -(-total_rows // page_size))
+        page = st.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages, value=1,
+                               key="inspector_page") - 1
+        page_df = first_page if page == 0 else inspector_page(
+            page, page_size, sort_column, ascending, filter_column, low, high)[0]
+        st.dataframe(page_df)
+        st.caption(f"Rows {page * page_size + min(1, total_rows):,}-{page * page_size + len(page_df):,} "
+                   f"of {total_rows:,} matching rows")
 
         # st.subheader("Data Types")
         # st.dataframe(df.dtypes.to_frame().rename(columns={0: 'Data Type'}))
 
         st.subheader("Missing Values Heatmap")
-        # A simple heatmap to show missing data patterns
-        missing_data = df.isnull()
-        fig_missing = px.imshow(missing_data, title="Heatmap of Missing Values",
-                                labels=dict(color="Missing (True/False)"))
-        st.plotly_chart(fig_missing, use_container_width=True)
+        # Fraction missing per block of rows, from the bit-packed mask cached per dataset
+        # version; the image is never more than 200 blocks tall, whatever the row count
+        missingness = load_missingness()
+        missing_rows = st.slider("Zoom into rows", min_value=0, max_value=rows,
+                                 value=(0, rows), key="missing_rows")
+        if missing_rows[1] > missing_rows[0]:
+            fractions, edges = missingness.block_fractions(*missing_rows, blocks=200)
+            fig_missing = px.imshow(fractions, x=missingness.columns, y=edges[:-1],
+                                    aspect="auto", zmin=0, zmax=1, color_continuous_scale='Blues',
+                                    title=f"Heatmap of Missing Values (rows {missing_rows[0]:,}-{missing_rows[1]:,})",
+                                    labels=dict(x="Column", y="First Row of Block", color="Fraction Missing"))
+            plotly_chart(fig_missing, 'missingness_heatmap', use_container_width=True)
+
+        st.subheader("Co-missingness Patterns")
+        st.write("The most common combinations of columns that are missing together in the same row.")
+        st.dataframe(missingness.patterns(top=15), hide_index=True)
         
         st.subheader("Summary Statistics (Numerical Columns)")
-        st.dataframe(df.describe())
+        # Same table as df.describe(), from the precomputed column summaries
+        st.dataframe(summaries.describe())
 
 
     # --- Tab 2, 3, 4: (The code for these tabs remains the same for now) ---
  
-    with tab2:
+    if section == "Univariate Explorer":
         st.header("Univariate Explorer")
-        # This selectbox will now be populated with your new columns
-        column_to_inspect = st.selectbox("Select a column to inspect", df.columns)
-        # The rest of the logic works as is!
-        if df[column_to_inspect].dtype in ['int64', 'float64']:
-            fig = px.histogram(df, x=column_to_inspect, nbins=40, title=f"Distribution of {column_to_inspect}")
+        # Drawn from the precomputed summaries; no rows are read here
+        column_to_inspect = st.selectbox("Select a column to inspect", df.columns, key="univariate_column")
+        if summaries.is_categorical(column_to_inspect):
+            fig = category_figure(summaries.value_counts(column_to_inspect),
+                                  title=f"Category Counts for {column_to_inspect}", label=column_to_inspect)
         else:
-            fig = px.bar(df[column_to_inspect].value_counts().reset_index(),
-                 x='index', y=column_to_inspect,
-                 title=f"Category Counts for {column_to_inspect}")
-        st.plotly_chart(fig)
-
-    with tab3:
+            # Rebinned from the fine base histogram, so any bin count is instant
+            bins = st.select_slider("Bins", options=BIN_CHOICES, value=40, key="univariate_bins")
+            counts, edges = summaries.histogram(column_to_inspect, bins)
+            fig = histogram_figure(counts, edges, title=f"Distribution of {column_to_inspect}", label=column_to_inspect)
+        plotly_chart(fig, 'univariate')
+
+        stats = summaries.stats.loc[column_to_inspect]
+        caption = f"{summaries.rows - stats['missing']:,.0f} values · {stats['missing_rate']:.1%} missing"
+        if summaries.is_categorical(column_to_inspect):
+            caption += f" · {len(summaries.value_counts(column_to_inspect))} categories"
+        elif not np.isnan(stats['q50']):
+            caption += (f" · mean {stats['mean']:.4g} · sd {stats['std']:.4g} · median {stats['q50']:.4g}"
+                        f" · 5-95% {stats['q5']:.4g} to {stats['q95']:.4g}")
+        st.caption(caption)
+
+    if section == "Bivariate Explorer":
+        from bivariate import category_labels, load_pair_summary
         st.header("Bivariate Relationship Explorer")
         # # These selectboxes will also update automatically
         # x_var = st.selectbox("Select X-axis variable", df.columns, key="bivariate_x")
         # y_var = st.selectbox("Select Y-axis variable", df.columns, key="bivariate_y")
-        numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
-        categorical_cols = df.select_dtypes(include=['category', 'object']).columns.tolist()
+        # Coded answers with few values count as categorical, as in the Univariate Explorer
+        categorical_cols = [col for col in df.columns if summaries.is_categorical(col)]
+        numeric_cols = [col for col in df.select_dtypes(include=np.number).columns if col not in categorical_cols]
 
-        metal_columns = ['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L', 'lead_µmol/L', 'cadmium_nmol/L', 'mercury_nmol/L', 'selenium_µmol/L', 'manganese_nmol/L', 'Blood metal weights']
+        metal_columns = METAL_MEASUREMENT_COLUMNS + [WEIGHT_COLUMN]
         non_metal_columns = [col for col in df.columns if col not in metal_columns]
 
 
@@ -540,39 +553,105 @@ def show_scientist_dashboard():
         if x_var and y_var:
             if x_var in numeric_cols and y_var in numeric_cols:
                 st.subheader(f"Scatter Plot: {x_var} vs. {y_var}")
-                fig = px.scatter(df, x=x_var, y=y_var, color=color_var, title=f"{x_var} vs. {y_var}")
-                st.plotly_chart(fig, use_container_width=True)
-
-                # Create a temporary dataframe with only the two columns and drop rows where EITHER value is missing
-                temp_df = df[[x_var, y_var]].dropna()
-                
-                # Check if there's enough data left to calculate correlation
-                if len(temp_df) > 1:
-                    corr, p_value = pearsonr(temp_df[x_var], temp_df[y_var])
-                    st.info(f"**Pearson Correlation**: {corr:.3f}\n\n**P-value**: {p_value:.3g}")
+                build_start = time.perf_counter()
+                frame = df[list(dict.fromkeys([x_var, y_var]))]
+                color = None
+                if color_var:
+                    # Labelled categories for a discrete legend rather than a scale of codes
+                    color = color_var if color_var not in (x_var, y_var) else f"{color_var} (category)"
+                    frame = frame.assign(**{color: category_labels(df[color_var], color_var).to_numpy()})
+                fig = scatter_figure(frame, x=x_var, y=y_var, color=color, title=f"{x_var} vs. {y_var}")
+                build_seconds = time.perf_counter() - build_start
+                plotly_chart(fig, 'bivariate_scatter', use_container_width=True)
+                st.caption(figure_stats(fig, build_seconds, payload_size(fig)))
+
+                # Pairwise-complete moments from the backend, survey-weighted with the
+                # sidebar toggle like the Correlation Matrix (see correlation.py)
+                moments = backend.pair_moments([x_var], [y_var], weights=WEIGHT_COLUMN if weighted else None)
+                if moments['n'][0, 0] > 1:
+                    r, p_value = (value[0, 0] for value in pearson_from_moments(moments))
+                    label = "Survey-weighted Pearson Correlation" if weighted else "Pearson Correlation"
+                    st.info(f"**{label}**: {r:.3f}\n\n**P-value**: {p_value:.3g}")
                     st.write("A low p-value (e.g., < 0.05) suggests a statistically significant linear relationship.")
+                    if weighted:
+                        st.caption(f"The p-value uses Kish's effective sample size ({moments['n_eff'][0, 0]:,.0f} "
+                                   f"of {moments['n'][0, 0]:,.0f} rows).")
                 else:
                     st.warning("Not enough overlapping data to calculate correlation.")
             
-            # ... (rest of the plotting logic for box plots and heatmaps)
-            elif (x_var in numeric_cols and y_var in categorical_cols) or \
-                 (x_var in categorical_cols and y_var in numeric_cols):
-                 # ... your box plot code
-                 pass # Placeholder for brevity
-            else:
-                 # ... your heatmap code
-                 pass # Placeholder for brevity
+            elif x_var in categorical_cols and y_var in categorical_cols:
+                st.subheader(f"Crosstab: {x_var} by {y_var}")
+                pair = load_pair_summary(x_var, y_var, weighted=weighted)
+                table = pair['table'] if weighted else pair['counts']
+                fig = crosstab_figure(table, title=f"{y_var} by {x_var}", x_label=x_var, y_label=y_var,
+                                      value_label="weighted count" if weighted else "count")
+                plotly_chart(fig, 'bivariate_crosstab', use_container_width=True)
+                if pair['dof']:
+                    st.info(f"**Chi-square test of independence**: χ² = {pair['chi2']:,.2f}, "
+                            f"df = {pair['dof']}, p = {pair['p_value']:.3g}\n\n"
+                            f"**Cramér's V**: {pair['cramers_v']:.3f} · n = {pair['n']:,}")
+                    st.write("A low p-value (e.g., < 0.05) suggests the two variables are not independent.")
+                    if pair['sparse_share'] > 0.2:
+                        st.warning(f"{pair['sparse_share']:.0%} of cells expect fewer than 5 rows, so the "
+                                   "chi-square approximation may be unreliable.")
+                else:
+                    st.warning("Not enough categories with data to test independence.")
+                if weighted:
+                    st.caption("Cells are survey-weighted counts; the test uses the unweighted counts.")
 
-    with tab4:
+            else:
+                horizontal = y_var in categorical_cols
+                numeric_var, category_var = (x_var, y_var) if horizontal else (y_var, x_var)
+                st.subheader(f"Box Plot: {numeric_var} by {category_var}")
+                pair = load_pair_summary(x_var, y_var, weighted=weighted)
+                fig = summary_box_figure(pair['box'], horizontal=horizontal, title=f"{numeric_var} by {category_var}",
+                                         category_label=category_var, value_label=numeric_var,
+                                         details=pair['details'])
+                plotly_chart(fig, 'bivariate_box', use_container_width=True)
+                st.dataframe(pair['box'].round(3), use_container_width=True)
+
+        # --- Correlation screening: every metal against every other numeric variable ---
+        st.markdown("---")
+        st.subheader("Correlation Screening")
+        st.write("Pearson correlation of every metal with every other numeric variable, computed in one pass "
+                 "and corrected for multiple testing with the Benjamini-Hochberg false discovery rate.")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            fdr_level = st.number_input("False discovery rate", min_value=0.001, max_value=0.5, value=0.05,
+                                        step=0.01, format="%.3f", key="screening_fdr")
+        with col2:
+            discoveries_only = st.checkbox("Only show discoveries", value=True, key="screening_significant")
+        with col3:
+            alternate_units = st.checkbox("Include molar-unit metal columns", key="screening_units")
+
+        screening = load_screening(alternate_units, weighted=weighted)
+        discoveries = screening['q (BH)'] <= fdr_level
+        st.caption(f"{int(discoveries.sum()):,} of {len(screening):,} pairs significant at FDR {fdr_level:g}")
+        st.dataframe(screening[discoveries] if discoveries_only else screening, hide_index=True,
+                     column_config={"r": st.column_config.NumberColumn(format="%.3f"),
+                                    "p": st.column_config.NumberColumn(format="%.2e"),
+                                    "q (BH)": st.column_config.NumberColumn(format="%.2e")})
+
+    if section == "Correlation Matrix":
+        import plotly.express as px
         st.header("Correlation Matrix")
         # This will also work automatically by selecting only numeric columns
         # ...
         st.write("Visualize the linear relationships between all numerical variables.")
 
-        numeric_df = df.select_dtypes(include=np.number)
-        
-        # 1. Calculate the correlation matrix and immediately round it
-        corr_matrix = numeric_df.corr().round(2)
+        col1, col2 = st.columns(2)
+        with col1:
+            corr_method = st.radio("Method", options=["pearson", "spearman"], horizontal=True,
+                                   format_func=str.capitalize, key="corr_method")
+        with col2:
+            significant_only = st.checkbox("Only show significant correlations (p < 0.05)", key="corr_significant")
+
+        # 1. The full r / p / n matrices are computed once per dataset version and method;
+        #    the controls below only mask the cached result
+        correlations = load_correlations(corr_method, weighted=weighted)
+        if weighted and corr_method == "spearman":
+            st.caption("Spearman correlations are rank-based and are shown unweighted.")
+        corr_matrix = correlations['r'].round(2)
 
         corr_threshold = st.slider(
             "Filter by absolute correlation strength", 
@@ -582,9 +661,10 @@ def show_scientist_dashboard():
             step=0.05
         )
         
-        filtered_corr = corr_matrix[
-            ((corr_matrix >= corr_threshold) | (corr_matrix <= -corr_threshold)) & (corr_matrix != 1.0)
-        ]
+        keep = ((corr_matrix >= corr_threshold) | (corr_matrix <= -corr_threshold)) & (corr_matrix != 1.0)
+        if significant_only:
+            keep &= correlations['p'] < 0.05
+        filtered_corr = corr_matrix[keep]
         
         # 2. Plot the rounded and filtered matrix
         fig = px.imshow(
@@ -595,21 +675,78 @@ def show_scientist_dashboard():
             color_continuous_scale='RdBu_r'
         )
         
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(fig, 'correlation_heatmap', use_container_width=True)
         
 
+# --- D. Admin panel: shared figure cache statistics ---
+def show_admin_panel():
+    """Hit/miss counts and memory use of the figure cache shared by all sessions, and prewarm progress."""
+    figure_cache = load_figure_cache()
+    stats = figure_cache.stats()
+    col1, col2 = st.columns(2)
+    col1.metric("Hit rate", f"{stats['hit_rate']:.0%}")
+    col2.metric("Figures cached", stats['entries'])
+    st.caption(f"{stats['hits']:,} hits · {stats['disk_hits']:,} from disk · {stats['misses']:,} misses · "
+               f"{stats['evictions']:,} evictions · "
+               f"{stats['bytes'] / 2 ** 20:,.1f} of {stats['max_bytes'] / 2 ** 20:,.0f} MB")
+    chart_stats = figure_cache.chart_stats()
+    if not chart_stats.empty:
+        # Rounded rather than styled: DataFrame.style imports matplotlib
+        st.dataframe(chart_stats.round({'kB': 1}), use_container_width=True)
+    if prewarm_job is not None:
+        if prewarm_job.error:
+            st.caption(f"Prewarm failed after {prewarm_job.done}/{prewarm_job.total or '?'} figures: "
+                       f"{prewarm_job.error}")
+        elif prewarm_job.finished:
+            st.caption(f"Prewarm: {prewarm_job.done - len(prewarm_job.failed)}/{prewarm_job.total} figures "
+                       f"in {prewarm_job.seconds:.1f} s")
+        else:
+            st.caption(f"Prewarm: running, {prewarm_job.done}/{prewarm_job.total or '?'} figures")
+    if st.button("Clear figure cache", key="admin_clear_figures"):
+        clear_figures()
+        st.rerun()
+
+
 # --- SIDEBAR ---
 st.sidebar.title("Navigation")
 # The user selects their role here
+# The Performance view (see profiling.py) is hidden unless the URL has ?perf=1
 app_mode = st.sidebar.selectbox("What would you like to explore?",
-    ["Select mode ...",  "Explore Dataset", "Key Insights"])
+    ["Select mode ...",  "Explore Dataset", "Key Insights"] + (["Performance"] if "perf" in st.query_params else []))
+
+# Global switch for the NHANES sampling weights: every mean, rate, quantile,
+# correlation and trendline in both dashboards then estimates the population
+# rather than describing the sample (see weighted.py)
+weighted = st.sidebar.toggle(
+    "Survey-weighted statistics", key="weighted", disabled=WEIGHT_COLUMN not in backend.columns(),
+    help=f"Weight every statistic by the NHANES sampling weights ('{WEIGHT_COLUMN}').")
+
+# Cohort cross-filter for every Key Insights chart (see cohort.py): precomputed
+# bitmap and sorted indexes turn the selection into a row mask, and each chart
+# is recomputed over the cohort's rows only
+cohort = ()
+if app_mode == "Key Insights":
+    cohort = cohort_controls(st.sidebar.expander("Cohort", expanded=False))
+    # Report and cohort extracts, built in the background (see export.py)
+    from export import export_panel
+    export_panel(st.sidebar.expander("Export", expanded=False), weighted=weighted, cohort=cohort)
+
+if ADMIN:
+    with st.sidebar.expander("Admin"):
+        show_admin_panel()
 
 # --- MAIN PAGE ---
+# Each dashboard runs in a timing span, named after its section (see profiling.py)
 if app_mode == "Explore Dataset":
-    show_scientist_dashboard()    # Build your interactive, technical dashboard here
+    with span("Explore Dataset"):
+        show_scientist_dashboard()    # Build your interactive, technical dashboard here
 
 elif app_mode == "Key Insights":
-    show_stakeholder_dashboard()    # Build your clean, narrative-driven dashboard here
+    with span("Key Insights"):
+        show_stakeholder_dashboard()    # Build your clean, narrative-driven dashboard here
+
+elif app_mode == "Performance":
+    performance_page()
 
 else:
     show_landing_page()
@@ -0,0 +1,388 @@
+"""Query backends behind the dashboards.
+
+The dashboards' aggregate queries go through a backend instead of touching
+a DataFrame directly: filtered counts and projections, histogram binning
+(1-D and the 2-D bins of density scatters, with their stratified point
+sample), grouped rates and the pairwise moments behind every correlation and
+trendline. Two backends answer the same queries:
+  * PandasBackend - the shared in-memory frame from load_dataset,
+  * DuckDBBackend - an embedded DuckDB over the Parquet copy, so the engine
+    scans, filters and aggregates the file itself; pair moments stream the
+    projected columns in bounded record batches. The dataset never has to
+    fit in memory and no external service is needed.
+
+Some consumers still fetch rows (projected to the columns they need):
+  * the box / violin summaries of aggregates.build_insight_aggregates, whose
+    weighted quartiles, KDE curves and thinned outliers and points need each
+    group's values,
+  * bootstrap._prepare, since every Poisson replicate reweights single rows,
+  * the density scatters up to charts.DENSITY_THRESHOLD rows, drawn point
+    by point,
+  * the Explore Dataset pages, which read the in-memory frame directly.
+Both aggregate stores are built once per dataset version and then shared
+(shared_cache.py).
+
+REPROSIGHT_BACKEND selects one ('pandas' by default). duckdb is an optional
+dependency, imported only when its backend is used.
+
+Filters are lists of (column, op, value) triples that must all hold, with
+op one of ==, !=, <, <=, >, >=, between (value = (low, high), inclusive),
+in (value = a list) and notnull (value ignored). Missing values never match.
+
+Rates and pair moments take an optional `weights` column for survey-weighted
+statistics (see weighted.py); rows without a positive weight are left out.
+"""
+import operator
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from data_loader import data_path, dataset_version, ensure_parquet, load_dataset
+from profiling import span
+
+BACKEND = os.environ.get('REPROSIGHT_BACKEND', 'pandas')
+COMPARISONS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le,
+               '>': operator.gt, '>=': operator.ge}
+# Rows per Arrow record batch when DuckDB streams columns for the pair moments
+ROWS_PER_BATCH = 1 << 17
+
+
+class PandasBackend:
+    """Answers backend queries from an in-memory DataFrame."""
+
+    name = 'pandas'
+
+    def __init__(self, df):
+        self.df = df
+
+    def columns(self):
+        return list(self.df.columns)
+
+    def numeric_columns(self):
+        return self.df.select_dtypes(include=np.number).columns.tolist()
+
+    def _mask(self, filters):
+        mask = np.ones(len(self.df), dtype=bool)
+        for column, op, value in filters or ():
+            series = self.df[column]
+            if op == 'between':
+                matches = series.between(*value)
+            elif op == 'in':
+                matches = series.isin(value)
+            elif op == 'notnull':
+                matches = series.notna()
+            else:
+                matches = COMPARISONS[op](series, value) & series.notna()
+            mask &= matches.to_numpy(dtype=bool)
+        return mask
+
+    def count(self, filters=None):
+        """Number of rows matching `filters`."""
+        return int(self._mask(filters).sum()) if filters else len(self.df)
+
+    def fetch(self, columns, filters=None):
+        """The given columns of the rows matching `filters`, as a DataFrame."""
+        if not filters:
+            return self.df[columns]
+        return self.df.loc[self._mask(filters), columns]
+
+    def histogram(self, column, bins=40, filters=None):
+        """(counts, edges) of `bins` equal-width bins over the non-missing values."""
+        values = self.fetch([column], filters)[column].to_numpy(dtype=float, na_value=np.nan)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        return np.histogram(values, bins=bins)
+
+    def histogram2d(self, x, y, bins=60, filters=None):
+        """(counts, x edges, y edges) of `bins` x `bins` equal-width bins over the rows with both values.
+
+        `counts` has x along its first axis, like np.histogram2d.
+        """
+        values = self.fetch([x, y], filters).dropna()
+        return np.histogram2d(values[x].to_numpy(dtype=float), values[y].to_numpy(dtype=float), bins=bins)
+
+    def stratified_sample(self, x, y, xedges, yedges, size, filters=None):
+        """About `size` rows of columns x and y, allocated across the 2D bins by their share of rows.
+
+        Every non-empty bin keeps at least one row (charts.stratified_sample).
+        """
+        # Imported here: charts is the figure layer and only its sampling rule is shared
+        from charts import stratified_sample
+
+        values = self.fetch([x, y], filters).dropna()
+        xbin = np.clip(np.searchsorted(xedges, values[x].to_numpy(dtype=float), side='right') - 1,
+                       0, len(xedges) - 2)
+        ybin = np.clip(np.searchsorted(yedges, values[y].to_numpy(dtype=float), side='right') - 1,
+                       0, len(yedges) - 2)
+        return values.iloc[stratified_sample(xbin * (len(yedges) - 1) + ybin, size)]
+
+    def rate_by_bins(self, column, bins, labels, flag, filters=None, weights=None):
+        """Share of rows with `flag` (a filter triple) in each [bins[i], bins[i + 1]) bin of `column`.
+
+        Rows outside the bins are ignored; a bin without rows gets NaN.
+        With a `weights` column the share is of the bin's total weight.
+        Returns a Series indexed by the categorical bin labels.
+        """
+        if weights:
+            filters = list(filters or []) + [(weights, '>', 0)]
+        frame = self.df if not filters else self.df[self._mask(filters)]
+        groups = pd.cut(frame[column], bins=bins, labels=labels, right=False)
+        flagged = pd.Series(PandasBackend(frame)._mask([flag]), index=frame.index)
+        if not weights:
+            return flagged.groupby(groups, observed=False).mean()
+
+        # Imported here so the unweighted path does not load it
+        from weighted import weighted_means
+        codes = groups.cat.codes.to_numpy()
+        inside = codes >= 0
+        rates = weighted_means(codes[inside], flagged.to_numpy(dtype=float)[inside],
+                               frame[weights].to_numpy(dtype=float)[inside], len(labels))
+        return pd.Series(rates, index=pd.CategoricalIndex(labels, categories=labels, ordered=True, name=column))
+
+    def pair_moments(self, x_columns, y_columns, filters=None, ranges=False, weights=None):
+        """correlation.pair_moments of every x column against every y column.
+
+        With `ranges=True` the result also has x_min and x_max, the range of
+        x over the rows each pair uses (see trendlines.pair_x_ranges). With a
+        `weights` column the moments are weighted.
+        """
+        # Imported here because correlation loads its data through this module
+        from correlation import pair_moments
+        from trendlines import pair_x_ranges
+
+        if weights:
+            filters = list(filters or []) + [(weights, '>', 0)]
+        frame = self.fetch(list(dict.fromkeys(x_columns + y_columns + ([weights] if weights else []))), filters)
+        X = frame[x_columns].to_numpy(dtype=float, na_value=np.nan)
+        Y = frame[y_columns].to_numpy(dtype=float, na_value=np.nan)
+        moments = pair_moments(X, Y, frame[weights].to_numpy(dtype=float) if weights else None)
+        if ranges:
+            moments.update(pair_x_ranges(X, Y))
+        return moments
+
+
+class DuckDBBackend:
+    """Answers backend queries with an embedded DuckDB scanning a Parquet file."""
+
+    name = 'duckdb'
+
+    def __init__(self, parquet):
+        try:
+            import duckdb
+        except ImportError as err:
+            raise ImportError("REPROSIGHT_BACKEND=duckdb needs the optional duckdb package "
+                              "(pip install duckdb)") from err
+        self._con = duckdb.connect()
+        # Partition directories (ingest.py) repeat columns the files already hold
+        self._con.execute(f"CREATE VIEW data AS SELECT * FROM read_parquet({_literal(parquet)}, "
+                          f"hive_partitioning = false)")
+        schema = self._con.execute("DESCRIBE data").fetchall()
+        self._columns = [row[0] for row in schema]
+        self._numeric = [row[0] for row in schema
+                         if row[1].split('(')[0] in {'TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT',
+                                                     'FLOAT', 'DOUBLE', 'DECIMAL', 'UTINYINT', 'USMALLINT',
+                                                     'UINTEGER', 'UBIGINT'}]
+
+    def _query(self, sql, params=()):
+        # A cursor per query: DuckDB connections must not be shared across threads
+        return self._con.cursor().execute(sql, list(params))
+
+    def columns(self):
+        return list(self._columns)
+
+    def numeric_columns(self):
+        return list(self._numeric)
+
+    def count(self, filters=None):
+        where, params = _where(filters)
+        return self._query(f"SELECT count(*) FROM data {where}", params).fetchone()[0]
+
+    def fetch(self, columns, filters=None):
+        where, params = _where(filters)
+        return self._query(f"SELECT {', '.join(map(_ident, columns))} FROM data {where}", params).df()
+
+    def histogram(self, column, bins=40, filters=None):
+        col = _ident(column)
+        where, params = _where(list(filters or []) + [(column, 'notnull', None)])
+        lo, hi = self._query(f"SELECT min({col}), max({col}) FROM data {where}", params).fetchone()
+        if lo is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5  # np.histogram's range for a constant column
+        edges = np.linspace(lo, hi, bins + 1)
+        # Same binning as np.histogram: equal widths, the last bin closed on the right
+        rows = self._query(
+            f"SELECT least(floor(({col} - ?) / ?)::BIGINT, {bins - 1}) AS bin, count(*) "
+            f"FROM data {where} GROUP BY bin", [lo, (hi - lo) / bins] + params).fetchall()
+        counts = np.zeros(bins, dtype=np.int64)
+        for b, n in rows:
+            counts[b] = n
+        return counts, edges
+
+    def _pair_bins(self, x, y, filters):
+        """WHERE clause, parameters and (x, y) ranges of the rows with both values, as np.histogram2d spans them."""
+        where, params = _where(list(filters or []) + [(x, 'notnull', None), (y, 'notnull', None)])
+        row = self._query(f"SELECT min({_ident(x)}), max({_ident(x)}), min({_ident(y)}), max({_ident(y)}) "
+                          f"FROM data {where}", params).fetchone()
+        ranges = []
+        for lo, hi in (row[:2], row[2:]):
+            if lo is None:
+                lo, hi = 0.0, 1.0  # np.histogram2d's range without values
+            elif lo == hi:
+                lo, hi = lo - 0.5, hi + 0.5
+            ranges.append((float(lo), float(hi)))
+        return where, params, ranges
+
+    @staticmethod
+    def _bin_sql(column, edges):
+        bins = len(edges) - 1
+        return (f"least(floor(({_ident(column)} - ?) / ?)::BIGINT, {bins - 1})",
+                [edges[0], (edges[-1] - edges[0]) / bins])
+
+    def histogram2d(self, x, y, bins=60, filters=None):
+        where, params, ((xlo, xhi), (ylo, yhi)) = self._pair_bins(x, y, filters)
+        xedges, yedges = np.linspace(xlo, xhi, bins + 1), np.linspace(ylo, yhi, bins + 1)
+        xbin, xparams = self._bin_sql(x, xedges)
+        ybin, yparams = self._bin_sql(y, yedges)
+        rows = self._query(f"SELECT {xbin} AS bx, {ybin} AS by_, count(*) FROM data {where} GROUP BY bx, by_",
+                           xparams + yparams + params).fetchall()
+        counts = np.zeros((bins, bins))
+        for bx, by, n in rows:
+            counts[bx, by] = n
+        return counts, xedges, yedges
+
+    def stratified_sample(self, x, y, xedges, yedges, size, filters=None):
+        """PandasBackend.stratified_sample, drawn per bin inside DuckDB.
+
+        Each bin keeps its rows with the smallest hash of their values (a
+        top-n aggregate, so nothing is sorted), which makes the sample
+        repeatable but not the same rows the pandas backend draws.
+        """
+        where, params = _where(list(filters or []) + [(x, 'notnull', None), (y, 'notnull', None)])
+        xbin, xparams = self._bin_sql(x, xedges)
+        ybin, yparams = self._bin_sql(y, yedges)
+        ybins = len(yedges) - 1
+        cells = f"SELECT {_ident(x)} AS x, {_ident(y)} AS y, {xbin} * {ybins} + {ybin} AS cell FROM data {where}"
+        counts = dict(self._query(f"SELECT cell, count(*) FROM ({cells}) GROUP BY cell",
+                                  xparams + yparams + params).fetchall())
+        total = sum(counts.values())
+        quota = np.zeros((len(xedges) - 1) * ybins, dtype=np.int64)
+        for cell, n in counts.items():
+            # charts.stratified_sample's allocation; every bin is kept whole when the rows fit
+            quota[cell] = n if total <= size else max(1, round(n * size / total))
+        if not total:
+            return pd.DataFrame({x: [], y: []})
+        sample = self._query(
+            f"SELECT * FROM (SELECT unnest(list_slice(picked, 1, list_extract(?::BIGINT[], cell + 1)), "
+            f"recursive := true) FROM (SELECT cell, arg_min(struct_pack(x := x, y := y), hash(x, y), "
+            f"{int(quota.max())}) AS picked FROM ({cells}) GROUP BY cell)) ORDER BY x, y",
+            [quota.tolist()] + xparams + yparams + params).df()
+        return sample.set_axis([x, y], axis=1)
+
+    def rate_by_bins(self, column, bins, labels, flag, filters=None, weights=None):
+        col = _ident(column)
+        flag_sql, flag_params = _condition(*flag)
+        flagged = f"CASE WHEN {flag_sql} THEN 1.0 ELSE 0.0 END"
+        rate = f"avg({flagged})"
+        if weights:
+            filters = list(filters or []) + [(weights, '>', 0)]
+            rate = f"sum({flagged} * {_ident(weights)}) / sum({_ident(weights)})"
+        case = ' '.join(f"WHEN {col} >= ? AND {col} < ? THEN {i}" for i in range(len(labels)))
+        edge_params = [edge for i in range(len(labels)) for edge in (bins[i], bins[i + 1])]
+        where, params = _where(filters)
+        rows = dict(self._query(
+            f"SELECT bin, {rate} "
+            f"FROM (SELECT *, CASE {case} END AS bin FROM data {where}) WHERE bin IS NOT NULL GROUP BY bin",
+            flag_params + edge_params + params).fetchall())
+        index = pd.CategoricalIndex(labels, categories=labels, ordered=True, name=column)
+        return pd.Series([rows.get(i, np.nan) for i in range(len(labels))], index=index, dtype=float)
+
+    def pair_moments(self, x_columns, y_columns, filters=None, ranges=False, weights=None):
+        """PandasBackend.pair_moments, accumulated over record batches streamed from DuckDB.
+
+        DuckDB filters and projects the columns; the per-pair sums are the
+        same matrix products as in memory, added up batch by batch, so only
+        ROWS_PER_BATCH rows are ever held at once.
+        """
+        # Imported here because correlation loads its data through this module
+        from correlation import moments_from_sums, pair_sums
+        from trendlines import pair_x_ranges
+
+        if weights:
+            filters = list(filters or []) + [(weights, '>', 0)]
+        columns = list(dict.fromkeys(x_columns + y_columns + ([weights] if weights else [])))
+        where, params = _where(filters)
+        select = ', '.join(f"{_ident(column)}::DOUBLE" for column in columns)
+        reader = self._query(f"SELECT {select} FROM data {where}", params).to_arrow_reader(ROWS_PER_BATCH)
+        xi = [columns.index(column) for column in x_columns]
+        yi = [columns.index(column) for column in y_columns]
+        shape = (len(x_columns), len(y_columns))
+        stats = ['n', 'sx', 'sy', 'sxx', 'syy', 'sxy'] + (['sw', 'sww'] if weights else [])
+        sums = {stat: np.zeros(shape) for stat in stats}
+        x_min, x_max = np.full(shape, np.inf), np.full(shape, -np.inf)
+        for batch in reader:
+            values = np.column_stack([column.to_numpy(zero_copy_only=False) for column in batch.columns])
+            X, Y = values[:, xi], values[:, yi]
+            w = values[:, columns.index(weights)] if weights else None
+            for stat, value in pair_sums(X, Y, w).items():
+                sums[stat] += value
+            if ranges:
+                batch_ranges = pair_x_ranges(X, Y)
+                x_min = np.minimum(x_min, batch_ranges['x_min'])
+                x_max = np.maximum(x_max, batch_ranges['x_max'])
+        moments = moments_from_sums(sums)
+        if ranges:
+            moments.update(x_min=x_min, x_max=x_max)
+        return moments
+
+
+def _ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _condition(column, op, value):
+    col = _ident(column)
+    if op == 'between':
+        return f"{col} BETWEEN ? AND ?", list(value)
+    if op == 'in':
+        return f"{col} IN ({', '.join('?' * len(value))})", list(value)
+    if op == 'notnull':
+        return f"{col} IS NOT NULL", []
+    if op not in COMPARISONS:
+        raise ValueError(f"Unknown filter operator {op!r}")
+    return f"{col} {'<>' if op == '!=' else op.replace('==', '=')} ?", [value]
+
+
+def _where(filters):
+    """SQL WHERE clause and its parameters for a filter list."""
+    if not filters:
+        return '', []
+    clauses, params = [], []
+    for column, op, value in filters:
+        clause, clause_params = _condition(column, op, value)
+        clauses.append(clause)
+        params += clause_params
+    return 'WHERE ' + ' AND '.join(clauses), params
+
+
+@st.cache_resource(show_spinner="Opening dataset ...", max_entries=2)
+def _load_backend_cached(path, version, name):
+    if name == 'duckdb':
+        with span("compute:open duckdb", 'compute'):
+            return DuckDBBackend(ensure_parquet(path, version))
+    if name == 'pandas':
+        return PandasBackend(load_dataset(path))
+    raise ValueError(f"Unknown REPROSIGHT_BACKEND {name!r}; expected 'pandas' or 'duckdb'")
+
+
+def load_backend(path=None, name=None):
+    """The shared query backend for the current dataset version (REPROSIGHT_BACKEND by default)."""
+    path = path or data_path()
+    return _load_backend_cached(path, dataset_version(path), name or BACKEND)
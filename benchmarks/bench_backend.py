@@ -0,0 +1,70 @@
+"""Compares the pandas and DuckDB query backends on the dashboards' aggregate queries.
+
+Usage:
+    python -m benchmarks.bench_backend [--scales 1 100] [--backends pandas duckdb]
+
+Every backend runs in a fresh interpreter with the Parquet copy already on
+disk. Reported per scale and backend:
+  * open s        - opening the backend (reading the frame / attaching the file)
+  * insights s    - build_insight_aggregates (correlations, rates, fits, box summaries)
+  * corr s        - Pearson matrix of every numeric column
+  * hist ms       - a 40-bin histogram of one column
+  * rss MB        - process RSS growth over the whole run
+"""
+import argparse
+import json
+import logging
+import subprocess
+import sys
+
+from benchmarks.synthetic import write_synthetic
+
+_RUN = """
+import json, logging, time
+logging.disable(logging.WARNING)
+import psutil
+process = psutil.Process()
+rss = process.memory_info().rss
+import aggregates, backend, correlation
+timings = {{}}
+start = time.perf_counter()
+b = backend.load_backend({path!r}, name={name!r})
+timings['open'] = time.perf_counter() - start
+start = time.perf_counter()
+aggregates.build_insight_aggregates(b)
+timings['insights'] = time.perf_counter() - start
+columns = b.numeric_columns()
+start = time.perf_counter()
+correlation.correlation_frames(b.pair_moments(columns, columns), columns)
+timings['corr'] = time.perf_counter() - start
+start = time.perf_counter()
+b.histogram('age_years', bins=40)
+timings['hist'] = time.perf_counter() - start
+timings['rss'] = (process.memory_info().rss - rss) / 1e6
+print(json.dumps(timings))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 100])
+    parser.add_argument('--backends', nargs='+', default=['pandas', 'duckdb'])
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    from data_loader import DATA_PATH, ensure_parquet
+
+    print(f"{'scale':>6} {'backend':>8} {'open s':>7} {'insights s':>11} {'corr s':>7} {'hist ms':>8} {'rss MB':>7}")
+    for scale in args.scales:
+        path = DATA_PATH if scale == 1 else write_synthetic(scale)
+        ensure_parquet(path)
+        for name in args.backends:
+            result = subprocess.run([sys.executable, '-c', _RUN.format(path=path, name=name)],
+                                    capture_output=True, text=True, check=True)
+            r = json.loads(result.stdout.strip().splitlines()[-1])
+            print(f"{scale:>5}x {name:>8} {r['open']:>7.2f} {r['insights']:>11.2f} {r['corr']:>7.2f} "
+                  f"{r['hist'] * 1e3:>8.1f} {r['rss']:>7.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""Load test: concurrent browser sessions against running dashboard workers.
+
+Usage:
+    python -m benchmarks.bench_concurrency [--sessions 16] [--rounds 2] [--think 0.5] [--ramp 0]
+                                           [--url http://localhost:8501 ...]
+    python -m benchmarks.bench_concurrency --workers 4 [--scale 1] [--private] [...]
+
+Each simulated session speaks Streamlit's WebSocket protocol like a browser
+tab: it opens /_stcore/stream, asks for a script run, then sends each widget
+change of SCENARIO as a rerun request. A run is timed from the request to
+the server's script_finished message. Sessions are spread round-robin over
+the worker URLs, as a sticky load balancer would spread browsers, and start
+within --ramp seconds. Each round is a fresh session walking the whole
+scenario, pausing --think seconds between steps.
+
+With --workers the workers are started here through serve.py, on a
+synthetic copy of the dataset for --scale > 1 (benchmarks.synthetic), with
+the shared cache prepared first or, with --private, without
+REPROSIGHT_SHARED.
+
+Reported numbers:
+  * per step and overall - p50 / p90 / p99 / max latency in ms, and failed
+                           runs (an exception on the page, a timeout or a
+                           dropped connection)
+  * throughput           - completed runs per second over the whole test
+  * worker memory        - with --workers, each worker's RSS split into
+                           anonymous pages (its private heap) and file pages
+                           (the mapped dataset, shared between workers),
+                           and PSS, which divides shared pages between the
+                           processes mapping them
+"""
+import argparse
+import asyncio
+import logging
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import urlparse
+
+import numpy as np
+import psutil
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.httpclient import HTTPRequest
+from tornado.websocket import websocket_connect
+
+from benchmarks.synthetic import write_synthetic
+
+MODE_LABEL = "What would you like to explore?"
+INSIGHT_SECTIONS = ["Hormonal Patterns", "Fertility Analysis", "Menstrual Cycle Insights", "Menopause Trends"]
+EXPLORE_SECTIONS = ["Data Overview", "Univariate Explorer", "Bivariate Explorer", "Correlation Matrix"]
+# (step, widget changes) walked by every session; widgets are named by key, or by label without one
+SCENARIO = [
+    ("landing", {}),
+    ("Key Insights", {MODE_LABEL: "Key Insights"}),
+    *[(f"Key Insights/{section}", {"insights_section": section}) for section in INSIGHT_SECTIONS[1:]],
+    ("Key Insights (weighted)", {"weighted": True}),
+    ("Explore Dataset", {MODE_LABEL: "Explore Dataset", "weighted": False}),
+    *[(f"Explore Dataset/{section}", {"explore_section": section}) for section in EXPLORE_SECTIONS[1:]],
+]
+RUN_TIMEOUT = 600
+STARTUP_TIMEOUT = 3600
+PERCENTILES = [50, 90, 99]
+
+
+class Session:
+    """One browser tab: a WebSocket to a worker and the widget values it has set."""
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.url = f"{'wss' if parsed.scheme == 'https' else 'ws'}://{parsed.netloc}/_stcore/stream"
+        self.widgets = {}
+        self.states = {}
+        self.ws = None
+
+    async def connect(self):
+        self.ws = await websocket_connect(HTTPRequest(self.url), subprotocols=['streamlit'])
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+
+    def _set(self, name, value):
+        matches = [(widget_id, widget) for widget_id, widget in self.widgets.items()
+                   if widget_id.endswith(f"-{name}") or widget[1].label == name]
+        if not matches:
+            raise KeyError(f"no widget {name!r} on the page")
+        widget_id, (kind, widget) = matches[-1]
+        state = WidgetState(id=widget_id)
+        if kind == 'selectbox':
+            state.string_value = value
+        elif kind == 'radio':
+            state.int_value = list(widget.options).index(value)
+        elif kind == 'checkbox':
+            state.bool_value = value
+        else:
+            raise TypeError(f"cannot set a {kind} widget")
+        self.states[widget_id] = state
+
+    async def run(self, changes):
+        """Requests a run with `changes` applied; returns (seconds, whether the page shows an exception)."""
+        for name, value in changes.items():
+            self._set(name, value)
+        msg = BackMsg()
+        msg.rerun_script.query_string = ''
+        msg.rerun_script.widget_states.widgets.extend(self.states.values())
+        start = time.perf_counter()
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+        failed = False
+        while True:
+            raw = await self.ws.read_message()
+            if raw is None:
+                raise ConnectionError("connection closed by the server")
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof('type')
+            if kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                element_kind = element.WhichOneof('type')
+                if element_kind in ('selectbox', 'radio', 'checkbox'):
+                    widget = getattr(element, element_kind)
+                    self.widgets[widget.id] = (element_kind, widget)
+                failed |= element_kind == 'exception'
+            elif kind == 'script_finished' and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                succeeded = forward.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY
+                return time.perf_counter() - start, failed or not succeeded
+
+
+async def _session(url, delay, rounds, think, results):
+    await asyncio.sleep(delay)
+    for _ in range(rounds):
+        session = Session(url)
+        try:
+            await session.connect()
+            for step, changes in SCENARIO:
+                try:
+                    seconds, failed = await asyncio.wait_for(session.run(changes), RUN_TIMEOUT)
+                except (asyncio.TimeoutError, ConnectionError, KeyError) as err:
+                    results.append((step, None, repr(err)))
+                    break
+                results.append((step, seconds, 'exception on the page' if failed else None))
+                await asyncio.sleep(think)
+        except OSError as err:
+            results.append(('connect', None, repr(err)))
+        finally:
+            session.close()
+
+
+async def load_test(urls, sessions, rounds, think, ramp):
+    """Runs `sessions` concurrent sessions; returns [(step, seconds or None, error or None)] and the wall time."""
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*[_session(urls[i % len(urls)], ramp * i / max(sessions, 1), rounds, think, results)
+                           for i in range(sessions)])
+    return results, time.perf_counter() - start
+
+
+def latency_table(results):
+    """Latency percentiles and failures per step, in SCENARIO order, plus an 'all runs' row."""
+    steps = [step for step, _ in SCENARIO] + ['connect', 'all runs']
+    rows = []
+    for step in steps:
+        runs = [r for r in results if step == 'all runs' or r[0] == step]
+        timings = np.array([seconds for _, seconds, error in runs if seconds is not None and error is None]) * 1e3
+        failed = sum(error is not None for _, _, error in runs)
+        if not runs:
+            continue
+        row = {'step': step, 'runs': len(runs), 'failed': failed}
+        for p, value in zip(PERCENTILES, np.percentile(timings, PERCENTILES) if len(timings) else
+                            [np.nan] * len(PERCENTILES)):
+            row[f"p{p}"] = value
+        row['max'] = timings.max() if len(timings) else np.nan
+        rows.append(row)
+    return rows
+
+
+# --- Workers started here (--workers) ---
+def _status_mb(pid):
+    values = {}
+    with open(f"/proc/{pid}/status") as fh:
+        for line in fh:
+            if line.startswith(('RssAnon:', 'RssFile:')):
+                name, kb = line.split()[:2]
+                values[name.rstrip(':')] = int(kb) / 1024
+    return values
+
+
+def worker_memory(server):
+    """(pid, anon MB, file MB, PSS MB) of every worker process under a serve.py process."""
+    rows = []
+    for worker in psutil.Process(server.pid).children():
+        try:
+            status = _status_mb(worker.pid)
+            rows.append((worker.pid, status.get('RssAnon', np.nan), status.get('RssFile', np.nan),
+                         worker.memory_full_info().pss / 2 ** 20))
+        except (OSError, psutil.Error):
+            continue
+    return rows
+
+
+def wait_ready(urls, server, timeout=STARTUP_TIMEOUT):
+    """Waits until every worker answers its health check; False if the server exits or time runs out."""
+    deadline = time.monotonic() + timeout
+    pending = list(urls)
+    while pending and time.monotonic() < deadline and server.poll() is None:
+        try:
+            with urllib.request.urlopen(f"{pending[0]}/_stcore/health", timeout=5) as response:
+                if response.status == 200:
+                    pending.pop(0)
+                    continue
+        except OSError:
+            pass
+        time.sleep(1)
+    return not pending
+
+
+def start_server(workers, port, scale, private):
+    data = None if scale == 1 else write_synthetic(scale)
+    command = [sys.executable, 'serve.py', '--workers', str(workers), '--port', str(port)]
+    command += (['--data', data] if data else []) + (['--private'] if private else [])
+    # Worker logs and banners would drown the report
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', action='append',
+                        help="a worker's base URL (repeatable; default http://localhost:8501)")
+    parser.add_argument('--sessions', type=int, default=16, help="concurrent sessions")
+    parser.add_argument('--rounds', type=int, default=2, help="fresh sessions each simulated user opens in turn")
+    parser.add_argument('--think', type=float, default=0.5, help="seconds between a session's interactions")
+    parser.add_argument('--ramp', type=float, default=0.0, help="seconds over which the sessions start")
+    parser.add_argument('--workers', type=int, default=0, help="start this many workers with serve.py")
+    parser.add_argument('--port', type=int, default=8501, help="first worker port with --workers")
+    parser.add_argument('--scale', type=int, default=1, help="synthetic dataset scale with --workers")
+    parser.add_argument('--private', action='store_true', help="with --workers: no shared dataset or cache")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    server = None
+    if args.workers:
+        urls = [f"http://localhost:{args.port + i}" for i in range(args.workers)]
+        server = start_server(args.workers, args.port, args.scale, args.private)
+        start = time.perf_counter()
+        if not wait_ready(urls, server):
+            server.terminate()
+            print("workers did not start")
+            return 1
+        print(f"{args.workers} {'private' if args.private else 'shared'} workers ready in "
+              f"{time.perf_counter() - start:.1f} s", flush=True)
+    else:
+        urls = args.url or ['http://localhost:8501']
+
+    try:
+        results, seconds = asyncio.run(load_test(urls, args.sessions, args.rounds, args.think, args.ramp))
+        memory = worker_memory(server) if server else []
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    completed = sum(error is None for _, _, error in results)
+    print(f"{args.sessions} sessions x {args.rounds} rounds over {len(urls)} workers: {completed:,} runs in "
+          f"{seconds:.1f} s ({completed / seconds:.1f} runs/s)")
+    print(f"  {'step':<38}{'runs':>6}{'failed':>8}" + ''.join(f"{f'p{p} ms':>10}" for p in PERCENTILES)
+          + f"{'max ms':>10}")
+    for row in latency_table(results):
+        print(f"  {row['step']:<38}{row['runs']:>6}{row['failed']:>8}"
+              + ''.join(f"{row[f'p{p}']:>10.0f}" for p in PERCENTILES) + f"{row['max']:>10.0f}")
+    errors = sorted({error for _, _, error in results if error})
+    for error in errors[:5]:
+        print(f"  error: {error}")
+    for pid, anon, file, pss in memory:
+        print(f"  worker {pid}: anon {anon:,.0f} MB  file {file:,.0f} MB  pss {pss:,.0f} MB")
+    if memory:
+        print(f"  total: anon {sum(m[1] for m in memory):,.0f} MB  pss {sum(m[3] for m in memory):,.0f} MB")
+    return 1 if completed < len(results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
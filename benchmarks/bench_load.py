@@ -0,0 +1,76 @@
+"""Measures dataset load times before and after the cached Parquet loader.
+
+Usage:
+    python -m benchmarks.bench_load [--scales 1 100] [--repeat 5]
+
+For every scale it reports:
+  * csv          - the old path, pd.read_csv on every rerun
+  * cold_start   - first load: parse CSV, downcast, write Parquet
+  * parquet      - a new process with the Parquet copy already on disk
+  * rerun        - a Streamlit rerun, i.e. a hit on the in-process cache
+"""
+import argparse
+import logging
+import os
+import shutil
+import time
+
+import pandas as pd
+
+import data_loader
+from benchmarks.synthetic import write_synthetic
+
+
+def _best(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_scale(scale, repeat):
+    path = data_loader.DATA_PATH if scale == 1 else write_synthetic(scale)
+    version = data_loader.dataset_version(path)
+
+    def cold_start():
+        shutil.rmtree(data_loader.CACHE_DIR, ignore_errors=True)
+        data_loader.read_dataset(path, version)
+
+    results = {
+        'rows': len(pd.read_csv(path, usecols=[0])),
+        'csv': _best(lambda: pd.read_csv(path), repeat),
+        'cold_start': _best(cold_start, repeat),
+        'parquet': _best(lambda: data_loader.read_dataset(path, version), repeat),
+    }
+    data_loader._load_dataset_cached.clear()
+    data_loader.load_dataset(path)
+    results['rerun'] = _best(lambda: data_loader.load_dataset(path), repeat)
+    results['csv_mb'] = pd.read_csv(path).memory_usage(deep=True).sum() / 1e6
+    results['cached_mb'] = data_loader.load_dataset(path).memory_usage(deep=True).sum() / 1e6
+    results['file_mb'] = os.path.getsize(path) / 1e6
+    results['parquet_mb'] = os.path.getsize(data_loader.parquet_path(path, version)) / 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 100])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    # Bare-mode cache calls warn about the missing ScriptRunContext on every hit
+    logging.disable(logging.WARNING)
+
+    header = (f"{'scale':>6} {'rows':>9} {'csv s':>8} {'cold s':>8} {'parquet s':>10} {'rerun ms':>9} "
+              f"{'csv MB':>8} {'pq MB':>7} {'mem MB':>7} -> {'cached':>6}")
+    print(header)
+    for scale in args.scales:
+        r = bench_scale(scale, args.repeat)
+        print(f"{scale:>5}x {r['rows']:>9,} {r['csv']:>8.3f} {r['cold_start']:>8.3f} {r['parquet']:>10.3f} "
+              f"{r['rerun'] * 1e3:>9.3f} {r['file_mb']:>8.1f} {r['parquet_mb']:>7.1f} {r['csv_mb']:>7.1f} "
+              f"-> {r['cached_mb']:>6.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Measures memory allocated per Key Insights rerun and across many open sessions.
+
+Usage:
+    python -m benchmarks.bench_rerun_memory [--scale 1] [--sessions 8]
+
+Each session is a headless AppTest run of app.py switched to "Key Insights".
+Reported numbers:
+  * rerun peak MB - tracemalloc peak for one warm rerun (numpy/pandas buffers included)
+  * rss MB        - process RSS growth while `--sessions` sessions are kept open
+
+AppTest shares one runtime per process, so sessions are driven one after
+another rather than from threads; each keeps its state alive until the end,
+as concurrent browser sessions would.
+"""
+import argparse
+import logging
+import os
+import tracemalloc
+
+import psutil
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.synthetic import write_synthetic
+
+
+def _session(mode='Key Insights'):
+    at = AppTest.from_file('app.py', default_timeout=600)
+    at.run()
+    at.sidebar.selectbox[0].select(mode).run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return at
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--sessions', type=int, default=8)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    if args.scale != 1:
+        os.environ['REPROSIGHT_DATA'] = write_synthetic(args.scale)
+
+    # Warm the shared caches, then measure one rerun on its own
+    at = _session()
+    tracemalloc.start()
+    at.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    sessions = [_session() for _ in range(args.sessions)]
+    rss_growth = process.memory_info().rss - rss_before
+
+    print(f"scale {args.scale}x: rerun peak {peak / 1e6:.1f} MB, "
+          f"rss +{rss_growth / 1e6:.1f} MB over {len(sessions)} open sessions")
+
+
+if __name__ == '__main__':
+    main()
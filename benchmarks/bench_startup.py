@@ -0,0 +1,90 @@
+"""Measures cold start and per-interaction rerun time of each dashboard section.
+
+Usage:
+    python -m benchmarks.bench_startup [--scale 1] [--repeat 5]
+
+Reported numbers:
+  * import s      - importing the app's modules in a fresh interpreter, and
+                    which heavy optional modules that pulled in
+  * first run s   - the first AppTest run of app.py in a fresh interpreter
+                    (imports, dataset load and landing page)
+  * rerun ms      - median warm rerun per dashboard section, i.e. the cost of
+                    one widget interaction while that section is visible
+"""
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.synthetic import write_synthetic
+
+APP_MODULES = ['streamlit', 'plotly.express', 'aggregates', 'charts', 'correlation', 'data_loader',
+               'inspector', 'missingness']
+HEAVY_MODULES = ['scipy', 'seaborn', 'altair', 'matplotlib', 'statsmodels']
+SECTION_KEYS = {'Key Insights': 'insights_section', 'Explore Dataset': 'explore_section'}
+
+_IMPORT_PROBE = f"""
+import sys, time
+start = time.perf_counter()
+for module in {APP_MODULES!r}:
+    __import__(module)
+print(time.perf_counter() - start)
+print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+"""
+
+_FIRST_RUN_PROBE = """
+import logging, time
+logging.disable(logging.WARNING)
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+at = AppTest.from_file('app.py', default_timeout=600).run()
+print(time.perf_counter() - start)
+"""
+
+
+def _probe(code):
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return result.stdout.split('\n')
+
+
+def _median_rerun(at, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - start)
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    if args.scale != 1:
+        os.environ['REPROSIGHT_DATA'] = write_synthetic(args.scale)
+
+    import_seconds, heavy = _probe(_IMPORT_PROBE)[:2]
+    first_run = float(_probe(_FIRST_RUN_PROBE)[0])
+    print(f"scale {args.scale}x: import {float(import_seconds):.2f} s "
+          f"(heavy modules: {heavy or 'none'}), first run {first_run:.2f} s")
+
+    for mode, key in SECTION_KEYS.items():
+        at = AppTest.from_file('app.py', default_timeout=600).run()
+        at.sidebar.selectbox[0].select(mode).run()
+        for section in at.radio(key=key).options:
+            # The first run of a section fills its caches; time the warm reruns after it
+            at.radio(key=key).set_value(section).run()
+            print(f"  {mode:<16} {section:<26} rerun {_median_rerun(at, args.repeat) * 1e3:>8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
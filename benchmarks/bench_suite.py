@@ -0,0 +1,220 @@
+"""Runs every dashboard analysis headlessly at scaled dataset sizes and checks for regressions.
+
+Usage:
+    python -m benchmarks.bench_suite [--scales 1 10 100 1000] [--repeat 3]
+                                     [--baseline benchmarks/baseline.json]
+                                     [--update-baseline] [--tolerance 1.0]
+
+Each scale runs in a fresh interpreter against a synthetic copy of
+final_cleaned.csv (benchmarks.synthetic: same columns, joint missingness
+pattern preserved). One AppTest session loads app.py and visits every
+section of the Explore Dataset dashboard, then every Key Insights section,
+unweighted and survey-weighted. Reported numbers, per analysis:
+  * cold s      - the first visit, with this dataset's figure files removed
+                  beforehand (the Parquet copy is built before timing starts)
+  * warm ms     - median rerun once the section's caches are filled
+  * peak MB     - peak RSS of the process during the cold visit; VmHWM is
+                  reset before each analysis where Linux allows it, otherwise
+                  this is the peak so far
+  * payload KB  - Plotly JSON of the charts the section sends
+'startup' is the first run: imports, dataset load and the landing page.
+
+Results are compared with the baseline file, keyed by backend and scale
+(REPROSIGHT_BACKEND selects the backend as in the app). A metric above
+baseline * (1 + relative) + absolute (TOLERANCES, both scaled by
+--tolerance) is a regression, and the exit status is 1 on any regression or
+failed scale. --update-baseline merges this run into the file instead.
+Timings and memory are machine-specific; the file records the machine it
+was taken on and a mismatch is printed.
+
+1000x is 5.8M rows (a 1.8 GB CSV). Building its Parquet copy parses the
+whole CSV with pandas, which alone needs more than 6 GB of RAM; the scale
+is reported as failed where the child process is killed.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+import psutil
+
+from benchmarks.bench_startup import SECTION_KEYS, _median_rerun
+from benchmarks.synthetic import write_synthetic
+from data_loader import DATA_PATH
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+METRICS = ['cold_s', 'warm_ms', 'peak_mb', 'payload_kb']
+# (relative, absolute) slack per metric before a change counts as a regression
+TOLERANCES = {'cold_s': (0.5, 0.25), 'warm_ms': (0.5, 25.0), 'peak_mb': (0.25, 50.0), 'payload_kb': (0.1, 5.0)}
+# (dashboard, survey-weighted) passes, in the order they are visited
+PASSES = [('Explore Dataset', False), ('Key Insights', False), ('Key Insights', True)]
+TIMEOUT = 3600
+
+
+# --- Measurements (child process) ---
+def _reset_peak():
+    """Resets this process's peak RSS (VmHWM) to its current RSS where Linux allows it."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+    except OSError:
+        pass
+
+
+def _peak_mb():
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 1024)
+
+
+def _measure(at, name, repeat):
+    """Runs the pending widget changes as the cold visit, then the warm reruns."""
+    _reset_peak()
+    start = time.perf_counter()
+    at.run()
+    cold = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f"{name}: {at.exception[0].message}")
+    result = {'cold_s': cold, 'peak_mb': _peak_mb(),
+              'payload_kb': sum(len(chart.proto.spec) for chart in at.get('plotly_chart')) / 1024}
+    result['warm_ms'] = _median_rerun(at, repeat) * 1e3
+    return {metric: round(value, 3) for metric, value in result.items()}
+
+
+def run_analyses(repeat):
+    """Visits every analysis in this process; returns {analysis: metrics}."""
+    from streamlit.testing.v1 import AppTest
+
+    from data_loader import data_path, ensure_parquet
+    from figure_cache import figure_dir
+
+    path = data_path()
+    ensure_parquet(path)
+    shutil.rmtree(figure_dir(path), ignore_errors=True)
+
+    at = AppTest.from_file('app.py', default_timeout=TIMEOUT)
+    results = {'startup': _measure(at, 'startup', repeat)}
+    for mode, weighted in PASSES:
+        key = SECTION_KEYS[mode]
+        at.sidebar.selectbox[0].select(mode)
+        at.sidebar.toggle(key='weighted').set_value(weighted)
+        label = f"{mode}{' (weighted)' if weighted else ''}"
+        try:
+            at.radio(key=key).set_value(at.radio(key=key).options[0])
+        except KeyError:
+            pass  # first visit of this dashboard: the mode switch shows its first section
+        first = _measure(at, label, repeat)
+        sections = at.radio(key=key).options
+        results[f"{label} / {sections[0]}"] = first
+        for section in sections[1:]:
+            at.radio(key=key).set_value(section)
+            results[f"{label} / {section}"] = _measure(at, f"{label} / {section}", repeat)
+    return results
+
+
+# --- Baseline comparison ---
+def machine():
+    return {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count(),
+            'memory_gb': round(psutil.virtual_memory().total / 2 ** 30, 1)}
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {'machine': None, 'results': {}}
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def compare(results, baseline, tolerance=1.0):
+    """Lists (run, analysis, metric, baseline, value) for every metric beyond its tolerance."""
+    regressions = []
+    for run, analyses in results.items():
+        for analysis, metrics in analyses.items():
+            expected = baseline['results'].get(run, {}).get(analysis, {})
+            for metric in METRICS:
+                if metric not in expected:
+                    continue
+                relative, absolute = TOLERANCES[metric]
+                if metrics[metric] > expected[metric] * (1 + relative * tolerance) + absolute * tolerance:
+                    regressions.append((run, analysis, metric, expected[metric], metrics[metric]))
+    return regressions
+
+
+def _run_scale(scale, repeat):
+    """Runs the analyses for one scale in a fresh interpreter; returns (results, error)."""
+    path = DATA_PATH if scale == 1 else write_synthetic(scale)
+    env = dict(os.environ, REPROSIGHT_DATA=path, REPROSIGHT_PREWARM='0')
+    proc = subprocess.run([sys.executable, '-m', 'benchmarks.bench_suite', '--child', '--repeat', str(repeat)],
+                          env=env, capture_output=True, text=True)
+    if proc.returncode < 0:
+        return None, f"killed by signal {-proc.returncode} (out of memory?)"
+    if proc.returncode:
+        return None, (proc.stderr.strip().splitlines() or [f"exit status {proc.returncode}"])[-1]
+    return json.loads(proc.stdout.strip().splitlines()[-1]), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=3, help="warm reruns per analysis")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help="record this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=1.0, help="multiplier on every tolerance")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    if args.child:
+        print(json.dumps(run_analyses(args.repeat)))
+        return 0
+
+    backend = os.environ.get('REPROSIGHT_BACKEND', 'pandas')
+    results, failed = {}, []
+    for scale in args.scales:
+        run = f"{backend}/{scale}x"
+        print(f"{run}:", flush=True)
+        analyses, error = _run_scale(scale, args.repeat)
+        if error:
+            failed.append(run)
+            print(f"  failed: {error}")
+            continue
+        results[run] = analyses
+        for analysis, m in analyses.items():
+            print(f"  {analysis:<52} cold {m['cold_s']:>7.2f} s  warm {m['warm_ms']:>8.1f} ms  "
+                  f"peak {m['peak_mb']:>7.0f} MB  payload {m['payload_kb']:>8.1f} KB", flush=True)
+
+    baseline = load_baseline(args.baseline)
+    if args.update_baseline:
+        baseline['machine'] = machine()
+        baseline['results'].update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as fh:
+            json.dump(baseline, fh, indent=1, sort_keys=True)
+            fh.write('\n')
+        print(f"baseline updated: {args.baseline}")
+        return 1 if failed else 0
+
+    if baseline['machine'] and baseline['machine'] != machine():
+        print(f"note: baseline was recorded on {baseline['machine']}")
+    missing = [run for run in results if run not in baseline['results']]
+    if missing:
+        print(f"no baseline for {', '.join(missing)}")
+    regressions = compare(results, baseline, args.tolerance)
+    for run, analysis, metric, expected, value in regressions:
+        print(f"REGRESSION {run} {analysis}: {metric} {expected:.1f} -> {value:.1f}")
+    print(f"{len(regressions)} regressions, {len(failed)} failed scales")
+    return 1 if regressions or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Synthetic datasets with the schema and missingness of final_cleaned.csv."""
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_loader import CODED_COLUMNS, DATA_PATH
+
+# Larger datasets are generated and written in chunks of this many rows
+CHUNK_ROWS = 500_000
+
+
+def _resample(base, rows, rng):
+    idx = rng.integers(0, len(base), size=rows)
+    out = base.iloc[idx].reset_index(drop=True)
+    continuous = [c for c in out.columns if c not in CODED_COLUMNS]
+    noise = rng.uniform(0.95, 1.05, size=(len(out), len(continuous)))
+    out[continuous] = out[continuous].to_numpy() * noise
+    return out
+
+
+def make_synthetic(scale, source=DATA_PATH, seed=0):
+    """Returns a frame `scale` times the size of the source dataset.
+
+    Whole rows are resampled with replacement, so the joint missingness
+    pattern (questionnaire blocks that are missing together) is preserved.
+    Continuous measurements get +/-5% multiplicative noise so the copies are
+    not exact duplicates; coded answers are left untouched.
+    """
+    base = pd.read_csv(source)
+    return _resample(base, int(len(base) * scale), np.random.default_rng(seed))
+
+
+def write_synthetic(scale, directory='bench_data', source=DATA_PATH, seed=0):
+    """Writes a synthetic CSV for `scale` (reusing an existing one) and returns its path.
+
+    Beyond CHUNK_ROWS rows the CSV is written chunk by chunk, each chunk
+    resampled with its own seed, so memory stays bounded at 1000x.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"synthetic_x{scale}.csv")
+    if os.path.exists(path):
+        return path
+    base = pd.read_csv(source)
+    rows = int(len(base) * scale)
+    # Written under a temporary name so an interrupted run is not reused
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if rows <= CHUNK_ROWS:
+        _resample(base, rows, np.random.default_rng(seed)).to_csv(tmp, index=False)
+    else:
+        for i, start in enumerate(range(0, rows, CHUNK_ROWS)):
+            chunk = _resample(base, min(CHUNK_ROWS, rows - start), np.random.default_rng([seed, i]))
+            chunk.to_csv(tmp, mode='a' if i else 'w', header=not i, index=False)
+    os.replace(tmp, path)
+    return path
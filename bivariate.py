@@ -0,0 +1,167 @@
+"""Grouped summaries behind the Bivariate Explorer's box plots and crosstabs.
+
+Coded questionnaire answers are stored as float codes so the query engines
+can filter and correlate them. The explorer declares the ones with at most
+univariate.MAX_CATEGORIES values categorical, like any non-numeric column
+(univariate.ColumnSummaries.is_categorical). A pair with a categorical column
+is summarized in one grouping pass: the categories are factorized once into
+integer codes and every statistic is vectorized over those codes.
+  * numeric x categorical: per category the count, mean, quartiles and
+    1.5 IQR whiskers of aggregates.box_summary, from bincounts and the
+    sorted pass of weighted.py, plus each category's capped outliers,
+  * categorical x categorical: the crosstab of counts from one np.bincount
+    over the combined codes, with Pearson's chi-square test of independence
+    and Cramer's V.
+With `weighted=True` the means, quartiles and crosstab cells are survey-
+weighted (weighted.py); the chi-square test always uses the unweighted
+counts, since the survey design is not modelled. Summaries are cached per
+dataset version, pair and weighting.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from aggregates import BOX_STATS, thin
+from backend import load_backend
+from data_loader import VALUE_LABELS, WEIGHT_COLUMN, data_path, dataset_version
+from profiling import span
+from shared_cache import shared_result
+from univariate import load_column_summaries
+from weighted import weighted_means, weighted_quantiles
+
+# Cells with an expected count below this make the chi-square approximation unreliable
+MIN_EXPECTED = 5
+
+
+def category_codes(values, column=None):
+    """(codes, labels) of a categorical Series; missing values get code -1.
+
+    Numeric codes are labelled with VALUE_LABELS[column] where known.
+    """
+    if values.dtype.kind in 'biuf':
+        array = values.to_numpy(dtype=float, na_value=np.nan)
+        present = ~np.isnan(array)
+        uniques, inverse = np.unique(array[present], return_inverse=True)
+        codes = np.full(len(array), -1, dtype=np.int64)
+        codes[present] = inverse
+        names = VALUE_LABELS.get(column, {})
+        return codes, [names.get(int(code), f"{code:g}") for code in uniques]
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes.astype(np.int64), [str(value) for value in uniques]
+
+
+def category_labels(values, column=None):
+    """A categorical Series of labels for `values` (e.g. for a colour legend)."""
+    codes, labels = category_codes(values, column)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=labels), index=values.index, name=values.name)
+
+
+def numeric_by_category(frame, numeric, category, weights=None):
+    """Box-plot statistics of `numeric` per category of `category`.
+
+    Returns {'box': a frame indexed by category label with BOX_STATS,
+    'details': {label: {'outliers': capped outliers}}}, the inputs of
+    charts.summary_box_figure. Categories without values are left out.
+    """
+    codes, labels = category_codes(frame[category], category)
+    values = frame[numeric].to_numpy(dtype=float, na_value=np.nan)
+    weight = (frame[weights].to_numpy(dtype=float, na_value=np.nan) if weights
+              else np.ones(len(values)))
+    keep = (codes >= 0) & ~np.isnan(values) & (weight > 0)
+    codes, values, weight = codes[keep], values[keep], weight[keep]
+    groups = len(labels)
+
+    order = np.lexsort((values, codes))
+    codes, values, weight = codes[order], values[order], weight[order]
+    stats = pd.DataFrame({'n': np.bincount(codes, minlength=groups),
+                          'mean': weighted_means(codes, values, weight, groups)})
+    # Equal weights give exactly the linear-interpolation quartiles of the unweighted case
+    stats[['q1', 'median', 'q3']] = weighted_quantiles(codes, values, weight, [0.25, 0.5, 0.75], groups,
+                                                       presorted=True)
+
+    starts = np.searchsorted(codes, np.arange(groups))
+    ends = np.searchsorted(codes, np.arange(groups), side='right')
+    iqr = (stats['q3'] - stats['q1']).to_numpy()
+    low, high = stats['q1'].to_numpy() - 1.5 * iqr, stats['q3'].to_numpy() + 1.5 * iqr
+    fences = np.full((groups, 2), np.nan)
+    details = {}
+    for g in np.flatnonzero(ends > starts):
+        # The most extreme values within 1.5 IQR of the box, as in box_summary
+        group = values[starts[g]:ends[g]]
+        first, stop = np.searchsorted(group, low[g], 'left'), np.searchsorted(group, high[g], 'right')
+        fences[g] = group[first], group[stop - 1]
+        details[labels[g]] = {'outliers': thin(np.r_[group[:first], group[stop:]])}
+    stats['lowerfence'], stats['upperfence'] = fences[:, 0], fences[:, 1]
+    stats.index = pd.Index(labels, name=category)
+    return {'box': stats.loc[stats['n'] > 0, BOX_STATS], 'details': details}
+
+
+def crosstab(frame, x, y, weights=None):
+    """Crosstab of two categorical columns with a chi-square test of independence.
+
+    Returns {'counts': rows x by columns y, 'table': the same cells
+    survey-weighted with `weights` (else the counts), 'n', 'chi2',
+    'p_value', 'dof', 'cramers_v', 'sparse_share': the share of cells with
+    an expected count below MIN_EXPECTED}. The test needs two non-empty rows
+    and columns; otherwise its entries are NaN.
+    """
+    x_codes, x_labels = category_codes(frame[x], x)
+    y_codes, y_labels = category_codes(frame[y], y)
+    keep = (x_codes >= 0) & (y_codes >= 0)
+    cells = x_codes * len(y_labels) + y_codes
+    shape = (len(x_labels), len(y_labels))
+    counts = np.bincount(cells[keep], minlength=shape[0] * shape[1]).reshape(shape)
+    table = counts
+    if weights:
+        weight = frame[weights].to_numpy(dtype=float, na_value=np.nan)
+        weighted = keep & (weight > 0)
+        table = np.bincount(cells[weighted], weights=weight[weighted],
+                            minlength=shape[0] * shape[1]).reshape(shape)
+
+    result = {
+        'counts': pd.DataFrame(counts, index=pd.Index(x_labels, name=x), columns=pd.Index(y_labels, name=y)),
+        'table': pd.DataFrame(table, index=pd.Index(x_labels, name=x), columns=pd.Index(y_labels, name=y)),
+        'n': int(counts.sum()), 'chi2': np.nan, 'p_value': np.nan, 'dof': 0, 'cramers_v': np.nan,
+        'sparse_share': np.nan,
+    }
+    observed = counts[counts.sum(axis=1) > 0][:, counts.sum(axis=0) > 0]
+    if min(observed.shape) > 1:
+        # scipy is only needed here, so it is not imported on startup
+        from scipy.stats import chi2_contingency
+        chi2, p_value, dof, expected = chi2_contingency(observed, correction=False)
+        result.update(chi2=chi2, p_value=p_value, dof=int(dof),
+                      cramers_v=np.sqrt(chi2 / (observed.sum() * (min(observed.shape) - 1))),
+                      sparse_share=float((expected < MIN_EXPECTED).mean()))
+    return result
+
+
+def build_pair_summary(backend, summaries, x, y, weighted=False):
+    """The summary load_pair_summary describes, from a query backend and the ColumnSummaries."""
+    weights = WEIGHT_COLUMN if weighted and WEIGHT_COLUMN in backend.columns() else None
+    frame = backend.fetch(list(dict.fromkeys([x, y] + ([weights] if weights else []))))
+    with span(f"compute:pair summary {x} x {y}", 'compute'):
+        if summaries.is_categorical(x) and summaries.is_categorical(y):
+            return {'kind': 'crosstab', **crosstab(frame, x, y, weights)}
+        if summaries.is_categorical(x):
+            return {'kind': 'box', 'horizontal': False, **numeric_by_category(frame, y, x, weights)}
+        if summaries.is_categorical(y):
+            return {'kind': 'box', 'horizontal': True, **numeric_by_category(frame, x, y, weights)}
+    raise ValueError(f"{x!r} and {y!r} are both numeric; draw them as a scatter plot")
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _load_pair_summary_cached(path, version, x, y, weighted):
+    return shared_result("pair summary", path, version,
+                         lambda: build_pair_summary(load_backend(path), load_column_summaries(path), x, y, weighted),
+                         (x, y, weighted))
+
+
+def load_pair_summary(x, y, path=None, weighted=False):
+    """The cached summary of a pair with at least one categorical column.
+
+    {'kind': 'crosstab', ...} (see crosstab) for two categorical columns,
+    else {'kind': 'box', 'horizontal': whether the categories run along the
+    y-axis, ...} (see numeric_by_category).
+    """
+    path = path or data_path()
+    return _load_pair_summary_cached(path, dataset_version(path), x, y, weighted)
@@ -0,0 +1,309 @@
+"""Bootstrap confidence intervals behind the Key Insights charts.
+
+Point estimates alone invite over-reading small differences, so the
+dashboard draws 95% percentile bootstrap intervals for
+  * the infertility rate of every age group (error bars),
+  * every metal x outcome trendline (slope interval and a band around the line),
+  * the median of every box / raincloud group (error bars on the median).
+
+Resampling is vectorized. A block of replicates is a (replicates, rows)
+matrix of Poisson(1) draw counts - the Poisson bootstrap, which approximates
+drawing n rows with replacement and needs no index gathering - and every
+statistic of the block comes out of a few matrix products and cumulative
+sums. Blocks are spread over a process pool, whose workers are started
+from a fork server rather than forked from the threaded server process
+(a fork can inherit a lock another thread holds). The survey-weighted variant
+multiplies the counts by the row weights.
+
+The replicate count is bounded (REPROSIGHT_BOOTSTRAP_REPLICATES, at most
+MAX_REPLICATES) and shrinks for large datasets so the total work stays
+within BOOTSTRAP_CELLS draws. Results are cached per dataset version and
+weighting; the figures drawn from them are cached too (figure_cache.py), so
+a warm cache serves the charts exactly as fast as before.
+"""
+import math
+import multiprocessing
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from aggregates import AGGREGATE_SECTIONS, DERIVED_SOURCE_COLUMNS, LazyStore
+from backend import load_backend
+from data_loader import (AGE_LABELS, HORMONE_COLUMNS, METAL_COLUMNS, WEIGHT_COLUMN, build_derived_view, data_path,
+                         dataset_version)
+from profiling import span
+from shared_cache import shared_result
+from trendlines import pair_x_ranges
+from weighted import weighted_quantile_rows
+
+MAX_REPLICATES = 5000
+BOOTSTRAP_REPLICATES = min(int(os.environ.get('REPROSIGHT_BOOTSTRAP_REPLICATES', 1000)), MAX_REPLICATES)
+MIN_REPLICATES = 200
+# Bounds replicates x rows; large datasets get fewer (but at least MIN_REPLICATES) replicates
+BOOTSTRAP_CELLS = 2 * 10 ** 8
+# Work bound of a cohort's intervals, which are computed while the user waits;
+# larger cohorts (over COHORT_BOOTSTRAP_ROWS rows) are drawn without intervals
+COHORT_BOOTSTRAP_CELLS = 10 ** 7
+COHORT_BOOTSTRAP_ROWS = COHORT_BOOTSTRAP_CELLS // MIN_REPLICATES
+# Bounds one block's (replicates, rows) count matrix to 32 MB of float64
+BLOCK_CELLS = 1 << 22
+BOOTSTRAP_WORKERS = int(os.environ.get('REPROSIGHT_BOOTSTRAP_WORKERS', min(4, os.cpu_count() or 1)))
+# How the pool's workers start; fork server where the platform has one
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+BOOTSTRAP_SEED = 2024
+POISSON_MAX = 8
+POISSON_CDF = np.cumsum([np.exp(-1.0) / math.factorial(k) for k in range(POISSON_MAX)]).astype(np.float32)
+CI_LEVEL = 0.95
+BAND_POINTS = 50
+# Box charts and the column that splits their groups (see aggregates.build_insight_aggregates)
+BOX_GROUPS = {'fertility_box': 'infertility_status', 'menstrual_box': 'regular_periods',
+              'menarche_box': 'first_period_age'}
+
+
+def replicate_count(rows, replicates=BOOTSTRAP_REPLICATES, cells=BOOTSTRAP_CELLS):
+    """Number of replicates for a dataset of `rows` rows, within the work bound of `cells` draws."""
+    return int(min(replicates, max(MIN_REPLICATES, cells // max(rows, 1))))
+
+
+# --- Resampling kernels ---
+def _block_rates(counts, codes, flag, groups):
+    """Flagged share of each group code for every replicate, as (replicates, groups)."""
+    inside = codes >= 0
+    onehot = np.zeros((int(inside.sum()), groups))
+    onehot[np.arange(len(onehot)), codes[inside]] = 1.0
+    part = counts[:, inside]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (part @ (onehot * flag[inside, None])) / (part @ onehot)
+
+
+def _block_fits(counts, X, Y):
+    """Least-squares slope and intercept of every (x, y) pair per replicate, as two (replicates, p, q) arrays."""
+    mx = ~np.isnan(X)
+    X0 = np.where(mx, X, 0.0)
+    slopes = np.empty((len(counts), X.shape[1], Y.shape[1]))
+    intercepts = np.empty_like(slopes)
+    for k in range(Y.shape[1]):
+        my = ~np.isnan(Y[:, k])
+        valid = (mx & my[:, None]).astype(float)
+        y0 = np.where(my, Y[:, k], 0.0)[:, None]
+        xk = X0 * valid
+        sw, sx, sy = counts @ valid, counts @ xk, counts @ (valid * y0)
+        sxx, sxy = counts @ (xk * X0), counts @ (xk * y0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (sxy - sx * sy / sw) / (sxx - sx ** 2 / sw)
+            slopes[:, :, k] = slope
+            intercepts[:, :, k] = (sy - slope * sx) / sw
+    return slopes, intercepts
+
+
+def _block_medians(counts, rows, values, weighted=False):
+    """Median of `values` (sorted, at `rows`) for every replicate.
+
+    Unweighted replicates take the median of their redrawn rows, with the
+    draw counts as frequencies. Weighted ones interpolate like the plotted
+    weighted medians (weighted_quantiles in aggregates.box_summary), with
+    the survey weight times the draw count as each row's weight.
+    """
+    return weighted_quantile_rows(values, counts[:, rows], 0.5, frequencies=not weighted)
+
+
+def poisson_counts(rng, shape):
+    """Poisson(1) draw counts, by comparing float32 uniforms with the Poisson CDF.
+
+    About four times faster than rng.poisson; counts stop at POISSON_MAX,
+    which a Poisson(1) exceeds with probability 1e-6.
+    """
+    uniforms = rng.random(shape, dtype=np.float32)
+    counts = np.zeros(shape, dtype=np.uint8)
+    for threshold in POISSON_CDF:
+        counts += uniforms > threshold
+    return counts
+
+
+def replicate_block(data, seed, size):
+    """Rates, fits and medians of `size` Poisson-bootstrap replicates of the prepared `data`."""
+    rng = np.random.default_rng(seed)
+    counts = poisson_counts(rng, (size, len(data['weights']))) * data['weights']
+    block = {'median': [_block_medians(counts, rows, values, data['weighted'])
+                        for *_, rows, values in data['medians']]}
+    if data['rate'] is not None:
+        block['rate'] = _block_rates(counts, *data['rate'], len(AGE_LABELS))
+    if data['fit'] is not None:
+        block['slope'], block['intercept'] = _block_fits(counts, *data['fit'])
+    return block
+
+
+_DATA = None
+
+
+def _init_worker(data):
+    global _DATA
+    _DATA = data
+
+
+def _pool_block(seed, size):
+    return replicate_block(_DATA, seed, size)
+
+
+# --- Intervals ---
+def _prepare(backend, weighted, sections):
+    """The arrays every replicate of the `sections` needs, fetched once from the backend.
+
+    Every replicate reweights single rows, so this materializes the metal,
+    outcome and grouping columns of every row even with the DuckDB backend.
+    """
+    columns = backend.columns()
+    metals = [col for col in METAL_COLUMNS if col in columns]
+    hormones = [col for col in HORMONE_COLUMNS if col in columns]
+    frame = backend.fetch(list(dict.fromkeys(metals + hormones + DERIVED_SOURCE_COLUMNS + ['regular_periods']
+                                             + ([WEIGHT_COLUMN] if weighted else []))))
+    derived = build_derived_view(frame)
+    if weighted:
+        weights = frame[WEIGHT_COLUMN].to_numpy(dtype=float, na_value=0.0)
+        weights = np.where(weights > 0, weights, 0.0)
+    else:
+        weights = np.ones(len(frame))
+
+    X = frame[metals].to_numpy(dtype=float, na_value=np.nan)
+    outcomes = frame[hormones + ['last_period_age']].to_numpy(dtype=float, na_value=np.nan)
+    outcomes[:, -1] = np.where(outcomes[:, -1] < 100, outcomes[:, -1], np.nan)  # valid menopause ages only
+
+    # Medians: each (chart, group, metal) keeps its rows sorted by value, so a replicate only needs a cumsum
+    medians = []
+    for chart, column in BOX_GROUPS.items():
+        if chart not in sections:
+            continue
+        groups = derived[column] if column in derived else frame[column]
+        codes, labels = pd.factorize(groups, sort=True)
+        for g, label in enumerate(labels):
+            for j, metal in enumerate(metals):
+                rows = np.flatnonzero((codes == g) & ~np.isnan(X[:, j]) & (weights > 0))
+                if len(rows):
+                    rows = rows[np.argsort(X[rows, j], kind='stable')]
+                    medians.append((chart, label, metal, rows, X[rows, j]))
+
+    rate = (derived['age_group'].cat.codes.to_numpy(), derived['is_infertile'].to_numpy(dtype=float))
+    return {
+        'metals': metals, 'outcomes': hormones + ['last_period_age'], 'weights': weights, 'weighted': weighted,
+        'rate': rate if 'infertility_rate' in sections else None,
+        'fit': (X, outcomes) if 'trendline' in sections else None,
+        'medians': medians,
+    }
+
+
+def _replicates(data, replicates, workers):
+    """All replicate statistics, computed in blocks (in a process pool when `workers` > 1)."""
+    size = max(1, min(replicates, BLOCK_CELLS // max(len(data['weights']), 1)))
+    sizes = [min(size, replicates - start) for start in range(0, replicates, size)]
+    seeds = np.random.SeedSequence(BOOTSTRAP_SEED).spawn(len(sizes))
+    if workers > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(min(workers, len(sizes)), mp_context=multiprocessing.get_context(POOL_START_METHOD),
+                                 initializer=_init_worker, initargs=(data,)) as pool:
+            blocks = list(pool.map(_pool_block, seeds, sizes))
+    else:
+        blocks = [replicate_block(data, seed, block) for seed, block in zip(seeds, sizes)]
+    samples = {part: np.concatenate([block[part] for block in blocks])
+               for part in ('rate', 'slope', 'intercept') if part in blocks[0]}
+    if data['medians']:
+        samples['median'] = np.concatenate([np.stack(block['median'], axis=1) for block in blocks])
+    return samples
+
+
+def _interval(samples, axis=0):
+    """Percentile interval (low, high) at CI_LEVEL over the replicates, ignoring NaNs."""
+    tail = (1 - CI_LEVEL) / 2 * 100
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN slices stay NaN
+        return np.nanpercentile(samples, [tail, 100 - tail], axis=axis)
+
+
+def build_bootstrap(backend, weighted=False, replicates=None, workers=BOOTSTRAP_WORKERS, sections=None):
+    """Bootstrap intervals of the insight statistics, keyed like the insight aggregates.
+
+      * ('replicates', None, None)       - number of replicates drawn
+      * ('infertility_rate', None, None) - ci_low / ci_high of the rate (%) per age_group
+      * ('<box chart>', metal, None)     - median_low / median_high per group
+      * ('trendline', metal, outcome)    - slope_low / slope_high and the band
+                                           (x, low, high) around the fitted line
+
+    Medians are those of each replicate's redrawn rows. With
+    `weighted=True` every replicate is survey-weighted, and its medians
+    interpolate like weighted.weighted_quantiles. `sections` limits
+    the store to some of the aggregates.AGGREGATE_SECTIONS.
+    """
+    data = _prepare(backend, weighted, set(sections or AGGREGATE_SECTIONS))
+    replicates = replicates or replicate_count(len(data['weights']))
+    resampled = data['rate'] is not None or data['fit'] is not None or data['medians']
+    samples = _replicates(data, replicates, workers) if resampled else {}
+    store = {('replicates', None, None): replicates}
+
+    if 'rate' in samples:
+        low, high = _interval(samples['rate']) * 100
+        store['infertility_rate', None, None] = pd.DataFrame({'ci_low': low, 'ci_high': high},
+                                                             index=pd.Index(AGE_LABELS, name='age_group'))
+
+    if 'median' in samples:
+        medians = pd.DataFrame([(chart, label, metal) for chart, label, metal, *_ in data['medians']],
+                               columns=['chart', 'group', 'metal'])
+        medians['median_low'], medians['median_high'] = _interval(samples['median'])
+        for (chart, metal), part in medians.groupby(['chart', 'metal'], sort=False):
+            store[chart, metal, None] = part.set_index('group')[['median_low', 'median_high']]
+
+    if 'slope' not in samples:
+        return store
+    slope_low, slope_high = _interval(samples['slope'])
+    ranges = pair_x_ranges(*data['fit'])
+    for i, metal in enumerate(data['metals']):
+        for k, outcome in enumerate(data['outcomes']):
+            x_min, x_max = ranges['x_min'][i, k], ranges['x_max'][i, k]
+            if not np.isfinite([x_min, x_max]).all():
+                continue  # no rows to fit
+            x = np.linspace(x_min, x_max, BAND_POINTS)
+            with np.errstate(invalid='ignore'):
+                lines = samples['intercept'][:, i, k, None] + samples['slope'][:, i, k, None] * x
+            low, high = _interval(lines)
+            store['trendline', metal, outcome] = {'slope_low': slope_low[i, k], 'slope_high': slope_high[i, k],
+                                                  'x': x, 'low': low, 'high': high}
+    return store
+
+
+@st.cache_resource(show_spinner="Bootstrapping confidence intervals ...", max_entries=2)
+def _load_bootstrap_cached(path, version, weighted):
+    def build():
+        with span("compute:bootstrap", 'compute'):
+            return build_bootstrap(load_backend(path), weighted)
+    return shared_result("bootstrap", path, version, build, (weighted,))
+
+
+def _cohort_bootstrap(cohort, path, weighted, section):
+    from cohort import cohort_backend
+
+    backend = cohort_backend(cohort, path)
+    rows = backend.count()
+    if rows > COHORT_BOOTSTRAP_ROWS:
+        return {('replicates', None, None): 0}
+    replicates = replicate_count(rows, cells=COHORT_BOOTSTRAP_CELLS)
+    return build_bootstrap(backend, weighted, replicates, sections=[section])
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _load_cohort_bootstrap_cached(path, version, weighted, cohort):
+    return LazyStore(lambda section: _cohort_bootstrap(cohort, path, weighted, section), 'cohort bootstrap')
+
+
+def load_bootstrap(path=None, weighted=False, cohort=()):
+    """Returns the bootstrap intervals for the current dataset version, optionally survey-weighted.
+
+    With a `cohort` the intervals are resampled from the cohort's rows, one
+    section at a time as the charts ask for them (see aggregates.LazyStore),
+    within the smaller COHORT_BOOTSTRAP_CELLS budget; cohorts over
+    COHORT_BOOTSTRAP_ROWS rows get no intervals.
+    """
+    path = path or data_path()
+    if cohort:
+        return _load_cohort_bootstrap_cached(path, dataset_version(path), weighted, cohort)
+    return _load_bootstrap_cached(path, dataset_version(path), weighted)
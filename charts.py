@@ -0,0 +1,330 @@
+"""Figure builders that render from precomputed summaries instead of raw rows."""
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.colors import qualitative
+
+
+CI_LABEL = '95% bootstrap CI'
+
+
+def _group_color(i):
+    """The i-th colour of Plotly's default sequence, as px assigns them."""
+    return qualitative.Plotly[i % len(qualitative.Plotly)]
+
+
+def median_ci_trace(median, ci, category, horizontal=False):
+    """Black marker on a group's median with its bootstrap interval as an error bar."""
+    error = {'type': 'data', 'symmetric': False, 'color': 'black', 'thickness': 1.5, 'width': 6,
+             'array': [ci['median_high'] - median], 'arrayminus': [median - ci['median_low']]}
+    value, position = [median], [category]
+    return go.Scatter(
+        x=value if horizontal else position, y=position if horizontal else value, mode='markers',
+        marker={'color': 'black', 'size': 5, 'symbol': 'line-ns-open' if horizontal else 'line-ew-open'},
+        **{'error_x' if horizontal else 'error_y': error},
+        name='median CI', showlegend=False,
+        hovertemplate=(f"median {median:.3g}<br>{CI_LABEL}: [{ci['median_low']:.3g}, {ci['median_high']:.3g}]"
+                       "<extra></extra>"),
+    )
+
+
+def summary_box_figure(summary, order=None, horizontal=False, title=None,
+                       category_label=None, value_label=None, details=None, median_ci=None):
+    """Draws one box per group from a box_summary frame (see aggregates.py).
+
+    Only the precomputed quartiles, whiskers and means are sent to the
+    browser, so the payload size does not depend on the number of rows.
+    `order` fixes the group order; by default the summary's index order is
+    used. With `horizontal=True` groups run along the y-axis. `details`
+    (the matching '<chart>_detail' entry) adds each group's capped outliers
+    and `median_ci` (see bootstrap.py) an error bar on each median.
+    """
+    order = [group for group in (order or summary.index) if group in summary.index]
+    fig = go.Figure()
+    for i, group in enumerate(order):
+        stats = summary.loc[group]
+        position = {'y' if horizontal else 'x': [str(group)]}
+        fig.add_trace(go.Box(
+            name=str(group),
+            q1=[stats['q1']], median=[stats['median']], q3=[stats['q3']],
+            lowerfence=[stats['lowerfence']], upperfence=[stats['upperfence']],
+            mean=[stats['mean']],
+            orientation='h' if horizontal else 'v',
+            legendgroup=str(group), marker_color=_group_color(i),
+            **position,
+        ))
+        if details:
+            outliers = details[group]['outliers']
+            category = [str(group)] * len(outliers)
+            fig.add_trace(go.Scatter(
+                x=outliers if horizontal else category, y=category if horizontal else outliers,
+                mode='markers', name=str(group), legendgroup=str(group), showlegend=False,
+                marker={'color': _group_color(i), 'size': 4},
+                hovertemplate=f"{group}: %{{{'x' if horizontal else 'y'}}}<extra>outlier</extra>",
+            ))
+        if median_ci is not None and group in median_ci.index:
+            fig.add_trace(median_ci_trace(stats['median'], median_ci.loc[group], str(group), horizontal))
+    category_axis, value_axis = ('yaxis', 'xaxis') if horizontal else ('xaxis', 'yaxis')
+    fig.update_layout(
+        title_text=title,
+        boxmode='overlay',
+        legend_title_text=category_label,
+        **{
+            category_axis: {'title': category_label, 'categoryorder': 'array',
+                            'categoryarray': [str(group) for group in order]},
+            value_axis: {'title': value_label},
+        },
+    )
+    return fig
+
+
+def summary_violin_figure(summary, details, order=None, show_points=True, title=None,
+                          category_label=None, value_label=None, median_ci=None):
+    """Raincloud plot (violin + box + points) from precomputed group summaries.
+
+    go.Violin needs every raw value to estimate its KDE in the browser; here
+    the violin outline is the precomputed curve drawn as a filled polygon,
+    the box comes from the box_summary stats and the "rain" is the capped
+    point sample, so the payload has a fixed size per group. `median_ci`
+    adds an error bar on each median.
+    """
+    order = [group for group in (order or summary.index) if group in summary.index]
+    fig = go.Figure()
+    for i, group in enumerate(order):
+        color = _group_color(i)
+        grid, density = details[group]['kde']
+        stats = summary.loc[group]
+        if len(density) and density.max() > 0:
+            half_width = 0.4 * density / density.max()
+            fig.add_trace(go.Scatter(
+                x=np.r_[i - half_width, (i + half_width)[::-1]], y=np.r_[grid, grid[::-1]],
+                fill='toself', mode='lines', line={'color': color, 'width': 1}, name=str(group),
+                legendgroup=str(group), hoverinfo='skip',
+            ))
+        fig.add_trace(go.Box(
+            x=[i], q1=[stats['q1']], median=[stats['median']], q3=[stats['q3']],
+            lowerfence=[stats['lowerfence']], upperfence=[stats['upperfence']], mean=[stats['mean']],
+            width=0.08, marker_color=color, line={'color': 'black', 'width': 1}, fillcolor='white',
+            name=str(group), legendgroup=str(group), showlegend=False,
+        ))
+        fig.add_trace(go.Scatter(
+            x=[i - 0.4, i + 0.4], y=[stats['mean']] * 2, mode='lines',
+            line={'color': color, 'dash': 'dot'}, name=f"{group} mean", legendgroup=str(group),
+            showlegend=False, hovertemplate=f"mean: {stats['mean']:.3g}<extra>{group}</extra>",
+        ))
+        if median_ci is not None and group in median_ci.index:
+            fig.add_trace(median_ci_trace(stats['median'], median_ci.loc[group], i))
+        if show_points:
+            points = details[group]['points']
+            jitter = np.random.default_rng(i).uniform(-0.06, 0.06, size=len(points))
+            fig.add_trace(go.Scatter(
+                x=i - 0.55 + jitter, y=points, mode='markers', marker={'color': color, 'size': 3},
+                name=str(group), legendgroup=str(group), showlegend=False,
+                hovertemplate='%{y}<extra>' + str(group) + '</extra>',
+            ))
+    fig.update_layout(
+        title_text=title,
+        xaxis={'title': category_label, 'tickvals': list(range(len(order))),
+               'ticktext': [str(group) for group in order], 'zeroline': False},
+        yaxis_title=value_label,
+    )
+    return fig
+
+
+def histogram_figure(counts, edges, title=None, label=None):
+    """Bar chart of precomputed histogram counts, drawn like px.histogram."""
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges),
+        customdata=np.stack([edges[:-1], edges[1:]], axis=-1) if len(edges) else None,
+        hovertemplate='%{customdata[0]:.4g} - %{customdata[1]:.4g}<br>count = %{y:,}<extra></extra>',
+    ))
+    fig.update_layout(title_text=title, xaxis_title=label, yaxis_title='count', bargap=0)
+    return fig
+
+
+def category_figure(counts, title=None, label=None):
+    """Bar chart of precomputed value counts (a Series indexed by category)."""
+    fig = go.Figure(go.Bar(
+        x=[str(value) for value in counts.index], y=counts.to_numpy(),
+        hovertemplate='%{x}<br>count = %{y:,}<extra></extra>',
+    ))
+    fig.update_layout(title_text=title, xaxis_title=label, yaxis_title='count', xaxis_type='category')
+    return fig
+
+
+def crosstab_figure(table, title=None, x_label=None, y_label=None, value_label='count'):
+    """Heatmap of a precomputed crosstab (rows along the x-axis, columns along the y-axis).
+
+    Each cell is annotated with its value and hovers with its share of the
+    x category.
+    """
+    values = table.to_numpy(dtype=float).T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = values / values.sum(axis=0, keepdims=True)
+    fig = go.Figure(go.Heatmap(
+        z=values, x=[str(value) for value in table.index], y=[str(value) for value in table.columns],
+        customdata=shares, colorscale='Blues', colorbar={'title': value_label},
+        text=values, texttemplate='%{text:,.0f}',
+        hovertemplate=(f"{x_label or 'x'} = %{{x}}<br>{y_label or 'y'} = %{{y}}<br>{value_label} = %{{z:,.0f}}"
+                       f"<br>share of %{{x}} = %{{customdata:.1%}}<extra></extra>"),
+    ))
+    fig.update_layout(title_text=title, xaxis_title=x_label, yaxis_title=y_label,
+                      xaxis_type='category', yaxis_type='category')
+    return fig
+
+
+# --- Scatter plots with a server-side density mode ---
+# Above this many points a scatter is drawn as a 2D histogram computed here
+# instead of shipping every row to the browser.
+DENSITY_THRESHOLD = int(os.environ.get('REPROSIGHT_DENSITY_THRESHOLD', 20000))
+DENSITY_BINS = 60
+DENSITY_SAMPLE = 2000
+
+
+def stratified_sample(bin_ids, size, seed=0):
+    """Indices of about `size` points, allocated across bins by their share.
+
+    Every non-empty bin keeps at least one point, so sparse regions (and
+    outliers) stay visible next to the dense core.
+    """
+    n = len(bin_ids)
+    if n <= size:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(n)
+    order = order[np.argsort(bin_ids[order], kind='stable')]
+    sorted_bins = bin_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_bins[1:] != sorted_bins[:-1]])
+    counts = np.diff(np.r_[starts, n])
+    quota = np.maximum(1, np.round(counts * size / n)).astype(int)
+    rank = np.arange(n) - np.repeat(starts, counts)
+    return np.sort(order[rank < np.repeat(quota, counts)])
+
+
+def trendline_trace(fit, ci=None):
+    """Red OLS line segment from a precomputed fit (a row of fit_trendlines).
+
+    `ci` (a bootstrap.py trendline entry) adds the slope interval to the hover.
+    """
+    line_x = np.array([fit['x_min'], fit['x_max']])
+    slope_ci = f"<br>slope {CI_LABEL}: [{ci['slope_low']:.4g}, {ci['slope_high']:.4g}]" if ci else ''
+    return go.Scatter(
+        x=line_x, y=fit['intercept'] + fit['slope'] * line_x, mode='lines',
+        line={'color': 'red'}, name='OLS trendline', showlegend=False,
+        hovertemplate=(f"<b>OLS trendline</b><br>y = {fit['slope']:.6g} * x + {fit['intercept']:.6g}"
+                       f"<br>R<sup>2</sup>={fit['r2']:.6f}<br>p = {fit['p_value']:.3g}, n = {int(fit['n']):,}"
+                       f"{slope_ci}<extra></extra>"),
+    )
+
+
+def trendline_band_trace(ci):
+    """Shaded bootstrap band around a trendline, from a bootstrap.py trendline entry."""
+    return go.Scatter(
+        x=np.r_[ci['x'], ci['x'][::-1]], y=np.r_[ci['high'], ci['low'][::-1]],
+        fill='toself', mode='lines', line={'width': 0}, fillcolor='rgba(255, 0, 0, 0.15)',
+        name=CI_LABEL, showlegend=False, hoverinfo='skip',
+    )
+
+
+def _add_trendline(fig, trendline, trendline_ci):
+    if trendline_ci:
+        fig.add_trace(trendline_band_trace(trendline_ci))
+    fig.add_trace(trendline_trace(trendline, trendline_ci))
+
+
+def binned_scatter_figure(frame, x, y, color=None, bins=DENSITY_BINS, sample_size=DENSITY_SAMPLE,
+                          trendline=None, title=None, labels=None, trendline_ci=None):
+    """Density version of px.scatter: a log-scaled 2D histogram of x vs. y.
+
+    Optionally overlays a stratified sample of raw points (coloured by
+    `color`) and a precomputed OLS fit passed as `trendline`, with its
+    bootstrap band `trendline_ci`.
+    """
+    columns = list(dict.fromkeys([x, y] + ([color] if color else [])))
+    data = frame[columns].dropna(subset=[x, y])
+    xv, yv = data[x].to_numpy(dtype=float), data[y].to_numpy(dtype=float)
+    counts, xedges, yedges = np.histogram2d(xv, yv, bins=bins)
+    sample = data.iloc[:0]
+    if sample_size and len(data):
+        xbin = np.clip(np.searchsorted(xedges, xv, side='right') - 1, 0, bins - 1)
+        ybin = np.clip(np.searchsorted(yedges, yv, side='right') - 1, 0, bins - 1)
+        sample = data.iloc[stratified_sample(xbin * bins + ybin, sample_size)]
+    return density_scatter_figure(counts, xedges, yedges, sample, x, y, color=color, trendline=trendline,
+                                  title=title, labels=labels, trendline_ci=trendline_ci)
+
+
+def density_scatter_figure(counts, xedges, yedges, sample, x, y, color=None, trendline=None, title=None,
+                           labels=None, trendline_ci=None):
+    """binned_scatter_figure from precomputed 2D bin counts and point sample.
+
+    `counts` has x along its first axis, like np.histogram2d (see
+    backend.histogram2d and backend.stratified_sample).
+    """
+    labels = labels or {}
+    counts = np.asarray(counts).T  # histogram2d puts x on the first axis, Heatmap wants rows = y
+
+    with np.errstate(divide='ignore'):
+        z = np.where(counts > 0, np.log10(counts), np.nan)
+    fig = go.Figure(go.Heatmap(
+        x=(xedges[:-1] + xedges[1:]) / 2, y=(yedges[:-1] + yedges[1:]) / 2,
+        z=z, customdata=counts, colorscale='Blues', showscale=True,
+        colorbar={'title': 'Points', 'tickvals': list(range(int(np.nanmax(z, initial=0)) + 1)),
+                  'ticktext': [f"{10 ** k:,}" for k in range(int(np.nanmax(z, initial=0)) + 1)]},
+        hovertemplate='%{x:.3g}, %{y:.3g}<br>%{customdata:,} points<extra></extra>',
+        name='density',
+    ))
+
+    groups = sample.groupby(color, observed=True) if color else [(None, sample)]
+    for name, part in groups:
+        if not len(part):
+            continue
+        fig.add_trace(go.Scattergl(
+            x=part[x], y=part[y], mode='markers',
+            marker={'size': 3, 'opacity': 0.5, 'color': None if color else 'rgba(30, 30, 30, 0.6)'},
+            name=str(name) if color else 'sampled points', showlegend=bool(color),
+        ))
+
+    if trendline is not None:
+        _add_trendline(fig, trendline, trendline_ci)
+
+    fig.update_layout(
+        title_text=title,
+        xaxis_title=labels.get(x, x), yaxis_title=labels.get(y, y),
+        meta={'mode': 'density', 'points': int(counts.sum()), 'bins': len(xedges) - 1, 'sampled': len(sample)},
+    )
+    return fig
+
+
+def scatter_figure(frame, x, y, color=None, trendline=None, title=None, labels=None,
+                   threshold=DENSITY_THRESHOLD, trendline_ci=None, **density_kwargs):
+    """px.scatter for small frames, binned_scatter_figure above `threshold` points.
+
+    `trendline` is a precomputed fit (see trendlines.py) drawn as a line
+    trace, so no regression is refitted while building the figure;
+    `trendline_ci` (see bootstrap.py) shades its confidence band.
+    """
+    points = int(frame[[x, y]].notna().all(axis=1).sum())
+    if points <= threshold:
+        # plotly.express is imported on first use rather than on startup
+        import plotly.express as px
+        fig = px.scatter(frame, x=x, y=y, color=color, title=title, labels=labels)
+        if trendline is not None:
+            _add_trendline(fig, trendline, trendline_ci)
+        fig.update_layout(meta={'mode': 'points', 'points': points})
+        return fig
+    return binned_scatter_figure(frame, x, y, color=color, trendline=trendline, title=title,
+                                 labels=labels, trendline_ci=trendline_ci, **density_kwargs)
+
+
+def figure_stats(fig, build_seconds, payload=None):
+    """One-line report of how a figure was drawn, its build time and its JSON payload size if known."""
+    meta = fig.layout.meta or {}
+    if meta.get('mode') == 'density':
+        how = (f"Density mode: {meta['points']:,} points in {meta['bins']}×{meta['bins']} bins"
+               f" + {meta['sampled']:,} sampled points")
+    else:
+        how = f"{meta.get('points', 0):,} points"
+    if payload is not None:
+        how += f" · payload {payload / 1024:,.1f} kB"
+    return f"{how} · built in {build_seconds * 1e3:,.0f} ms"
@@ -0,0 +1,197 @@
+"""Cohort cross-filter for the Key Insights dashboard.
+
+A cohort restricts every stakeholder chart to a subgroup: an age range,
+races, marital statuses, an income-to-poverty band and pregnancy statuses.
+It is a tuple of backend filter triples (see backend.py), so it can key the
+caches directly; the empty tuple is the whole dataset.
+
+Instead of re-filtering the full frame for every chart, a CohortIndex built
+once per dataset version answers a cohort with a row mask:
+  * every value of a categorical column has a bitmap (np.packbits of its
+    rows); 'in' ORs the bitmaps of the selected values,
+  * every numeric column keeps its row order sorted by value; 'between' is
+    two binary searches and one scatter of the rows in range.
+Each filter's bitmap is memoized, so changing one widget recomputes one
+bitmap and ANDs it with the others. The charts then recompute their
+aggregates over the masked rows only, one section at a time as they are
+displayed (aggregates.LazyStore).
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import streamlit as st
+
+from aggregates import DERIVED_SOURCE_COLUMNS
+from backend import PandasBackend, load_backend
+from data_loader import HORMONE_COLUMNS, METAL_COLUMNS, VALUE_LABELS, WEIGHT_COLUMN, data_path, dataset_version
+from profiling import span
+
+CATEGORICAL_FILTERS = ['race', 'marital_status', 'pregnancy_status']
+RANGE_FILTERS = ['age_years', 'income_poverty_ratio']
+INCOME_BANDS = [0, 1, 2, 3, 4, 5]  # income_poverty_ratio is capped at 5
+# Memoized filter bitmaps per index
+BITMAP_CACHE = 256
+
+
+class CohortIndex:
+    """Bitmap and sorted indexes over the cohort columns of one dataset version.
+
+    `frame` holds the cohort columns and every column the insight charts
+    read, so a cohort's rows can be cut from it without another scan.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.rows = len(frame)
+        self.bitmaps = {}
+        for column in CATEGORICAL_FILTERS:
+            if column in frame:
+                values = frame[column].to_numpy(dtype=float, na_value=np.nan)
+                self.bitmaps[column] = {value: np.packbits(values == value)
+                                        for value in np.unique(values[~np.isnan(values)]).tolist()}
+        self.sorted = {}
+        for column in RANGE_FILTERS:
+            if column in frame:
+                values = frame[column].to_numpy(dtype=float, na_value=np.nan)
+                order = np.flatnonzero(~np.isnan(values))
+                order = order[np.argsort(values[order], kind='stable')]
+                self.sorted[column] = (order, values[order])
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def values(self, column):
+        """The codes present in a categorical column, in order."""
+        return list(self.bitmaps.get(column, ()))
+
+    def value_range(self, column):
+        """(min, max) of a numeric column, or None when it has no values."""
+        order, values = self.sorted.get(column, ((), ()))
+        return (values[0], values[-1]) if len(values) else None
+
+    def _compute(self, column, op, value):
+        if op == 'in':
+            bits = np.zeros((self.rows + 7) // 8, dtype=np.uint8)
+            for code in value:
+                if code in self.bitmaps[column]:
+                    bits |= self.bitmaps[column][code]
+            return bits
+        if op == 'between':
+            order, values = self.sorted[column]
+            start, stop = np.searchsorted(values, value[0], 'left'), np.searchsorted(values, value[1], 'right')
+            mask = np.zeros(self.rows, dtype=bool)
+            mask[order[start:stop]] = True
+            return np.packbits(mask)
+        raise ValueError(f"cohort filters support 'in' and 'between', not {op!r}")
+
+    def bitmap(self, column, op, value):
+        """Packed row bitmap of one filter triple, memoized."""
+        key = (column, op, value)
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        bits = self._compute(column, op, value)
+        with self._lock:
+            self._memo[key] = bits
+            while len(self._memo) > BITMAP_CACHE:
+                self._memo.popitem(last=False)
+        return bits
+
+    def mask(self, cohort):
+        """Boolean row mask of a cohort (all rows for the empty cohort)."""
+        if not cohort:
+            return np.ones(self.rows, dtype=bool)
+        bits = self.bitmap(*cohort[0])
+        for triple in cohort[1:]:
+            bits = bits & self.bitmap(*triple)
+        return np.unpackbits(bits, count=self.rows).view(bool)
+
+    def count(self, cohort):
+        """Number of rows in a cohort."""
+        return int(np.count_nonzero(self.mask(cohort)))
+
+
+def index_columns(columns):
+    """The cohort columns plus every column the insight charts read, as present in `columns`."""
+    wanted = (CATEGORICAL_FILTERS + RANGE_FILTERS + METAL_COLUMNS + HORMONE_COLUMNS + DERIVED_SOURCE_COLUMNS
+              + ['regular_periods', WEIGHT_COLUMN])
+    return [col for col in dict.fromkeys(wanted) if col in columns]
+
+
+@st.cache_resource(show_spinner="Indexing cohorts ...", max_entries=1)
+def _load_cohort_index_cached(path, version):
+    backend = load_backend(path)
+    with span("compute:cohort index", 'compute'):
+        return CohortIndex(backend.fetch(index_columns(backend.columns())))
+
+
+def load_cohort_index(path=None):
+    """The shared CohortIndex for the current dataset version."""
+    path = path or data_path()
+    return _load_cohort_index_cached(path, dataset_version(path))
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _cohort_backend_cached(path, version, cohort):
+    index = load_cohort_index(path)
+    return PandasBackend(index.frame[index.mask(cohort)])
+
+
+def cohort_backend(cohort, path=None):
+    """A query backend over a cohort's rows; the shared backend for the empty cohort."""
+    path = path or data_path()
+    if not cohort:
+        return load_backend(path)
+    return _cohort_backend_cached(path, dataset_version(path), cohort)
+
+
+def describe_cohort(cohort):
+    """A one-line readable summary of a cohort, e.g. for export headers."""
+    if not cohort:
+        return "everyone"
+    parts = []
+    for column, op, value in cohort:
+        if op == 'between':
+            parts.append(f"{column} {value[0]:g}-{value[1]:g}")
+        else:
+            labels = VALUE_LABELS.get(column, {})
+            parts.append(f"{column}: " + ", ".join(labels.get(int(code), f"{code:g}") for code in value))
+    return "; ".join(parts)
+
+
+def cohort_controls(container, path=None):
+    """Cohort widgets in `container` (e.g. st.sidebar); returns the selected cohort.
+
+    A widget left at "everyone" adds no filter, so rows missing that column
+    stay in the cohort.
+    """
+    index = load_cohort_index(path)
+    cohort = []
+    age_range = index.value_range('age_years')
+    if age_range:
+        low, high = int(age_range[0]), int(age_range[1])
+        ages = container.slider("Age (years)", low, high, (low, high), key="cohort_age")
+        if ages != (low, high):
+            cohort.append(('age_years', 'between', (float(ages[0]), float(ages[1]))))
+    for column, label in [('race', "Race / ethnicity"), ('marital_status', "Marital status")]:
+        if index.values(column):
+            chosen = container.multiselect(label, index.values(column), key=f"cohort_{column}",
+                                           format_func=lambda code, column=column: VALUE_LABELS[column].get(
+                                               int(code), f"{code:g}"),
+                                           placeholder="Everyone")
+            if chosen:
+                cohort.append((column, 'in', tuple(sorted(chosen))))
+    if index.value_range('income_poverty_ratio'):
+        band = container.select_slider("Income-to-poverty ratio", INCOME_BANDS,
+                                       (INCOME_BANDS[0], INCOME_BANDS[-1]), key="cohort_income")
+        if band != (INCOME_BANDS[0], INCOME_BANDS[-1]):
+            cohort.append(('income_poverty_ratio', 'between', (float(band[0]), float(band[1]))))
+    if index.values('pregnancy_status'):
+        chosen = container.multiselect("Pregnancy status", index.values('pregnancy_status'), key="cohort_pregnancy",
+                                       format_func=lambda code: VALUE_LABELS['pregnancy_status'].get(
+                                           int(code), f"{code:g}"),
+                                       placeholder="Everyone")
+        if chosen:
+            cohort.append(('pregnancy_status', 'in', tuple(sorted(chosen))))
+    return tuple(cohort)
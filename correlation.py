@@ -0,0 +1,212 @@
+"""Pairwise-complete correlation matrices from masked matrix products.
+
+pandas' DataFrame.corr() loops over column pairs to honour missing values,
+which gets slow for wide frames with heavy missingness like the NHANES
+questionnaire block. The same pairwise-complete Pearson statistics fall out
+of a handful of matrix products over zero-filled values and 0/1 masks:
+n_ij, sum x, sum y, sum x^2, sum y^2 and sum xy for every pair at once.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from backend import load_backend
+from data_loader import METAL_COLUMNS, METAL_MEASUREMENT_COLUMNS, WEIGHT_COLUMN, data_path, dataset_version
+from shared_cache import shared_result
+
+
+def pair_sums(X, Y, w=None):
+    """Raw pairwise-complete sums for every column of X against every column of Y.
+
+    X is (rows, p) and Y is (rows, q), NaN for missing. Returns n, sx, sy,
+    sxx, syy and sxy, each a (p, q) matrix over the rows where both columns
+    of the pair are present. The sums are additive, so they can be
+    accumulated over chunks of rows.
+
+    With positive row weights `w` the sums are weighted, and sw and sww
+    (the sums of w and w^2 over each pair's rows) are added; n stays the
+    number of rows.
+    """
+    mx, my = ~np.isnan(X), ~np.isnan(Y)
+    X0, Y0 = np.where(mx, X, 0.0), np.where(my, Y, 0.0)
+    mxf, myf = mx.astype(float), my.astype(float)
+    sums = {'n': mxf.T @ myf}
+    wX0, wmx = X0, mxf
+    if w is not None:
+        # Weighting the x side weights every product: sum w*x*y, sum w*x^2, ...
+        w = w[:, None]
+        wX0, wmx = X0 * w, mxf * w
+        sums['sw'] = wmx.T @ myf
+        sums['sww'] = (wmx * w).T @ myf
+    sums.update({'sx': wX0.T @ myf, 'sy': wmx.T @ Y0, 'sxx': (wX0 * X0).T @ myf,
+                 'syy': wmx.T @ (Y0 ** 2), 'sxy': wX0.T @ Y0})
+    return sums
+
+
+def moments_from_sums(sums):
+    """pair_moments' statistics from pair_sums: n, sw, sx, sy and the centred sums cxx, cyy, cxy.
+
+    sw is the total weight of each pair's rows (n when unweighted). Weighted
+    sums also give n_eff, Kish's effective sample size, for inference.
+    """
+    n, sx, sy = sums['n'], sums['sx'], sums['sy']
+    sw = sums.get('sw', n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        moments = {'n': n, 'sw': sw, 'sx': sx, 'sy': sy,
+                   'cxx': sums['sxx'] - sx ** 2 / sw,
+                   'cyy': sums['syy'] - sy ** 2 / sw,
+                   'cxy': sums['sxy'] - sx * sy / sw}
+        if 'sww' in sums:
+            moments['n_eff'] = sw ** 2 / sums['sww']
+    return moments
+
+
+def pair_moments(X, Y, w=None):
+    """Pairwise-complete sufficient statistics for every column of X against every column of Y.
+
+    X is (rows, p) and Y is (rows, q), NaN for missing. Returns n, sx, sy
+    and the centred sums cxx, cyy, cxy, each a (p, q) matrix computed over
+    the rows where both columns of the pair are present (see pair_sums for
+    the weighted version).
+    """
+    return moments_from_sums(pair_sums(X, Y, w))
+
+
+def p_values(r, n):
+    """Two-sided p-values of correlations r over n rows (t-test, n - 2 dof)."""
+    # Imported here so scipy stays off the app's startup path
+    from scipy.stats import t as student_t
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dof = n - 2
+        t_stat = np.abs(r) * np.sqrt(dof / (1 - r ** 2))
+        return np.where(dof > 0, 2 * student_t.sf(t_stat, np.maximum(dof, 1)), np.nan)
+
+
+def pearson_from_moments(moments):
+    """Correlation r and its p-value from pair_moments (weighted moments test on their effective n)."""
+    n = moments['n']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = np.clip(moments['cxy'] / np.sqrt(moments['cxx'] * moments['cyy']), -1.0, 1.0)
+    r = np.where(n >= 2, r, np.nan)
+    return r, p_values(r, moments.get('n_eff', n))
+
+
+def correlation_frames(moments, columns, r=None):
+    """r, p and n matrices as frames from the pair moments of `columns` against themselves.
+
+    `r` replaces the Pearson correlations (e.g. with Spearman's); p is then
+    recomputed for it from the same pairwise n.
+    """
+    if r is None:
+        r, p = pearson_from_moments(moments)
+    else:
+        p = p_values(r, moments['n'])
+    return {
+        'r': pd.DataFrame(r, index=columns, columns=columns),
+        'p': pd.DataFrame(p, index=columns, columns=columns),
+        'n': pd.DataFrame(moments['n'].astype(np.int64), index=columns, columns=columns),
+    }
+
+
+def correlation_matrices(frame, method='pearson'):
+    """Full r, p and n matrices for every pair of columns of a numeric frame.
+
+    Pearson comes from pair_moments. Spearman needs every pair re-ranked on
+    its own complete rows, which has no matrix-product shortcut, so r is
+    taken from pandas; n and p still come from the masked products. Either
+    way the result is meant to be computed once per dataset version.
+    """
+    values = frame.to_numpy(dtype=float, na_value=np.nan)
+    r = frame.corr(method='spearman').to_numpy() if method == 'spearman' else None
+    return correlation_frames(pair_moments(values, values), frame.columns, r)
+
+
+def benjamini_hochberg(p):
+    """Benjamini-Hochberg adjusted p-values (q-values); NaNs are left out of the family."""
+    p = np.asarray(p, dtype=float)
+    q = np.full_like(p, np.nan)
+    valid = np.flatnonzero(~np.isnan(p))
+    m = len(valid)
+    if m:
+        order = valid[np.argsort(p[valid])]
+        scaled = p[order] * m / np.arange(1, m + 1)
+        q[order] = np.minimum(1.0, np.minimum.accumulate(scaled[::-1])[::-1])
+    return q
+
+
+def screening_table(moments, x_columns, y_columns):
+    """Pearson r, n, p and BH q-value per pair from the pair moments of x against y columns.
+
+    Returns a long frame sorted by p-value.
+    """
+    r, p = pearson_from_moments(moments)
+    table = pd.DataFrame({
+        'metal': np.repeat(x_columns, len(y_columns)),
+        'variable': np.tile(y_columns, len(x_columns)),
+        'r': r.ravel(),
+        'n': moments['n'].ravel().astype(np.int64),
+        'p': p.ravel(),
+    })
+    table['q (BH)'] = benjamini_hochberg(table['p'])
+    return table.sort_values('p', na_position='last', ignore_index=True)
+
+
+def screen_correlations(frame, x_columns, y_columns):
+    """screening_table for every x column against every y column of a frame.
+
+    One pair_moments pass over the whole block, so the cost is linear in the
+    number of rows.
+    """
+    X = frame[x_columns].to_numpy(dtype=float, na_value=np.nan)
+    Y = frame[y_columns].to_numpy(dtype=float, na_value=np.nan)
+    return screening_table(pair_moments(X, Y), x_columns, y_columns)
+
+
+@st.cache_resource(show_spinner="Computing correlations ...", max_entries=4)
+def _load_correlations_cached(path, version, method, weighted):
+    backend = load_backend(path)
+    columns = backend.numeric_columns()
+    weights = WEIGHT_COLUMN if weighted else None
+
+    def build():
+        # Spearman ranks every pair on its own rows, which the engine cannot push down
+        r = backend.fetch(columns).corr(method='spearman').to_numpy() if method == 'spearman' else None
+        return correlation_frames(backend.pair_moments(columns, columns, weights=weights), columns, r)
+    return shared_result("correlations", path, version, build, (method, weighted))
+
+
+def load_correlations(method='pearson', path=None, weighted=False):
+    """Cached correlation matrices of all numeric columns for the current dataset version.
+
+    The pair moments are computed by the query backend (see backend.py).
+    `weighted` gives survey-weighted Pearson correlations; Spearman's are
+    never weighted.
+    """
+    path = path or data_path()
+    return _load_correlations_cached(path, dataset_version(path), method, weighted and method == 'pearson')
+
+
+@st.cache_resource(show_spinner="Screening correlations ...", max_entries=4)
+def _load_screening_cached(path, version, alternate_units, weighted):
+    backend = load_backend(path)
+    metals = [col for col in (METAL_MEASUREMENT_COLUMNS if alternate_units else METAL_COLUMNS)
+              if col in backend.columns()]
+    variables = [col for col in backend.numeric_columns()
+                 if col not in METAL_MEASUREMENT_COLUMNS and col != WEIGHT_COLUMN]
+    weights = WEIGHT_COLUMN if weighted else None
+    return shared_result("screening", path, version,
+                         lambda: screening_table(backend.pair_moments(metals, variables, weights=weights),
+                                                 metals, variables),
+                         (alternate_units, weighted))
+
+
+def load_screening(alternate_units=False, path=None, weighted=False):
+    """Cached screen of every metal against every other numeric column.
+
+    By default only the primary-unit metal columns are screened; the molar
+    duplicates would only repeat each hit and inflate the FDR family.
+    `weighted` screens survey-weighted correlations.
+    """
+    path = path or data_path()
+    return _load_screening_cached(path, dataset_version(path), alternate_units, weighted)
@@ -0,0 +1,280 @@
+"""Data-access layer for the ReproSight dashboards.
+
+The cleaned NHANES extract is parsed from CSV once, converted to a Parquet
+copy with compact dtypes and then served from an in-process cache that is
+shared by every Streamlit session. Both caches are keyed by a dataset version
+derived from the source file, so replacing the CSV invalidates them.
+
+The source may also be a directory of partitioned Parquet written by the
+ingestion stage (ingest.py); it is read as is and versioned by its manifest.
+
+With REPROSIGHT_SHARED=1, the deployment mode for several server processes
+(see serve.py), the frame is instead memory-mapped from an uncompressed Arrow
+copy (map_dataset): every process reads the same pages of the OS page cache
+rather than holding a private copy.
+"""
+import hashlib
+import os
+
+import pandas as pd
+import streamlit as st
+
+from profiling import span
+
+DATA_PATH = 'final_cleaned.csv'
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = '.reprosight_cache'
+# Rows per row group of the Parquet copy: readers that stream it (DuckDB,
+# export.py) hold about one row group per column at a time
+PARQUET_ROW_GROUP = 1 << 16
+# Summary of an ingested Parquet directory, rewritten by every ingest run
+MANIFEST_NAME = '_manifest.json'
+# Memory-map the dataset and share cached results between server processes
+SHARED = os.environ.get('REPROSIGHT_SHARED', '0') != '0'
+
+# Blood metal measurements in the units the dashboards plot, and the same
+# metals in molar units
+METAL_COLUMNS = ['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L']
+MOLAR_METAL_COLUMNS = ['lead_µmol/L', 'cadmium_nmol/L', 'mercury_nmol/L', 'selenium_µmol/L', 'manganese_nmol/L']
+METAL_MEASUREMENT_COLUMNS = METAL_COLUMNS + MOLAR_METAL_COLUMNS
+HORMONE_COLUMNS = ['testosterone', 'estradiol', 'shbg']
+WEIGHT_COLUMN = 'Blood metal weights'
+
+# Coded questionnaire / demographic answers. They only ever hold small integer
+# codes (1 = Yes, 2 = No, 7/9/77/99/999 = refused / don't know, ...) so float32
+# stores them exactly at half the size, and keeps NaN for "not asked".
+CODED_COLUMNS = [
+    'testosterone_comment', 'estradiol_comment', 'shbg_comment',
+    'first_period_age', 'regular_periods', 'no_period_reason', 'last_period_age',
+    'infertility_1yr', 'infertility_treated', 'pelvic_infection',
+    'ever_pregnant', 'pregnant_now', 'pregnant_times', 'pregnant_diabaetes',
+    'pregnant_diabaetes_age', 'vaginal_deliveries', 'cesarean_deliveries',
+    'baby_weight_high', 'baby_weight_high_age', 'live_births',
+    'first_live_birth_age', 'last_live_birth_age', 'hysterectomy',
+    'hysterectomy_age', 'ovaries_removed', 'ovaries_removed_age',
+    'birth_control', 'female_hormones', 'gender', 'age_years', 'race',
+    'marital_status', 'pregnancy_status', 'household_size', 'family_size',
+]
+# What the demographic codes stand for (NHANES RIDRETH3, DMDMARTL and RIDEXPRG)
+VALUE_LABELS = {
+    'race': {1: 'Mexican American', 2: 'Other Hispanic', 3: 'Non-Hispanic White', 4: 'Non-Hispanic Black',
+             6: 'Non-Hispanic Asian', 7: 'Other / multi-racial'},
+    'marital_status': {1: 'Married', 2: 'Widowed', 3: 'Divorced', 4: 'Separated', 5: 'Never married',
+                       6: 'Living with partner', 77: 'Refused', 99: "Don't know"},
+    'pregnancy_status': {1: 'Pregnant', 2: 'Not pregnant', 3: 'Cannot be determined'},
+}
+
+
+# --- Dataset versioning ---
+def data_path():
+    """The dataset the app serves: $REPROSIGHT_DATA if set, else final_cleaned.csv."""
+    return os.environ.get('REPROSIGHT_DATA', DATA_PATH)
+
+
+def dataset_version(path=DATA_PATH):
+    """Returns a short fingerprint of the source file (mtime + size).
+
+    Cheap enough to call on every rerun; any rewrite of the file changes it.
+    An ingested directory is fingerprinted by its manifest.
+    """
+    stat = os.stat(os.path.join(path, MANIFEST_NAME) if os.path.isdir(path) else path)
+    key = f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Returns the sha1 of the file contents (for offline verification)."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprint(modules, *versions):
+    """Short fingerprint of the app modules named in `modules` and of `versions`.
+
+    Caches stored on disk add it to their directory names, so changing the
+    code that builds them (or a library it serializes with) starts afresh.
+    """
+    digest = hashlib.sha1(repr(versions).encode('utf-8'))
+    for module in sorted(modules):
+        with open(os.path.join(APP_DIR, f"{module}.py"), 'rb') as fh:
+            digest.update(fh.read())
+    return digest.hexdigest()[:8]
+
+
+# --- Parsing and dtype handling ---
+def optimize_dtypes(df):
+    """Downcasts the coded answer columns to float32 in place and returns df."""
+    for col in CODED_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('float32')
+    return df
+
+
+def read_csv(path=DATA_PATH):
+    """Parses the raw CSV and applies the compact dtypes."""
+    return optimize_dtypes(pd.read_csv(path))
+
+
+def parquet_path(path=DATA_PATH, version=None):
+    """Location of the columnar copy of `path` for the given dataset version."""
+    version = version or dataset_version(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(CACHE_DIR, f"{stem}-{version}.parquet")
+
+
+def read_dataset(path=DATA_PATH, version=None):
+    """Reads the dataset from its Parquet copy, building the copy if needed.
+
+    Stale Parquet files from older versions of the same source are removed.
+    An ingested directory is already Parquet and is read directly.
+    """
+    if os.path.isdir(path):
+        # Imported here because ingest builds on this module's column lists
+        from ingest import read_ingested
+        return read_ingested(path)
+    version = version or dataset_version(path)
+    target = parquet_path(path, version)
+    if os.path.exists(target):
+        return pd.read_parquet(target)
+
+    df = read_csv(path)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for name in os.listdir(CACHE_DIR):
+        if name.startswith(f"{stem}-") and name.endswith('.parquet'):
+            os.remove(os.path.join(CACHE_DIR, name))
+    # Write to a temp file first so a concurrent reader never sees half a file
+    tmp = f"{target}.{os.getpid()}.tmp"
+    df.to_parquet(tmp, index=False, row_group_size=PARQUET_ROW_GROUP)
+    os.replace(tmp, target)
+    return df
+
+
+def ensure_parquet(path=DATA_PATH, version=None):
+    """Builds the Parquet copy of `path` if it is missing and returns its location.
+
+    For an ingested directory this is a glob over its partition files.
+    """
+    if os.path.isdir(path):
+        return os.path.join(path, '**', '*.parquet')
+    version = version or dataset_version(path)
+    target = parquet_path(path, version)
+    if not os.path.exists(target):
+        read_dataset(path, version)
+    return target
+
+
+def arrow_path(path=DATA_PATH, version=None):
+    """Location of the memory-mappable Arrow copy of `path` for the given dataset version."""
+    version = version or dataset_version(path)
+    stem = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+    return os.path.join(CACHE_DIR, f"{stem}-{version}.arrow")
+
+
+def ensure_arrow(path=DATA_PATH, version=None):
+    """Writes the dataset as an uncompressed Arrow IPC file if it is missing; returns its location.
+
+    Each column is a single chunk and numeric columns keep NaN as a value
+    rather than an Arrow null, so map_dataset can hand them to pandas
+    without a copy. Stale copies of older versions of the same source are
+    removed (a process still mapping one keeps its pages until it exits).
+    """
+    version = version or dataset_version(path)
+    target = arrow_path(path, version)
+    if os.path.exists(target):
+        return target
+    import pyarrow as pa
+
+    df = read_dataset(path, version)
+    # A NumPy array keeps its NaNs as values; converting the pandas column would turn them into nulls
+    table = pa.table({col: pa.array(df[col].to_numpy()) if df[col].dtype.kind in 'biuf'
+                      else pa.array(df[col], from_pandas=True) for col in df.columns})
+    stem = os.path.basename(target).rsplit('-', 1)[0]
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for name in os.listdir(CACHE_DIR):
+        if name.startswith(f"{stem}-") and name.endswith('.arrow'):
+            os.remove(os.path.join(CACHE_DIR, name))
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=max(len(df), 1))
+    os.replace(tmp, target)
+    return target
+
+
+def map_dataset(path=DATA_PATH, version=None):
+    """The dataset as a read-only DataFrame over a memory map of its Arrow copy.
+
+    The numeric columns are views of the mapped file, so processes mapping
+    the same copy share its pages and a process only pays for the pages it
+    touches.
+    """
+    import pyarrow as pa
+
+    table = pa.ipc.open_file(pa.memory_map(ensure_arrow(path, version))).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+# --- Derived view ---
+AGE_BINS = [18, 25, 30, 35, 40, 45, 50]
+AGE_LABELS = ['18-24', '25-29', '30-34', '35-39', '40-44', '45-50']
+INFERTILITY_LABELS = {1: 'Yes', 2: 'No'}
+
+
+def build_derived_view(df):
+    """Computes the columns the insight tabs derive from the raw frame.
+
+    Returns a new frame aligned on df.index, so the tabs can pair a derived
+    column with a raw one without copying or mutating the shared dataset:
+      * infertility_status - 'Yes'/'No' from infertility_1yr (NaN if not asked)
+      * age_group          - reproductive age band, NaN outside 18-49
+      * is_infertile       - infertility_status == 'Yes'
+      * first_period_age   - age of menarche as a category label, NaN outside 8-20
+      * valid_menopause    - last_period_age is present and a real age (< 100)
+    """
+    infertility_status = df['infertility_1yr'].map(INFERTILITY_LABELS).astype(
+        pd.CategoricalDtype(['Yes', 'No']))
+    age_group = pd.cut(df['age_years'], bins=AGE_BINS, labels=AGE_LABELS, right=False)
+
+    menarche = df['first_period_age']
+    first_period_age = menarche[menarche.between(8, 20)].astype(str).astype('category')
+
+    return pd.DataFrame({
+        'infertility_status': infertility_status,
+        'age_group': age_group,
+        'is_infertile': (infertility_status == 'Yes').to_numpy(),
+        'first_period_age': first_period_age.reindex(df.index),
+        'valid_menopause': (df['last_period_age'] < 100).to_numpy(),
+    }, index=df.index)
+
+
+# --- Cached entry points used by the app ---
+@st.cache_resource(show_spinner="Loading dataset ...", max_entries=1)
+def _load_dataset_cached(path, version):
+    with span("compute:read dataset", 'compute'):
+        return map_dataset(path, version) if SHARED else read_dataset(path, version)
+
+
+def load_dataset(path=None):
+    """Returns the shared, cached DataFrame for the current dataset version.
+
+    The frame is shared across sessions (st.cache_resource hands out the same
+    object instead of unpickling a copy per rerun), so callers must not mutate
+    it. With REPROSIGHT_SHARED it is memory-mapped and read-only (see
+    map_dataset).
+    """
+    path = path or data_path()
+    return _load_dataset_cached(path, dataset_version(path))
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_derived_view_cached(path, version):
+    return build_derived_view(_load_dataset_cached(path, version))
+
+
+def load_derived_view(path=None):
+    """Returns the shared derived view (see build_derived_view) for the current dataset."""
+    path = path or data_path()
+    return _load_derived_view_cached(path, dataset_version(path))
@@ -0,0 +1,307 @@
+"""Key Insights report and cohort extracts, produced off the script thread.
+
+Exports run as jobs on a small process-wide thread pool (EXPORT_WORKERS), so
+a large download never blocks the session that asked for it or anyone
+else's reruns; the Export panel polls its session's jobs with a fragment.
+  * The report is one self-contained HTML file with every Key Insights tab
+    and every metal option, for the current weighting and cohort. Its
+    figures come from the figure cache, rendered by a worker pool
+    (REPORT_WORKERS) from the shared aggregates.
+  * An extract holds every column of the cohort's rows, as CSV or Parquet.
+    Rows are streamed from the Parquet copy in record batches
+    (EXPORT_BATCH_ROWS) with the cohort filter pushed down to pyarrow, so
+    no copy of the frame is ever built.
+
+Finished files are written under static/exports/<job token>/, which
+Streamlit serves at app/static/ (server.enableStaticServing, see
+.streamlit/config.toml) without going through the script thread. The static
+route refuses files over 200 MB, so extracts roll over into numbered parts
+of at most EXPORT_PART_MB. Exports older than EXPORT_TTL are removed.
+"""
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from html import escape
+
+import streamlit as st
+
+from cohort import describe_cohort, load_cohort_index
+from data_loader import data_path, ensure_parquet
+from insight_figures import insight_combinations, insight_figure
+from profiling import span
+
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'exports')
+EXPORT_URL = 'app/static/exports'
+EXPORT_WORKERS = 2
+REPORT_WORKERS = 4
+EXPORT_BATCH_ROWS = 1 << 16
+EXPORT_PART_MB = float(os.environ.get('REPROSIGHT_EXPORT_PART_MB', 190))
+EXPORT_TTL = 3600  # seconds
+EXPORT_POLL_SECONDS = 1.0
+EXTRACT_FORMATS = ['csv', 'parquet']
+# Report chapters in the dashboard's tab order, with the charts each tab shows
+REPORT_SECTIONS = [
+    ("Hormonal Patterns", ['hormone_heatmap', 'hormone_scatter']),
+    ("Fertility Analysis", ['fertility_box', 'infertility_rate']),
+    ("Menstrual Cycle Insights", ['menstrual_raincloud', 'menarche_box']),
+    ("Menopause Trends", ['menopause_scatter']),
+]
+
+
+class ExportJob:
+    """Progress and output files of one export, polled by the session that started it."""
+
+    def __init__(self, label):
+        self.label = label
+        self.token = uuid.uuid4().hex
+        self.total = 0
+        self.done = 0
+        self.files = []  # file names in directory, in order
+        self.error = None
+        self.seconds = None
+
+    @property
+    def directory(self):
+        return os.path.join(EXPORT_DIR, self.token)
+
+    @property
+    def finished(self):
+        return self.seconds is not None
+
+
+@st.cache_resource(show_spinner=False)
+def _export_pool():
+    return ThreadPoolExecutor(EXPORT_WORKERS, thread_name_prefix='export')
+
+
+def _prune_exports(ttl=EXPORT_TTL):
+    """Removes export directories older than `ttl` seconds."""
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - ttl
+    for name in os.listdir(EXPORT_DIR):
+        directory = os.path.join(EXPORT_DIR, name)
+        if os.path.getmtime(directory) < cutoff:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def start_export(label, write, **kwargs):
+    """Runs write(job=..., **kwargs) on the export pool; returns its ExportJob at once."""
+    _prune_exports()
+    job = ExportJob(label)
+    os.makedirs(job.directory)
+
+    def run():
+        start = time.perf_counter()
+        try:
+            with span(f"export:{label}", 'export'):
+                write(job=job, **kwargs)
+        except Exception as err:
+            job.error = repr(err)
+        job.seconds = time.perf_counter() - start
+
+    _export_pool().submit(run)
+    return job
+
+
+# --- Report ---
+def report_combinations(path=None, weighted=False):
+    """(chart_id, params) of every figure in the report, in tab order.
+
+    The raincloud plots are included without their raw points, which only
+    add payload to a static report.
+    """
+    order = {chart_id: i for i, (_, charts) in enumerate(REPORT_SECTIONS) for chart_id in charts}
+    combinations = [(chart_id, params) for chart_id, params, is_weighted in insight_combinations(path)
+                    if is_weighted == weighted and not (chart_id == 'menstrual_raincloud' and params[1])]
+    return sorted(combinations, key=lambda combination: order[combination[0]])
+
+
+def write_report(job, path=None, weighted=False, cohort=(), workers=REPORT_WORKERS):
+    """Writes the HTML report of every Key Insights figure into the job's directory."""
+    import plotly.offline
+
+    path = path or data_path()
+    combinations = report_combinations(path, weighted)
+    job.total = len(combinations)
+    section_of = {chart_id: title for title, charts in REPORT_SECTIONS for chart_id in charts}
+
+    def render(combination):
+        chart_id, params = combination
+        fig = insight_figure(chart_id, *params, path=path, weighted=weighted, cohort=cohort)
+        return fig.to_html(full_html=False, include_plotlyjs=False)
+
+    name = 'reprosight_key_insights.html'
+    tmp = os.path.join(job.directory, f".{name}.tmp")
+    rows = load_cohort_index(path).count(cohort)
+    with open(tmp, 'w', encoding='utf-8') as fh, ThreadPoolExecutor(workers, thread_name_prefix='report') as pool:
+        fh.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">"
+                 "<title>ReproSight: Key Insights</title>"
+                 f"<script type=\"text/javascript\">{plotly.offline.get_plotlyjs()}</script>"
+                 "<style>body{font-family:sans-serif;margin:2em}.figure{margin-bottom:2em}</style>"
+                 "</head><body>\n<h1>ReproSight: Key Insights</h1>\n")
+        fh.write(f"<p>{escape(os.path.basename(path))} &middot; {rows:,} participants &middot; "
+                 f"cohort: {escape(describe_cohort(cohort))} &middot; "
+                 f"{'survey-weighted' if weighted else 'unweighted'} &middot; "
+                 f"generated {datetime.now():%Y-%m-%d %H:%M}</p>\n")
+        section = None
+        # pool.map keeps the report order while later figures are still rendering
+        for (chart_id, _), html in zip(combinations, pool.map(render, combinations)):
+            if section_of[chart_id] != section:
+                section = section_of[chart_id]
+                fh.write(f"<h2>{escape(section)}</h2>\n")
+            fh.write(f"<div class=\"figure\">{html}</div>\n")
+            job.done += 1
+        fh.write("</body></html>\n")
+    os.replace(tmp, os.path.join(job.directory, name))
+    job.files.append(name)
+
+
+# --- Cohort extracts ---
+def cohort_expression(cohort, schema):
+    """The cohort's filter triples as a pyarrow dataset expression (None for everyone)."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    expression = None
+    for column, op, value in cohort:
+        field = pc.field(column)
+        if op == 'in':
+            condition = field.isin(pa.array(value, type=schema.field(column).type))
+        elif op == 'between':
+            condition = (field >= value[0]) & (field <= value[1])
+        else:
+            raise ValueError(f"cohort filters support 'in' and 'between', not {op!r}")
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _source_dataset(path, cohort):
+    import pyarrow.dataset as ds
+
+    if os.path.isdir(path):
+        # An ingested directory: only the partition files the cohort may touch
+        from ingest import SCHEMA, prune_files
+        files = [os.path.join(path, entry['path']) for entry in prune_files(path, cohort)]
+        return ds.dataset(files, schema=SCHEMA, format='parquet')
+    return ds.dataset(ensure_parquet(path), format='parquet')
+
+
+class _PartWriter:
+    """Writes record batches to numbered files of at most `part_bytes` each."""
+
+    def __init__(self, directory, stem, fmt, schema, part_bytes):
+        self.directory, self.stem, self.fmt, self.schema = directory, stem, fmt, schema
+        self.part_bytes = part_bytes
+        self.files = []
+        self._sink = self._writer = None
+
+    def _open(self):
+        import pyarrow.csv
+        import pyarrow.parquet as pq
+
+        part = len(self.files) + 1
+        self.files.append(f"{self.stem}.{self.fmt}" if part == 1 else f"{self.stem}-{part}.{self.fmt}")
+        self._sink = open(os.path.join(self.directory, f".{self.files[-1]}.tmp"), 'wb')
+        if self.fmt == 'csv':
+            self._writer = pyarrow.csv.CSVWriter(self._sink, self.schema)
+        else:
+            self._writer = pq.ParquetWriter(self._sink, self.schema)
+
+    def write(self, batch):
+        if self._writer is None or self._sink.tell() >= self.part_bytes:
+            self.close()
+            self._open()
+        self._writer.write_batch(batch)
+
+    def close(self):
+        """Finishes the current part and moves it into place."""
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._sink.close()
+        name = self.files[-1]
+        os.replace(os.path.join(self.directory, f".{name}.tmp"), os.path.join(self.directory, name))
+        self._sink = self._writer = None
+
+    def finish(self):
+        """Closes the last part; an empty extract still gets one file with the header."""
+        if not self.files:
+            self._open()
+        self.close()
+
+
+def write_extract(job, path=None, cohort=(), fmt='csv', batch_rows=EXPORT_BATCH_ROWS,
+                  part_bytes=EXPORT_PART_MB * 2 ** 20):
+    """Streams every column of the cohort's rows into CSV or Parquet parts in the job's directory."""
+    if fmt not in EXTRACT_FORMATS:
+        raise ValueError(f"Unknown extract format {fmt!r}; expected one of {EXTRACT_FORMATS}")
+    path = path or data_path()
+    job.total = load_cohort_index(path).count(cohort)
+    dataset = _source_dataset(path, cohort)
+    writer = _PartWriter(job.directory, 'reprosight_cohort', fmt, dataset.schema, part_bytes)
+    for batch in dataset.to_batches(filter=cohort_expression(cohort, dataset.schema), batch_size=batch_rows):
+        if batch.num_rows:
+            writer.write(batch)
+            job.done += batch.num_rows
+    writer.finish()
+    job.files = writer.files
+
+
+# --- Export panel ---
+def _download_link(job, name):
+    file_path = os.path.join(job.directory, name)
+    if not os.path.exists(file_path):
+        st.caption(f"{name} (expired)")
+    elif st.get_option('server.enableStaticServing'):
+        size = os.path.getsize(file_path) / 2 ** 20
+        st.markdown(f'<a href="{EXPORT_URL}/{job.token}/{name}" download="{name}">{name}</a> ({size:,.1f} MB)',
+                    unsafe_allow_html=True)
+    else:
+        # Without static serving the file has to pass through the session's media store
+        with open(file_path, 'rb') as fh:
+            st.download_button(name, fh, file_name=name, key=f"export_{job.token}_{name}", on_click='ignore')
+
+
+def _show_jobs(jobs):
+    for job in reversed(jobs):
+        if job.error:
+            st.error(f"{job.label} failed: {job.error}")
+        elif not job.finished:
+            st.progress(job.done / job.total if job.total else 0.0,
+                        text=f"{job.label}: {job.done:,}/{job.total:,}" if job.total else f"{job.label} ...")
+        else:
+            st.caption(f"{job.label} ({job.seconds:.1f} s)")
+            for name in job.files:
+                _download_link(job, name)
+
+
+@st.fragment(run_every=EXPORT_POLL_SECONDS)
+def _poll_jobs(jobs):
+    _show_jobs(jobs)
+    if all(job.finished for job in jobs):
+        # Back to a full rerun so the panel stops polling
+        st.rerun()
+
+
+def export_panel(container, path=None, weighted=False, cohort=()):
+    """Export buttons and this session's export jobs in `container` (e.g. a sidebar expander)."""
+    path = path or data_path()
+    jobs = st.session_state.setdefault('export_jobs', [])
+    with container:
+        st.caption(f"For the current cohort ({describe_cohort(cohort)}), "
+                   f"{'survey-weighted' if weighted else 'unweighted'}.")
+        if st.button("Build report", key="export_report",
+                     help="Every Key Insights tab and metal option in one HTML file."):
+            jobs.append(start_export("Report", write_report, path=path, weighted=weighted, cohort=cohort))
+        fmt = st.radio("Extract format", EXTRACT_FORMATS, horizontal=True, key="export_format",
+                       format_func=str.upper)
+        if st.button("Extract cohort rows", key="export_extract", help="Every column of the cohort's rows."):
+            jobs.append(start_export(f"{fmt.upper()} extract", write_extract, path=path, cohort=cohort, fmt=fmt))
+        if any(not job.finished for job in jobs):
+            _poll_jobs(jobs)
+        else:
+            _show_jobs(jobs)
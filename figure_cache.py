@@ -0,0 +1,206 @@
+"""Process-wide cache of built Plotly figures, shared by every session.
+
+Figures are stored as their serialized JSON, keyed by (dataset version,
+chart id, widget values), so a chart is built once per distinct selection
+and served to any later rerun or session that asks for the same view.
+Entries are evicted least-recently-used once the cache exceeds its byte
+budget (REPROSIGHT_FIGURE_CACHE_MB, 64 MB by default).
+
+Every built figure is also written to the cache directory, one JSON file per
+key, so figures rendered by an offline prewarm (prewarm.py) or by an earlier
+server process are loaded instead of rebuilt. The files are kept per dataset
+version and per fingerprint of the modules that build the figures and of the
+Plotly version (FIGURE_CODE), so a code change or upgrade never serves
+figures drawn by the old code.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import Counter, OrderedDict
+
+import pandas as pd
+import plotly
+import plotly.graph_objects as go
+import streamlit as st
+
+from data_loader import CACHE_DIR, data_path, dataset_version, source_fingerprint
+from profiling import record_payload, span
+
+FIGURE_CACHE_MB = float(os.environ.get('REPROSIGHT_FIGURE_CACHE_MB', 64))
+FIGURE_DIR = os.path.join(CACHE_DIR, 'figures')
+# The modules whose code decides what a cached figure looks like
+FIGURE_MODULES = ['insight_figures', 'charts', 'aggregates', 'bootstrap', 'cohort', 'trendlines', 'correlation',
+                  'weighted', 'backend', 'data_loader']
+FIGURE_CODE = source_fingerprint(FIGURE_MODULES, plotly.__version__)
+
+
+class FigureCache:
+    """Thread-safe LRU of figure JSON strings with a memory budget in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._disk_hits = Counter()
+        self._misses = Counter()
+        self._evictions = 0
+
+    def get(self, key, load=None):
+        """The cached JSON for `key`, or None.
+
+        On a memory miss `load()` is tried (e.g. a read from disk) and what it
+        returns is kept. Counts a hit, disk hit or miss for the key's chart id.
+        """
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self._hits[key[1]] += 1
+                return payload
+        payload = load() if load else None
+        with self._lock:
+            if payload is None:
+                self._misses[key[1]] += 1
+            else:
+                self._disk_hits[key[1]] += 1
+        if payload is not None:
+            self.put(key, payload)
+        return payload
+
+    def put(self, key, payload):
+        """Stores `payload` and evicts the oldest entries beyond the budget."""
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= len(self._entries.pop(key))
+            self._entries[key] = payload
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self._evictions += 1
+
+    def clear(self):
+        """Drops every in-memory entry; the counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Totals for the admin panel: hits, misses, hit rate, entries, bytes and evictions."""
+        with self._lock:
+            hits, misses = sum(self._hits.values()), sum(self._misses.values())
+            disk_hits = sum(self._disk_hits.values())
+            requests = hits + disk_hits + misses
+            return {
+                'hits': hits,
+                'disk_hits': disk_hits,
+                'misses': misses,
+                'hit_rate': (hits + disk_hits) / requests if requests else 0.0,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self._evictions,
+            }
+
+    def chart_stats(self):
+        """Hits, disk hits, misses and cached entries/bytes per chart id."""
+        with self._lock:
+            charts = sorted(set(self._hits) | set(self._disk_hits) | set(self._misses))
+            entries, sizes = Counter(), Counter()
+            for key, payload in self._entries.items():
+                entries[key[1]] += 1
+                sizes[key[1]] += len(payload)
+            return pd.DataFrame({
+                'hits': [self._hits[chart] for chart in charts],
+                'disk hits': [self._disk_hits[chart] for chart in charts],
+                'misses': [self._misses[chart] for chart in charts],
+                'entries': [entries[chart] for chart in charts],
+                'kB': [sizes[chart] / 1024 for chart in charts],
+            }, index=pd.Index(charts, name='chart'))
+
+
+@st.cache_resource(show_spinner=False)
+def load_figure_cache():
+    """The FigureCache shared by all sessions of this server process."""
+    return FigureCache(int(FIGURE_CACHE_MB * 2 ** 20))
+
+
+def figure_dir(path=None, version=None):
+    """Directory of the on-disk figures for the given dataset version and the current FIGURE_CODE."""
+    path = path or data_path()
+    version = version or dataset_version(path)
+    stem = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+    return os.path.join(FIGURE_DIR, f"{stem}-{version}-{FIGURE_CODE}")
+
+
+def _figure_file(directory, chart_id, params):
+    digest = hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+    return os.path.join(directory, f"{chart_id}-{digest}.json")
+
+
+def _read_figure(target):
+    try:
+        with open(target, encoding='utf-8') as fh:
+            return fh.read()
+    except FileNotFoundError:
+        return None
+
+
+def _write_figure(target, payload):
+    """Writes a figure file atomically.
+
+    Figures of other versions of the same source, or drawn by other code, are removed.
+    """
+    directory = os.path.dirname(target)
+    if not os.path.isdir(directory):
+        stem = os.path.basename(directory).rsplit('-', 2)[0]
+        if os.path.isdir(FIGURE_DIR):
+            for name in os.listdir(FIGURE_DIR):
+                if name.rsplit('-', 2)[0] == stem and name != os.path.basename(directory):
+                    shutil.rmtree(os.path.join(FIGURE_DIR, name), ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        fh.write(payload)
+    os.replace(tmp, target)
+
+
+def clear_figures():
+    """Empties the shared figure cache and removes the figure files on disk."""
+    load_figure_cache().clear()
+    shutil.rmtree(FIGURE_DIR, ignore_errors=True)
+
+
+def cached_figure(chart_id, params, build, path=None, persist=True):
+    """Returns the figure for (chart_id, params), calling `build()` only on a cache miss.
+
+    `params` is a tuple of the widget values the chart depends on. Memory is
+    checked first, then the figure's file on disk. A hit rebuilds the Figure
+    from its JSON without re-validating it, since it was validated when first
+    built. With `persist=False` the figure is kept in memory only.
+    """
+    path = path or data_path()
+    version = dataset_version(path)
+    key = (version, chart_id, params)
+    target = _figure_file(figure_dir(path, version), chart_id, params)
+    cache = load_figure_cache()
+    with span(f"figure:{chart_id}", 'figure') as lookup:
+        payload = cache.get(key, load=(lambda: _read_figure(target)) if persist else None)
+        if payload is not None:
+            lookup.bytes = len(payload)
+            return record_payload(go.Figure(json.loads(payload), _validate=False), len(payload))
+        with span(f"build:{chart_id}", 'build'):
+            fig = build()
+        payload = fig.to_json()
+        lookup.bytes = len(payload)
+        cache.put(key, payload)
+        if persist:
+            _write_figure(target, payload)
+        return record_payload(fig, len(payload))
@@ -0,0 +1,330 @@
+"""Streaming ingestion of NHANES survey cycles into partitioned Parquet.
+
+The dashboards were built on one pre-merged extract (final_cleaned.csv).
+This stage builds the same table from any number of survey cycles, one
+merged participant-level file per cycle (CSV, or SAS transport .xpt as
+NHANES distributes its files), without ever holding a whole cycle in memory.
+Each file is read CHUNK_ROWS rows at a time and every chunk is
+  * renamed from the NHANES variable names (RAW_COLUMNS) to the dashboard's,
+  * harmonized: a metal unit a cycle lacks is converted from the other unit
+    (METAL_UNITS), and codes that changed between cycles are mapped to the
+    current scheme (FALLBACK_COLUMNS, TOP_CODES),
+  * cast to one fixed schema (coded answers as float32, see data_loader),
+and appended to one Parquet file per partition:
+
+    <out>/cycle=2015-2016/gender=2/age_band=40/part-0.parquet
+
+Parquet keeps min/max statistics per row group, which DuckDB uses to skip
+data. _manifest.json summarises them per file (rows and the min, max and null
+count of every column), so prune_files() picks the files a filter needs
+without opening any. The manifest also records a fingerprint of every source,
+so a re-run only ingests new or changed cycles.
+
+    python ingest.py raw/ 2015-2016=final_cleaned.csv [--out nhanes_parquet] [--full]
+
+Setting REPROSIGHT_DATA to the output directory serves it in the dashboards.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_loader import CODED_COLUMNS, MANIFEST_NAME, file_hash, optimize_dtypes
+
+CHUNK_ROWS = 50_000
+INGEST_DIR = 'nhanes_parquet'
+SOURCE_EXTENSIONS = ('.csv', '.csv.gz', '.xpt')
+PARTITION_COLUMNS = ['cycle', 'gender', 'age_band']
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+# NHANES variable (2015-2016 names) -> dashboard column, in the dashboard's column order
+RAW_COLUMNS = {
+    'WTSH2YR': 'Blood metal weights',
+    'LBXBPB': 'lead_µg/dL', 'LBDBPBSI': 'lead_µmol/L',
+    'LBXBCD': 'cadmium_µg/L', 'LBDBCDSI': 'cadmium_nmol/L',
+    'LBXTHG': 'mercury_µg/L', 'LBDTHGSI': 'mercury_nmol/L',
+    'LBXBSE': 'selenium_µg/L', 'LBDBSESI': 'selenium_µmol/L',
+    'LBXBMN': 'manganese_µg/L', 'LBDBMNSI': 'manganese_nmol/L',
+    'LBXTST': 'testosterone', 'LBDTSTLC': 'testosterone_comment',
+    'LBXEST': 'estradiol', 'LBDESTLC': 'estradiol_comment',
+    'LBXSHBG': 'shbg', 'LBDSHBLC': 'shbg_comment',
+    'RHQ010': 'first_period_age', 'RHQ031': 'regular_periods', 'RHD043': 'no_period_reason',
+    'RHQ060': 'last_period_age', 'RHQ074': 'infertility_1yr', 'RHQ076': 'infertility_treated',
+    'RHQ078': 'pelvic_infection', 'RHQ131': 'ever_pregnant', 'RHD143': 'pregnant_now',
+    'RHQ160': 'pregnant_times', 'RHQ162': 'pregnant_diabaetes', 'RHQ163': 'pregnant_diabaetes_age',
+    'RHQ166': 'vaginal_deliveries', 'RHQ169': 'cesarean_deliveries', 'RHQ172': 'baby_weight_high',
+    'RHD173': 'baby_weight_high_age', 'RHQ171': 'live_births', 'RHD180': 'first_live_birth_age',
+    'RHD190': 'last_live_birth_age', 'RHD280': 'hysterectomy', 'RHQ291': 'hysterectomy_age',
+    'RHQ305': 'ovaries_removed', 'RHQ332': 'ovaries_removed_age', 'RHQ420': 'birth_control',
+    'RHQ540': 'female_hormones',
+    'RIAGENDR': 'gender', 'RIDAGEYR': 'age_years', 'RIDRETH3': 'race', 'DMDMARTL': 'marital_status',
+    'RIDEXPRG': 'pregnancy_status', 'DMDHHSIZ': 'household_size', 'DMDFMSIZ': 'family_size',
+    'INDFMPIR': 'income_poverty_ratio',
+}
+OUTPUT_COLUMNS = list(RAW_COLUMNS.values())
+
+# Variables that stand in for a missing one, with their recoding. Cycles
+# before 2011-2012 only have RIDRETH1, whose 5 ("other race, including
+# multi-racial") is RIDRETH3's 7.
+FALLBACK_COLUMNS = {'RIDRETH1': ('race', {5: 7})}
+
+# (mass column, molar column, molar units per mass unit), from the molar masses
+METAL_UNITS = [
+    ('lead_µg/dL', 'lead_µmol/L', 10 / 207.2),
+    ('cadmium_µg/L', 'cadmium_nmol/L', 1000 / 112.41),
+    ('mercury_µg/L', 'mercury_nmol/L', 1000 / 200.59),
+    ('selenium_µg/L', 'selenium_µmol/L', 1 / 78.97),
+    ('manganese_µg/L', 'manganese_nmol/L', 1000 / 54.94),
+]
+
+# Age is top-coded at 80 from 2007-2008 on, at 85 before
+TOP_CODES = {'age_years': 80}
+
+SCHEMA = pa.schema([(column, pa.float32() if column in CODED_COLUMNS else pa.float64())
+                    for column in OUTPUT_COLUMNS] + [('cycle', pa.string())])
+
+
+# --- Harmonization ---
+def harmonize(chunk, cycle):
+    """A raw chunk in the ingested schema: renamed, units filled in, codes mapped, tagged with its cycle."""
+    chunk = chunk.rename(columns=RAW_COLUMNS)
+    for raw, (column, codes) in FALLBACK_COLUMNS.items():
+        if raw in chunk.columns and column not in chunk.columns:
+            chunk[column] = chunk[raw].replace(codes)
+    frame = chunk.reindex(columns=OUTPUT_COLUMNS).astype('float64')
+    # SAS transport files store zero as 5.4e-79
+    frame = frame.mask(frame.abs() < 1e-70, 0.0)
+
+    for mass, molar, factor in METAL_UNITS:
+        frame[molar] = frame[molar].fillna(frame[mass] * factor)
+        frame[mass] = frame[mass].fillna(frame[molar] / factor)
+    for column, top in TOP_CODES.items():
+        frame[column] = frame[column].clip(upper=top)
+
+    frame = optimize_dtypes(frame)
+    frame['cycle'] = cycle
+    return frame
+
+
+def _partition_values(values):
+    return values.astype('Int64').astype(str).replace('<NA>', NULL_PARTITION)
+
+
+# --- Partition files ---
+class _PartitionWriter:
+    """Appends chunks to one partition file and keeps its column statistics."""
+
+    def __init__(self, target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        self._writer = pq.ParquetWriter(target, SCHEMA)
+        self.rows = 0
+        self.nulls = np.zeros(len(OUTPUT_COLUMNS), dtype=np.int64)
+        self.min = np.full(len(OUTPUT_COLUMNS), np.nan)
+        self.max = np.full(len(OUTPUT_COLUMNS), np.nan)
+
+    def write(self, frame):
+        self._writer.write_table(pa.Table.from_pandas(frame, schema=SCHEMA, preserve_index=False))
+        values = frame[OUTPUT_COLUMNS]
+        self.rows += len(frame)
+        self.nulls += values.isna().sum().to_numpy()
+        self.min = np.fmin(self.min, values.min().to_numpy(dtype=float))
+        self.max = np.fmax(self.max, values.max().to_numpy(dtype=float))
+
+    def close(self):
+        self._writer.close()
+
+    def entry(self, path, partition):
+        """The file's manifest entry: location, partition values, rows and [min, max, nulls] per column."""
+        def number(value):
+            return None if np.isnan(value) else float(value)
+
+        stats = {column: [number(lo), number(hi), int(nulls)]
+                 for column, lo, hi, nulls in zip(OUTPUT_COLUMNS, self.min, self.max, self.nulls)}
+        stats['cycle'] = [partition['cycle'], partition['cycle'], 0]
+        return {'path': path, 'partition': partition, 'rows': self.rows, 'stats': stats}
+
+
+def _read_chunks(source, chunk_rows):
+    if source.lower().endswith('.xpt'):
+        return pd.read_sas(source, format='xport', chunksize=chunk_rows)
+    return pd.read_csv(source, chunksize=chunk_rows)
+
+
+def ingest_cycle(source, cycle, out, chunk_rows=CHUNK_ROWS):
+    """Ingests one cycle's file into its partitions under `out`; returns their manifest entries.
+
+    The partitions are written to a staging directory next to `out` and
+    replace the cycle's previous partitions once complete.
+    """
+    cycle_dir = f"cycle={cycle}"
+    staging = os.path.join(f"{os.path.normpath(out)}.staging", cycle_dir)
+    shutil.rmtree(staging, ignore_errors=True)
+    writers = {}
+    try:
+        with _read_chunks(source, chunk_rows) as chunks:
+            for chunk in chunks:
+                frame = harmonize(chunk, cycle)
+                keys = [_partition_values(frame['gender']), _partition_values(frame['age_years'] // 10 * 10)]
+                for (gender, age_band), part in frame.groupby(keys, sort=False):
+                    if (gender, age_band) not in writers:
+                        target = os.path.join(staging, f"gender={gender}", f"age_band={age_band}", 'part-0.parquet')
+                        writers[gender, age_band] = _PartitionWriter(target)
+                    writers[gender, age_band].write(part)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    target = os.path.join(out, cycle_dir)
+    shutil.rmtree(target, ignore_errors=True)
+    os.makedirs(out, exist_ok=True)
+    os.replace(staging, target)
+    shutil.rmtree(os.path.dirname(staging), ignore_errors=True)
+    return [writer.entry('/'.join([cycle_dir, f"gender={gender}", f"age_band={age_band}", 'part-0.parquet']),
+                         {'cycle': cycle, 'gender': gender, 'age_band': age_band})
+            for (gender, age_band), writer in sorted(writers.items())]
+
+
+# --- Manifest and incremental runs ---
+def read_manifest(out):
+    """The manifest of an ingested directory, or an empty one."""
+    try:
+        with open(os.path.join(out, MANIFEST_NAME), encoding='utf-8') as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {'partition_columns': PARTITION_COLUMNS, 'sources': {}, 'files': []}
+
+
+def _write_manifest(out, manifest):
+    target = os.path.join(out, MANIFEST_NAME)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, indent=1)
+    os.replace(tmp, target)
+
+
+def cycle_sources(sources):
+    """{cycle: path} for CYCLE=PATH arguments, files (cycle = file name stem) and directories of files."""
+    found = {}
+    for source in sources:
+        if '=' in source:
+            cycle, path = source.split('=', 1)
+            found[cycle] = path
+        elif os.path.isdir(source):
+            for name in sorted(os.listdir(source)):
+                if name.lower().endswith(SOURCE_EXTENSIONS):
+                    found[name.split('.')[0]] = os.path.join(source, name)
+        else:
+            found[os.path.basename(source).split('.')[0]] = source
+    return found
+
+
+def ingest(sources, out=INGEST_DIR, chunk_rows=CHUNK_ROWS, full=False):
+    """Ingests the new or changed cycles of `sources` into `out`; returns {cycle: seconds} of those processed.
+
+    A source whose size and mtime match the manifest is skipped outright;
+    otherwise its contents are hashed and only re-ingested if they changed.
+    The manifest is rewritten after every cycle, so an interrupted run keeps
+    the cycles it finished. With `full=True` every source is re-ingested and
+    cycles that are no longer listed are dropped.
+    """
+    manifest = read_manifest(out)
+    if full:
+        manifest['sources'], manifest['files'] = {}, []
+    processed = {}
+    for cycle, source in cycle_sources(sources).items():
+        stat = os.stat(source)
+        known = manifest['sources'].get(cycle)
+        if known and (known['size'], known['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+            continue
+        digest = file_hash(source)
+        if known and known['sha1'] == digest:
+            continue
+
+        start = time.perf_counter()
+        entries = ingest_cycle(source, cycle, out, chunk_rows)
+        manifest['files'] = [entry for entry in manifest['files'] if entry['partition']['cycle'] != cycle] + entries
+        manifest['sources'][cycle] = {'path': source, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                      'sha1': digest, 'rows': sum(entry['rows'] for entry in entries)}
+        _write_manifest(out, manifest)
+        processed[cycle] = time.perf_counter() - start
+
+    if full and os.path.isdir(out):
+        for name in os.listdir(out):
+            if name.startswith('cycle=') and name[len('cycle='):] not in manifest['sources']:
+                shutil.rmtree(os.path.join(out, name))
+        _write_manifest(out, manifest)
+    return processed
+
+
+# --- Reading ---
+def _may_match(stats, rows, op, value):
+    """Whether a file with column statistics [min, max, nulls] can hold a row passing (op, value)."""
+    lo, hi, nulls = stats
+    if op == 'notnull':
+        return nulls < rows
+    if lo is None:
+        return False  # the column is missing throughout, and missing values never match
+    if op == '==':
+        return lo <= value <= hi
+    if op == '!=':
+        return not lo == hi == value
+    if op == '<':
+        return lo < value
+    if op == '<=':
+        return lo <= value
+    if op == '>':
+        return hi > value
+    if op == '>=':
+        return hi >= value
+    if op == 'between':
+        return hi >= value[0] and lo <= value[1]
+    if op == 'in':
+        return any(lo <= v <= hi for v in value)
+    raise ValueError(f"Unknown filter op {op!r}")
+
+
+def prune_files(out, filters=None):
+    """Manifest entries of the files that may hold rows passing every backend filter triple."""
+    return [entry for entry in read_manifest(out)['files']
+            if all(column not in entry['stats'] or _may_match(entry['stats'][column], entry['rows'], op, value)
+                   for column, op, value in filters or ())]
+
+
+def read_ingested(out, columns=None, filters=None):
+    """The rows of the ingested files that may match `filters` (see prune_files).
+
+    Files are pruned on their statistics only; the rows of the kept files
+    are returned unfiltered.
+    """
+    frames = [pd.read_parquet(os.path.join(out, entry['path']), columns=columns)
+              for entry in prune_files(out, filters)]
+    if not frames:
+        return SCHEMA.empty_table().to_pandas()[columns or SCHEMA.names]
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sources', nargs='+', help="cycle files, directories of them, or CYCLE=PATH")
+    parser.add_argument('--out', default=INGEST_DIR)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--full', action='store_true',
+                        help="re-ingest every cycle and drop cycles that are no longer listed")
+    args = parser.parse_args()
+
+    processed = ingest(args.sources, args.out, chunk_rows=args.chunk_rows, full=args.full)
+    manifest = read_manifest(args.out)
+    for cycle, info in sorted(manifest['sources'].items()):
+        status = f"ingested in {processed[cycle]:.1f} s" if cycle in processed else "unchanged"
+        print(f"{cycle}: {info['rows']} rows, {status}")
+    print(f"{len(manifest['files'])} partition files in {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Figures of the Key Insights dashboard, built from the shared aggregates.
+
+Every chart is a function of its widget values only, and those values come
+from small fixed option lists, so the whole stakeholder surface can be
+enumerated (insight_combinations) and rendered ahead of time (prewarm.py).
+Charts are served through the figure cache under their INSIGHT_CHARTS id.
+Every chart also comes in a survey-weighted variant, built from the
+weighted aggregates. Rates, medians and trendlines carry the bootstrap
+confidence intervals of bootstrap.py. A cohort from the sidebar's cross-filter
+(cohort.py) restricts any chart to the cohort's rows.
+"""
+from aggregates import load_insight_aggregates
+from backend import load_backend
+from bootstrap import load_bootstrap
+from charts import (DENSITY_BINS, DENSITY_SAMPLE, DENSITY_THRESHOLD, density_scatter_figure, scatter_figure,
+                    summary_box_figure, summary_violin_figure)
+from cohort import cohort_backend
+from data_loader import HORMONE_COLUMNS, METAL_COLUMNS, WEIGHT_COLUMN
+from figure_cache import cached_figure
+
+
+def _blood_label(metal):
+    return f"Blood {metal.split('_')[0].capitalize()} Concentration"
+
+
+def _title(text, weighted, cohort=()):
+    notes = ['survey-weighted'] * bool(weighted) + ['cohort'] * bool(cohort)
+    return f"{text} ({', '.join(notes)})" if notes else text
+
+
+def _pair_scatter(x, y, filters, path=None, cohort=(), **kwargs):
+    """scatter_figure of the rows passing `filters` with both x and y present.
+
+    Above DENSITY_THRESHOLD rows the backend bins and samples them, so only
+    the bin counts and DENSITY_SAMPLE rows leave the query engine.
+    """
+    backend = cohort_backend(cohort, path)
+    filters = filters + [(x, 'notnull', None), (y, 'notnull', None)]
+    if backend.count(filters) <= DENSITY_THRESHOLD:
+        return scatter_figure(backend.fetch([x, y], filters=filters), x=x, y=y, **kwargs)
+    counts, xedges, yedges = backend.histogram2d(x, y, DENSITY_BINS, filters)
+    sample = backend.stratified_sample(x, y, xedges, yedges, DENSITY_SAMPLE, filters)
+    return density_scatter_figure(counts, xedges, yedges, sample, x, y, **kwargs)
+
+
+def hormone_heatmap(path=None, weighted=False, cohort=()):
+    """Correlation heatmap of the metals against the hormones."""
+    # plotly.express is imported on first use rather than on startup
+    import plotly.express as px
+    return px.imshow(
+        load_insight_aggregates(path, weighted, cohort)['hormone_corr', None, None],
+        text_auto=".2f",
+        aspect="auto",
+        title=_title("Correlation Heatmap: Heavy Metals vs. Hormones", weighted, cohort),
+        color_continuous_scale='RdBu_r',  # Red-Blue diverging scale
+        zmin=-1, zmax=1  # Set the color scale to be from -1 to 1
+    )
+
+
+def hormone_scatter(metal, hormone, path=None, weighted=False, cohort=()):
+    """Metal vs. hormone scatter (density mode for large data) with its OLS trendline."""
+    return _pair_scatter(
+        metal, hormone, [], path, cohort,
+        trendline=load_insight_aggregates(path, weighted, cohort)['trendline', metal, hormone],
+        trendline_ci=load_bootstrap(path, weighted, cohort).get(('trendline', metal, hormone)),
+        title=_title(f"Relationship between {metal} and {hormone}", weighted, cohort),
+        labels={metal: _blood_label(metal), hormone: f"{hormone.capitalize()} Level"}
+    )
+
+
+def fertility_box(metal, path=None, weighted=False, cohort=()):
+    """Metal distribution of the fertile and infertile groups."""
+    aggregates = load_insight_aggregates(path, weighted, cohort)
+    return summary_box_figure(
+        aggregates['fertility_box', metal, None],
+        details=aggregates['fertility_box_detail', metal, None],  # capped outlier points
+        median_ci=load_bootstrap(path, weighted, cohort).get(('fertility_box', metal, None)),
+        order=["Yes", "No"],
+        title=_title(f"Distribution of {metal} for Fertile and Infertile Groups", weighted, cohort),
+        category_label="Reported Infertility (1 Year+)",
+        value_label=_blood_label(metal)
+    )
+
+
+def infertility_rate(path=None, weighted=False, cohort=()):
+    """Bar chart of the infertility rate per age group, with bootstrap error bars."""
+    import plotly.express as px
+    rate = load_insight_aggregates(path, weighted, cohort)['infertility_rate', None, None]
+    ci = load_bootstrap(path, weighted, cohort).get(('infertility_rate', None, None))
+    errors = {}
+    if ci is not None:
+        rate = rate.join(ci, on='age_group')
+        rate = rate.assign(error_plus=rate['ci_high'] - rate['Infertility Rate (%)'],
+                           error_minus=rate['Infertility Rate (%)'] - rate['ci_low'])
+        errors = {'error_y': 'error_plus', 'error_y_minus': 'error_minus',
+                  'hover_data': {'ci_low': ':.1f', 'ci_high': ':.1f', 'error_plus': False, 'error_minus': False}}
+    return px.bar(
+        rate,
+        x='age_group',
+        y='Infertility Rate (%)',
+        **errors,
+        title=_title('Infertility Rate by Age Group', weighted, cohort),
+        labels={'age_group': 'Age Group', 'Infertility Rate (%)': 'Infertility Rate (%)',
+                'ci_low': '95% CI low (%)', 'ci_high': '95% CI high (%)'}
+    )
+
+
+def menstrual_raincloud(metal, show_points, path=None, weighted=False, cohort=()):
+    """Raincloud of a metal for regular vs. irregular cycles."""
+    aggregates = load_insight_aggregates(path, weighted, cohort)
+    fig = summary_violin_figure(
+        aggregates['menstrual_box', metal, None],
+        aggregates['menstrual_box_detail', metal, None],
+        show_points=show_points,
+        median_ci=load_bootstrap(path, weighted, cohort).get(('menstrual_box', metal, None)),
+        title=_title(f"Raincloud Plot: {metal} for Regular vs. Irregular Cycles", weighted, cohort),
+        category_label="Regular Menstrual Periods"
+    )
+    return fig.update_layout(showlegend=False)
+
+
+def menarche_box(metal, path=None, weighted=False, cohort=()):
+    """Horizontal boxes of a metal per age of first period (8-20)."""
+    aggregates = load_insight_aggregates(path, weighted, cohort)
+    summary = aggregates['menarche_box', metal, None]
+    return summary_box_figure(
+        summary,
+        details=aggregates['menarche_box_detail', metal, None],
+        median_ci=load_bootstrap(path, weighted, cohort).get(('menarche_box', metal, None)),
+        order=sorted(summary.index, key=float),  # ages in numerical order
+        horizontal=True,  # Discrete age on the y-axis, metal level on the x-axis
+        title=_title(f"Distribution of {metal} by Age of First Period", weighted, cohort),
+        category_label="Age of First Period",
+        value_label=_blood_label(metal)
+    )
+
+
+def menopause_scatter(metal, path=None, weighted=False, cohort=()):
+    """Metal vs. age of last period over the valid menopause rows (age < 100), with its OLS trendline."""
+    return _pair_scatter(
+        metal, 'last_period_age', [('last_period_age', '<', 100)], path, cohort,
+        trendline=load_insight_aggregates(path, weighted, cohort)['trendline', metal, 'last_period_age'],
+        trendline_ci=load_bootstrap(path, weighted, cohort).get(('trendline', metal, 'last_period_age')),
+        title=_title(f"Relationship between {metal} and Age of Last Period", weighted, cohort),
+        labels={"last_period_age": "Age of Last Menstrual Period", metal: _blood_label(metal)}
+    )
+
+
+INSIGHT_CHARTS = {
+    'hormone_heatmap': hormone_heatmap,
+    'hormone_scatter': hormone_scatter,
+    'fertility_box': fertility_box,
+    'infertility_rate': infertility_rate,
+    'menstrual_raincloud': menstrual_raincloud,
+    'menarche_box': menarche_box,
+    'menopause_scatter': menopause_scatter,
+}
+
+
+def insight_figure(chart_id, *params, path=None, weighted=False, cohort=()):
+    """The figure of INSIGHT_CHARTS[chart_id] for the given widget values, via the figure cache.
+
+    A `cohort` (see cohort.py) draws the chart over the cohort's rows only.
+    """
+    build = INSIGHT_CHARTS[chart_id]
+    key = params + ('weighted',) if weighted else params
+    if cohort:
+        key += (('cohort',) + cohort,)
+    # Cohort figures stay in memory only: ad-hoc cohorts would litter the figure directory
+    return cached_figure(chart_id, key, lambda: build(*params, path=path, weighted=weighted, cohort=cohort),
+                         path=path, persist=not cohort)
+
+
+def insight_combinations(path=None):
+    """Every (chart_id, params, weighted) the Key Insights widgets can request for the dataset.
+
+    The weighted variants are only offered when the dataset has WEIGHT_COLUMN.
+    """
+    columns = set(load_backend(path).columns())
+    metals = [col for col in METAL_COLUMNS if col in columns]
+    hormones = [col for col in HORMONE_COLUMNS if col in columns]
+    charts = [('hormone_heatmap', ()), ('infertility_rate', ())]
+    charts += [('hormone_scatter', (metal, hormone)) for metal in metals for hormone in hormones]
+    for metal in metals:
+        charts += [('fertility_box', (metal,)), ('menarche_box', (metal,)),
+                   ('menopause_scatter', (metal,)),
+                   ('menstrual_raincloud', (metal, True)), ('menstrual_raincloud', (metal, False))]
+    weightings = [False, True] if WEIGHT_COLUMN in columns else [False]
+    return [(chart_id, params, weighted) for weighted in weightings for chart_id, params in charts]
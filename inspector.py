@@ -0,0 +1,90 @@
+"""Server-side paging, sorting and filtering for the Raw Data Inspector.
+
+Only the visible page of rows is ever sent to the browser. Sorting and range
+filters are answered from per-column sort indexes (np.argsort, built once per
+dataset version and column), so a new page is a slice of a cached row order
+rather than a sort of the whole frame.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from data_loader import data_path, dataset_version, load_dataset
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _sort_index(path, version, column):
+    """Row positions ordered by `column` ascending (NaNs last) and the sorted values.
+
+    Categorical columns are ordered by their category codes and other
+    non-numeric columns (e.g. the ingested 'cycle') by their sorted distinct
+    values, so the sorted values are codes rather than the column's values.
+    """
+    series = load_dataset(path)[column]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.cat.codes.where(series.notna())
+    elif series.dtype.kind not in 'biuf':
+        codes, _ = pd.factorize(series, sort=True)
+        series = pd.Series(codes, index=series.index).where(codes >= 0)
+    values = series.to_numpy(dtype=float, na_value=np.nan)
+    order = np.argsort(values, kind='stable')
+    return order, values[order]
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _query_rows(path, version, sort_column, ascending, filter_column, low, high):
+    n_rows = len(load_dataset(path))
+    if filter_column is None:
+        rows = np.arange(n_rows)
+    else:
+        order, sorted_values = _sort_index(path, version, filter_column)
+        first = np.searchsorted(sorted_values, low, side='left')
+        last = np.searchsorted(sorted_values, high, side='right')
+        rows = np.sort(order[first:last])
+
+    if sort_column is not None:
+        order, sorted_values = _sort_index(path, version, sort_column)
+        n_valid = int(np.count_nonzero(~np.isnan(sorted_values)))
+        if not ascending:
+            # Descending, but keep NaNs at the end like pandas does
+            order = np.concatenate([order[:n_valid][::-1], order[n_valid:]])
+        rank = np.empty(n_rows, dtype=np.int64)
+        rank[order] = np.arange(n_rows)
+        rows = rows[np.argsort(rank[rows], kind='stable')]
+    return rows
+
+
+def query_rows(sort_column=None, ascending=True, filter_column=None, low=None, high=None, path=None):
+    """Row positions matching `low <= filter_column <= high`, ordered by `sort_column`."""
+    path = path or data_path()
+    return _query_rows(path, dataset_version(path), sort_column, ascending, filter_column, low, high)
+
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _page(path, version, sort_column, ascending, filter_column, low, high, page, page_size):
+    rows = _query_rows(path, version, sort_column, ascending, filter_column, low, high)
+    positions = rows[page * page_size:(page + 1) * page_size]
+    return load_dataset(path).iloc[positions]
+
+
+def inspector_page(page, page_size, sort_column=None, ascending=True, filter_column=None,
+                   low=None, high=None, path=None):
+    """Returns (page_frame, total_rows) for one page of the inspector query.
+
+    The page keeps the dataset's row labels, so rows can be traced back.
+    """
+    path = path or data_path()
+    version = dataset_version(path)
+    total = len(_query_rows(path, version, sort_column, ascending, filter_column, low, high))
+    frame = _page(path, version, sort_column, ascending, filter_column, low, high, page, page_size)
+    return frame, total
+
+
+def column_range(column, path=None):
+    """(min, max) of a numeric column, read from its sort index."""
+    path = path or data_path()
+    _, sorted_values = _sort_index(path, dataset_version(path), column)
+    valid = sorted_values[~np.isnan(sorted_values)]
+    if not len(valid):
+        return 0.0, 0.0
+    return float(valid[0]), float(valid[-1])
@@ -0,0 +1,109 @@
+"""Missing-value summaries built from bit-packed masks.
+
+The Data Overview tab used to ship df.isnull() to the browser as a full
+rows x columns image. Here the mask is packed to one bit per cell once per
+dataset version, and the views the tab needs are derived from it:
+  * missing counts per column,
+  * the fraction missing per block of rows, at any zoom level,
+  * counts of distinct co-missingness patterns across columns.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from data_loader import data_path, dataset_version, load_dataset
+from profiling import span
+from shared_cache import shared_result
+
+
+class MissingnessIndex:
+    """Bit-packed missing-value mask of a DataFrame."""
+
+    def __init__(self, df):
+        mask = df.isna().to_numpy()
+        self.columns = list(df.columns)
+        self.n_rows = len(df)
+        # One bit per cell, packed along the rows: shape (ceil(n / 8), n_columns)
+        self.packed = np.packbits(mask, axis=0)
+        # Running missing count per column at every 8-row boundary, so any
+        # byte-aligned row range is summed in O(1)
+        byte_counts = np.bitwise_count(self.packed).astype(np.int64)
+        self._cumulative = np.vstack([np.zeros((1, len(self.columns)), dtype=np.int64),
+                                      np.cumsum(byte_counts, axis=0)])
+        # Each row's mask packed across the columns is the key of its pattern;
+        # viewed as one opaque value per row, the patterns are counted with a
+        # 1-D unique once here rather than on every Data Overview rerun
+        row_keys = np.ascontiguousarray(np.packbits(mask, axis=1))
+        keys, counts = np.unique(row_keys.view(np.dtype((np.void, row_keys.shape[1]))).ravel(),
+                                 return_counts=True)
+        order = np.argsort(-counts, kind='stable')
+        self._pattern_keys = keys[order].view(np.uint8).reshape(len(keys), row_keys.shape[1])
+        self._pattern_counts = counts[order]
+
+    def column_missing(self):
+        """Missing count and fraction for every column."""
+        counts = self._cumulative[-1]
+        return pd.DataFrame({'missing': counts, 'fraction': counts / max(self.n_rows, 1)},
+                            index=pd.Index(self.columns, name='column'))
+
+    def block_fractions(self, start=0, stop=None, blocks=200):
+        """Fraction missing per column in `blocks` equal row blocks of [start, stop).
+
+        Returns (fractions, edges): a (blocks, n_columns) array and the
+        blocks + 1 row boundaries. Coarse blocks are summed from the packed
+        counts, so their edges snap to multiples of 8 rows (the outer ones
+        outwards); blocks shorter than a byte are read from the unpacked slice.
+        """
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        blocks = max(1, min(blocks, stop - start))
+        if (stop - start) / blocks >= 8:
+            byte_edges = np.round(np.linspace(start, stop, blocks + 1) / 8).astype(int)
+            # The outer edges round outwards, so the blocks cover every row of the range
+            byte_edges[0], byte_edges[-1] = start // 8, -(-stop // 8)
+            byte_edges = np.unique(np.minimum(byte_edges, len(self.packed)))
+            missing = np.diff(self._cumulative[byte_edges], axis=0)
+            edges = np.minimum(byte_edges * 8, self.n_rows)
+            rows = np.diff(edges)
+        else:
+            first, last = start // 8, (stop + 7) // 8
+            mask = np.unpackbits(self.packed[first:last], axis=0)[start - first * 8:stop - first * 8]
+            edges = np.unique(np.round(np.linspace(start, stop, blocks + 1)).astype(int))
+            cumulative = np.vstack([np.zeros((1, len(self.columns)), dtype=np.int64),
+                                    np.cumsum(mask, axis=0)])
+            missing = np.diff(cumulative[edges - start], axis=0)
+            rows = np.diff(edges)
+        return (missing / np.maximum(rows, 1)[:, None]).astype(np.float32), edges
+
+    def co_missing(self):
+        """Number of rows in which each pair of columns is missing together."""
+        counts = np.empty((len(self.columns), len(self.columns)), dtype=np.int64)
+        for i in range(len(self.columns)):
+            both = np.bitwise_and(self.packed[:, [i]], self.packed)
+            counts[i] = np.bitwise_count(both).sum(axis=0)
+        return pd.DataFrame(counts, index=self.columns, columns=self.columns)
+
+    def patterns(self, top=20):
+        """The `top` most frequent combinations of missing columns, with row counts."""
+        counts = self._pattern_counts[:top]
+        missing = np.unpackbits(self._pattern_keys[:top], axis=1, count=len(self.columns)).astype(bool)
+        return pd.DataFrame({
+            'rows': counts,
+            'share': counts / max(self.n_rows, 1),
+            'missing columns': missing.sum(axis=1),
+            'pattern': [', '.join(np.array(self.columns)[row]) or '(complete)' for row in missing],
+        })
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_missingness_cached(path, version):
+    def build():
+        df = load_dataset(path)
+        with span("compute:missingness index", 'compute'):
+            return MissingnessIndex(df)
+    return shared_result("missingness index", path, version, build)
+
+
+def load_missingness(path=None):
+    """Returns the shared MissingnessIndex for the current dataset version."""
+    path = path or data_path()
+    return _load_missingness_cached(path, dataset_version(path))
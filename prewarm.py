@@ -0,0 +1,154 @@
+"""Renders every Key Insights chart ahead of the first visitor.
+
+The stakeholder widgets only offer small fixed option lists, so every figure
+they can request is known up front (insight_figures.insight_combinations).
+prewarm() builds the shared aggregates and bootstrap intervals once and
+then renders all of those figures, unweighted and survey-weighted, in a
+worker pool, filling the in-memory figure cache and its files on disk.
+
+The app starts it in a background thread whenever a new dataset version is
+first loaded (start_prewarm). It can also run offline as a build step, which
+leaves the Parquet copy and the figure files in the cache directory for the
+server to pick up:
+
+    python prewarm.py [--data final_cleaned.csv] [--workers 4] [--processes]
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import streamlit as st
+
+from aggregates import load_insight_aggregates
+from bootstrap import load_bootstrap
+from data_loader import data_path, dataset_version
+from figure_cache import figure_dir
+from insight_figures import insight_combinations, insight_figure
+
+PREWARM = os.environ.get('REPROSIGHT_PREWARM', '1') != '0'
+PREWARM_WORKERS = 4
+# Warns on every cache call from a thread without a session, as the prewarm threads are
+CONTEXT_LOGGER = 'streamlit.runtime.scriptrunner_utils.script_run_context'
+
+
+class PrewarmJob:
+    """Progress of one prewarm run, shown in the admin panel."""
+
+    def __init__(self):
+        self.total = 0
+        self.done = 0
+        self.failed = []
+        self.seconds = None
+        self.error = None
+
+    @property
+    def finished(self):
+        return self.seconds is not None
+
+
+class _PrewarmThreads(logging.Filter):
+    """Drops the records of the prewarm threads, so the server's own warnings still get through."""
+
+    def filter(self, record):
+        return not record.threadName.startswith('prewarm')
+
+
+logging.getLogger(CONTEXT_LOGGER).addFilter(_PrewarmThreads())
+
+
+def _quiet_process():
+    # A pool process only renders figures; bare-mode cache calls warn on every hit
+    logging.disable(logging.WARNING)
+
+
+def _render_chunk(path, combinations):
+    """Renders (chart_id, params, weighted) combinations; returns the failures with their errors."""
+    failed = []
+    for chart_id, params, weighted in combinations:
+        try:
+            insight_figure(chart_id, *params, path=path, weighted=weighted)
+        except Exception as err:
+            failed.append((chart_id, params + ('weighted',) if weighted else params, repr(err)))
+    return failed
+
+
+def prewarm(path=None, workers=PREWARM_WORKERS, processes=False, job=None):
+    """Renders every Key Insights figure for the dataset at `path`; returns the PrewarmJob.
+
+    Threads share this process's caches directly. With `processes=True`
+    each worker loads the dataset, aggregates and intervals itself and its figures
+    reach this process through their files on disk, which the figure cache
+    reads on first use.
+    """
+    path = path or data_path()
+    job = job or PrewarmJob()
+    start = time.perf_counter()
+    combinations = insight_combinations(path)
+    for weighted in sorted({weighted for _, _, weighted in combinations}):
+        load_insight_aggregates(path, weighted)
+        load_bootstrap(path, weighted)
+    job.total = len(combinations)
+
+    if processes:
+        pool = ProcessPoolExecutor(workers, initializer=_quiet_process)
+        chunks = [combinations[i::workers] for i in range(workers)]
+    else:
+        pool = ThreadPoolExecutor(workers, thread_name_prefix='prewarm')
+        chunks = [[c] for c in combinations]
+    with pool:
+        for chunk, failed in zip(chunks, pool.map(_render_chunk, [path] * len(chunks), chunks)):
+            job.failed += failed
+            job.done += len(chunk)
+    job.seconds = time.perf_counter() - start
+    return job
+
+
+def _prewarm_in_background(path, job):
+    start = time.perf_counter()
+    try:
+        prewarm(path, job=job)
+    except Exception as err:
+        job.error = repr(err)
+    finally:
+        job.seconds = time.perf_counter() - start
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _start_prewarm_cached(path, version):
+    job = PrewarmJob()
+    threading.Thread(target=_prewarm_in_background, args=(path, job), name='prewarm', daemon=True).start()
+    return job
+
+
+def start_prewarm(path=None):
+    """Starts a background prewarm once per dataset version; returns its PrewarmJob.
+
+    Returns None when disabled with REPROSIGHT_PREWARM=0.
+    """
+    if not PREWARM:
+        return None
+    path = path or data_path()
+    return _start_prewarm_cached(path, dataset_version(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=None, help="dataset CSV (default: REPROSIGHT_DATA or final_cleaned.csv)")
+    parser.add_argument('--workers', type=int, default=PREWARM_WORKERS)
+    parser.add_argument('--processes', action='store_true', help="use a process pool instead of threads")
+    args = parser.parse_args()
+    # Bare-mode cache calls warn about the missing ScriptRunContext on every hit
+    logging.disable(logging.WARNING)
+
+    job = prewarm(args.data, workers=args.workers, processes=args.processes)
+    print(f"prewarmed {job.done - len(job.failed)}/{job.total} figures in {job.seconds:.2f} s "
+          f"into {figure_dir(args.data)}")
+    for chart_id, params, error in job.failed:
+        print(f"  failed: {chart_id}{params}: {error}")
+
+
+if __name__ == '__main__':
+    main()
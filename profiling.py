@@ -0,0 +1,217 @@
+"""Timing and memory spans for every part of a rerun.
+
+span() times a block and records how much the process's resident memory
+grew while it ran. Spans nest: each record keeps its parent's name, so a
+section's time can be split into the figures it built and the charts it
+sent. Kinds in use:
+  * 'load'    - dataset / backend loading on every rerun (cache hits included)
+  * 'compute' - cold computations inside the cached builders (aggregates,
+                bootstrap, correlations, missingness, ...)
+  * 'section' - one dashboard section of a rerun
+  * 'figure'  - a figure served by the figure cache (payload bytes included),
+                with a 'build' span inside when it had to be built
+  * 'chart'   - one st.plotly_chart call with its payload bytes: the size
+                the figure cache recorded, else (with the Performance view
+                open) a 'serialize' span that measured it
+  * 'export'  - one background export job (see export.py)
+  * 'shared'  - a result looked up in the cache directory shared by the
+                server processes, with the 'compute' span inside when it
+                had to be built (see shared_cache.py)
+
+Records go to a process-wide ring buffer (PROFILE_SPANS) that the hidden
+Performance view (?perf=1) summarizes as per-span percentiles and exports as
+JSON or CSV. With REPROSIGHT_PROFILE_LOG set they are also appended to that
+file as JSON lines. REPROSIGHT_PROFILE=0 turns recording off.
+
+Memory is the process's current RSS (/proc/self/statm), so with several
+sessions running at once a span's delta includes their allocations too.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+PROFILE = os.environ.get('REPROSIGHT_PROFILE', '1') != '0'
+PROFILE_LOG = os.environ.get('REPROSIGHT_PROFILE_LOG')
+PROFILE_SPANS = 20000
+PERCENTILES = [0.5, 0.9, 0.99]
+# Figure attribute holding its JSON payload size (see record_payload)
+PAYLOAD_ATTR = '_reprosight_payload_bytes'
+RECORD_COLUMNS = ['time', 'session', 'kind', 'name', 'parent', 'ms', 'rss_mb', 'rss_delta_mb', 'bytes']
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_current = contextvars.ContextVar('reprosight_span', default=None)
+
+
+def _rss():
+    """Resident memory of this process in bytes, or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm', 'rb') as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return None
+
+
+def _session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+
+class Profiler:
+    """Thread-safe ring buffer of span records, optionally mirrored to a JSON-lines file."""
+
+    def __init__(self, max_spans=PROFILE_SPANS, log_path=PROFILE_LOG):
+        self._records = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+        self.log_path = log_path
+
+    def add(self, record):
+        with self._lock:
+            self._records.append(record)
+            if self.log_path:
+                with open(self.log_path, 'a', encoding='utf-8') as fh:
+                    fh.write(json.dumps(record) + '\n')
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def frame(self):
+        """All records as a DataFrame with RECORD_COLUMNS."""
+        with self._lock:
+            records = list(self._records)
+        return pd.DataFrame(records, columns=RECORD_COLUMNS)
+
+
+@st.cache_resource(show_spinner=False)
+def load_profiler():
+    """The Profiler shared by all sessions of this server process."""
+    return Profiler()
+
+
+class Span:
+    """One open span; `name` may be refined until it closes (see name_span)."""
+
+    def __init__(self, name, kind, parent):
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.bytes = None
+
+
+@contextmanager
+def span(name, kind='section'):
+    """Times the block and records it with its memory growth; yields the Span."""
+    parent = _current.get()
+    current = Span(name, kind, parent.name if parent else None)
+    if not PROFILE:
+        yield current
+        return
+    token = _current.set(current)
+    rss_start, start = _rss(), time.perf_counter()
+    try:
+        yield current
+    finally:
+        seconds = time.perf_counter() - start
+        rss = _rss()
+        _current.reset(token)
+        load_profiler().add({
+            'time': time.time(), 'session': _session_id(), 'kind': current.kind, 'name': current.name,
+            'parent': current.parent, 'ms': seconds * 1e3,
+            'rss_mb': rss / 2 ** 20 if rss is not None else None,
+            'rss_delta_mb': (rss - rss_start) / 2 ** 20 if rss is not None and rss_start is not None else None,
+            'bytes': current.bytes,
+        })
+
+
+def name_span(name):
+    """Renames the innermost open span, e.g. once a section radio has been read."""
+    current = _current.get()
+    if current is not None:
+        current.name = name
+
+
+def record_payload(fig, size):
+    """Remembers the JSON payload size of `fig`, e.g. the figure cache's, for payload_size."""
+    setattr(fig, PAYLOAD_ATTR, size)
+    return fig
+
+
+def payload_size(fig, name=None):
+    """JSON payload bytes of `fig`, or None if unknown.
+
+    A size from record_payload is free. Otherwise it takes one extra
+    plotly.io.to_json, in a 'serialize' span, so it is only measured while
+    the Performance view is open (?perf=1).
+    """
+    size = getattr(fig, PAYLOAD_ATTR, None)
+    if size is None and 'perf' in st.query_params:
+        import plotly.io
+
+        with span(f"serialize:{name or fig.layout.title.text or 'untitled'}", 'serialize') as serialize:
+            size = serialize.bytes = len(plotly.io.to_json(fig, validate=False))
+        record_payload(fig, size)
+    return size
+
+
+def plotly_chart(fig, name=None, container=st, **kwargs):
+    """st.plotly_chart inside a 'chart' span that records the figure's payload_size."""
+    name = name or (fig.layout.title.text or 'untitled')
+    with span(f"chart:{name}", 'chart') as chart:
+        if PROFILE:
+            chart.bytes = payload_size(fig, name)
+        return container.plotly_chart(fig, **kwargs)
+
+
+# --- Summary and export ---
+def span_summary(records):
+    """Count, percentiles (ms), mean memory growth and payload size per (kind, name)."""
+    if records.empty:
+        return pd.DataFrame()
+    grouped = records.groupby(['kind', 'name'], sort=False)
+    summary = grouped['ms'].agg(count='count', mean_ms='mean', max_ms='max')
+    quantiles = grouped['ms'].quantile(PERCENTILES).unstack()
+    for q in PERCENTILES:
+        summary[f"p{round(q * 100)}_ms"] = quantiles[q]
+    summary['rss_delta_mb'] = grouped['rss_delta_mb'].mean()
+    summary['payload_kb'] = grouped['bytes'].mean() / 1024
+    columns = ['count', 'mean_ms'] + [f"p{round(q * 100)}_ms" for q in PERCENTILES] + ['max_ms', 'rss_delta_mb',
+                                                                                       'payload_kb']
+    return summary[columns].sort_values('p90_ms', ascending=False)
+
+
+def performance_page():
+    """The hidden Performance view: per-span percentiles and the raw log for export."""
+    st.title("Performance")
+    profiler = load_profiler()
+    records = profiler.frame()
+    if not PROFILE:
+        st.info("Profiling is off (REPROSIGHT_PROFILE=0).")
+    st.caption(f"{len(records):,} spans recorded (last {PROFILE_SPANS:,} kept)"
+               + (f" · logging to {profiler.log_path}" if profiler.log_path else ""))
+
+    kinds = sorted(records['kind'].dropna().unique()) if not records.empty else []
+    chosen = st.multiselect("Kinds", kinds, default=kinds, key="perf_kinds")
+    records = records[records['kind'].isin(chosen)]
+    # Rounded rather than styled: DataFrame.style imports matplotlib
+    st.dataframe(span_summary(records).round(1), use_container_width=True)
+
+    col1, col2, col3 = st.columns(3)
+    col1.download_button("Export JSON", records.to_json(orient='records', lines=True),
+                         file_name="reprosight_spans.jsonl", mime="application/json")
+    col2.download_button("Export CSV", records.to_csv(index=False),
+                         file_name="reprosight_spans.csv", mime="text/csv")
+    if col3.button("Reset"):
+        profiler.clear()
+        st.rerun()
+
+    with st.expander("Latest spans"):
+        st.dataframe(records.tail(200).iloc[::-1], use_container_width=True, hide_index=True)
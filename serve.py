@@ -0,0 +1,123 @@
+"""Runs the dashboard as several server processes sharing one dataset and one cache.
+
+    python serve.py [--workers 4] [--port 8501] [--data final_cleaned.csv]
+                    [--no-prepare] [--private] [-- <streamlit run options>]
+
+Streamlit serves every session of a server from one process, so scaling out
+means running more processes. Each worker is a `streamlit run app.py` on its
+own port (port, port + 1, ...) started with REPROSIGHT_SHARED=1:
+  * the dataset is memory-mapped from one uncompressed Arrow copy
+    (data_loader.map_dataset), so the workers share its pages in the OS page
+    cache instead of each holding a private frame,
+  * aggregates, bootstrap intervals, correlations and summaries are stored
+    once in the cache directory (shared_cache.py) and figures are read from
+    their files (figure_cache.py), so one worker's cold work warms the others.
+Before the workers start, this process builds the Arrow copy, the shared
+results and every Key Insights figure (prewarm.py), so none of them starts
+cold; --no-prepare skips that. --private starts the workers without
+REPROSIGHT_SHARED, for comparing memory use (see benchmarks/bench_concurrency.py).
+
+A worker that exits is restarted. Sessions live in one worker, so a load
+balancer in front of them must keep each browser on the same worker (sticky
+sessions, e.g. nginx `hash $remote_addr`) and proxy the WebSocket upgrade of
+/_stcore/stream.
+"""
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+POLL_SECONDS = 1.0
+
+
+def prepare(path=None):
+    """Builds everything the workers share: the Arrow copy, stored results and prewarmed figures.
+
+    Must run with REPROSIGHT_SHARED=1 set before the app modules are imported.
+    """
+    from backend import load_backend
+    from correlation import load_correlations, load_screening
+    from data_loader import WEIGHT_COLUMN, data_path, dataset_version, ensure_arrow
+    from missingness import load_missingness
+    from prewarm import prewarm
+    from univariate import load_column_summaries
+
+    path = path or data_path()
+    start = time.perf_counter()
+    ensure_arrow(path, dataset_version(path))
+    load_column_summaries(path)
+    load_missingness(path)
+    # The weighted variants only exist for datasets with the sampling weights, as in the app
+    weightings = [False, True] if WEIGHT_COLUMN in load_backend(path).columns() else [False]
+    for weighted in weightings:
+        load_correlations('pearson', path, weighted)
+        load_screening(False, path, weighted)
+    job = prewarm(path)
+    print(f"prepared {path}: {job.done - len(job.failed)}/{job.total} figures "
+          f"in {time.perf_counter() - start:.1f} s", flush=True)
+
+
+def worker_env(data=None, shared=True, prepared=True):
+    """The environment of a worker process."""
+    env = dict(os.environ, REPROSIGHT_SHARED='1' if shared else '0')
+    if data:
+        env['REPROSIGHT_DATA'] = data
+    if prepared:
+        # The figures are on disk already; a background prewarm per worker would only reread them
+        env['REPROSIGHT_PREWARM'] = '0'
+    return env
+
+
+def start_worker(port, env, streamlit_args=()):
+    return subprocess.Popen([sys.executable, '-m', 'streamlit', 'run', APP, '--server.port', str(port),
+                             '--server.headless', 'true', *streamlit_args], env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8501, help="port of the first worker")
+    parser.add_argument('--data', default=None, help="dataset CSV (default: REPROSIGHT_DATA or final_cleaned.csv)")
+    parser.add_argument('--no-prepare', action='store_true', help="start the workers without building the shared cache")
+    parser.add_argument('--private', action='store_true', help="give every worker its own dataset copy and caches")
+    args, streamlit_args = parser.parse_known_args()
+    streamlit_args = [arg for arg in streamlit_args if arg != '--']
+    shared = not args.private
+    prepared = shared and not args.no_prepare
+    if prepared:
+        # data_loader reads it on import
+        os.environ['REPROSIGHT_SHARED'] = '1'
+        # Bare-mode cache calls warn about the missing ScriptRunContext on every hit
+        logging.disable(logging.WARNING)
+        prepare(args.data)
+
+    env = worker_env(args.data, shared, prepared)
+    ports = [args.port + i for i in range(args.workers)]
+    workers = {port: start_worker(port, env, streamlit_args) for port in ports}
+    print(f"{len(ports)} {'shared' if shared else 'private'} workers on ports "
+          f"{', '.join(map(str, ports))} (pids {', '.join(str(w.pid) for w in workers.values())})", flush=True)
+    # Stopping the server stops its workers too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while True:
+            time.sleep(POLL_SECONDS)
+            for port, worker in workers.items():
+                if worker.poll() is not None:
+                    print(f"worker on port {port} exited with {worker.returncode}; restarting", flush=True)
+                    workers[port] = start_worker(port, env, streamlit_args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers.values():
+            worker.terminate()
+        for worker in workers.values():
+            worker.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
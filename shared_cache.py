@@ -0,0 +1,117 @@
+"""Cached results shared by every server process through the cache directory.
+
+st.cache_resource only spans one process, so with several server processes
+(REPROSIGHT_SHARED=1, see serve.py) each of them would rebuild the
+aggregates, bootstrap intervals and summaries for its first visitor.
+shared_result stores what a builder returns as a pickle under
+CACHE_DIR/results, keyed by dataset version, name and parameters, and any
+other process unpickles it instead of building it again. An advisory lock
+per result lets one process build it while the others wait for the file.
+Figures are shared the same way by figure_cache.py.
+
+Results are kept per dataset version and per fingerprint of the builder
+modules and of the pandas and NumPy versions they are pickled with
+(RESULT_CODE), so a code change or upgrade starts a fresh set. Results of
+other versions of the same source, or built by other code, are removed when
+the new set stores its first one.
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks (Windows): concurrent builds only duplicate work
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from data_loader import CACHE_DIR, SHARED, source_fingerprint
+from profiling import span
+
+RESULT_DIR = os.path.join(CACHE_DIR, 'results')
+# The modules whose code decides what a stored result holds
+RESULT_MODULES = ['aggregates', 'bootstrap', 'bivariate', 'correlation', 'univariate', 'missingness',
+                  'trendlines', 'weighted', 'backend', 'data_loader']
+RESULT_CODE = source_fingerprint(RESULT_MODULES, pd.__version__, np.__version__)
+_MISSING = object()
+
+
+def result_dir(path, version):
+    """Directory of the stored results for the given dataset version and the current RESULT_CODE."""
+    stem = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+    return os.path.join(RESULT_DIR, f"{stem}-{version}-{RESULT_CODE}")
+
+
+def _result_file(directory, name, params):
+    digest = hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+    return os.path.join(directory, f"{name.replace(' ', '_')}-{digest}.pkl")
+
+
+def _read_result(target):
+    try:
+        with open(target, 'rb') as fh:
+            return pickle.load(fh)
+    except FileNotFoundError:
+        return _MISSING
+
+
+def _make_result_dir(directory):
+    """Creates `directory`, removing the results of other versions or code for the same source."""
+    if os.path.isdir(directory):
+        return
+    stem = os.path.basename(directory).rsplit('-', 2)[0]
+    if os.path.isdir(RESULT_DIR):
+        for name in os.listdir(RESULT_DIR):
+            if name.rsplit('-', 2)[0] == stem and name != os.path.basename(directory):
+                shutil.rmtree(os.path.join(RESULT_DIR, name), ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+@contextmanager
+def _locked(target):
+    if fcntl is None:
+        yield
+        return
+    with open(f"{target}.lock", 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def shared_result(name, path, version, build, params=()):
+    """`build()`, computed once for all server processes per (version, name, params).
+
+    Without REPROSIGHT_SHARED this is just `build()`.
+    """
+    if not SHARED:
+        return build()
+    directory = result_dir(path, version)
+    target = _result_file(directory, name, params)
+    with span(f"shared:{name}", 'shared'):
+        result = _read_result(target)
+        if result is not _MISSING:
+            return result
+        _make_result_dir(directory)
+        with _locked(target):
+            # Another process may have stored it while this one waited for the lock
+            result = _read_result(target)
+            if result is not _MISSING:
+                return result
+            result = build()
+            tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as fh:
+                pickle.dump(result, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, target)
+        return result
+
+
+def clear_results():
+    """Removes every stored result."""
+    shutil.rmtree(RESULT_DIR, ignore_errors=True)
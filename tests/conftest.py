@@ -0,0 +1,31 @@
+"""Shared fixtures: the app's modules importable from the repository root, and small datasets on disk."""
+import logging
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Cached loaders called outside a Streamlit run warn about the missing ScriptRunContext
+logging.getLogger('streamlit.runtime.scriptrunner_utils.script_run_context').setLevel(logging.ERROR)
+logging.getLogger('streamlit.runtime.caching.cache_data_api').setLevel(logging.ERROR)
+
+import data_loader  # noqa: E402
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """A private cache directory, so tests never touch .reprosight_cache."""
+    directory = tmp_path / 'cache'
+    monkeypatch.setattr(data_loader, 'CACHE_DIR', str(directory))
+    return directory
+
+
+@pytest.fixture
+def write_csv(tmp_path, cache_dir):
+    """Writes a DataFrame as a dataset CSV and returns its path."""
+    def write(frame, name='dataset.csv'):
+        path = tmp_path / name
+        frame.to_csv(path, index=False)
+        return str(path)
+    return write
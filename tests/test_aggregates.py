@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import box_summary, distribution_details, kde_curve
+
+
+@pytest.fixture
+def grouped():
+    rng = np.random.default_rng(18)
+    n = 2000
+    groups = pd.Series(rng.choice(['Yes', 'No', 'Unknown'], n), name='infertility')
+    values = pd.DataFrame({'lead': rng.lognormal(size=n), 'mercury': rng.normal(1, 0.3, n).round(2)})
+    values.loc[rng.random(n) < 0.01, 'mercury'] = 9.0  # far outliers
+    return groups, values.mask(rng.random(values.shape) < [0.1, 0.3])
+
+
+def test_box_summary_matches_pandas_quantiles(grouped):
+    groups, values = grouped
+    summary = box_summary(groups, values)
+    for (group, column), stats in summary.iterrows():
+        vals = values.loc[groups == group, column].dropna()
+        q1, median, q3 = vals.quantile([0.25, 0.5, 0.75])
+        assert (stats['n'], stats['mean']) == (len(vals), pytest.approx(vals.mean()))
+        assert (stats['q1'], stats['median'], stats['q3']) == pytest.approx((q1, median, q3))
+        # Whiskers: 1.5 IQR from the box, pulled in to the most extreme values inside
+        inside = vals[(vals >= q1 - 1.5 * (q3 - q1)) & (vals <= q3 + 1.5 * (q3 - q1))]
+        assert (stats['lowerfence'], stats['upperfence']) == (inside.min(), inside.max())
+    assert summary.loc[('Yes', 'mercury'), 'upperfence'] < 9.0
+
+
+def test_kde_integrates_to_one_and_matches_unbinned_kde():
+    values = np.random.default_rng(19).lognormal(size=5000)
+    grid, density = kde_curve(values)
+    assert np.trapezoid(density, grid) == pytest.approx(1.0, abs=0.02)
+    assert grid[0] < values.min() and grid[-1] > values.max()
+    # Binning the values barely moves the curve
+    q1, q3 = np.percentile(values, [25, 75])
+    bandwidth = 1.059 * min(values.std(ddof=1), (q3 - q1) / 1.349) * len(values) ** -0.2
+    z = (grid[:, None] - values[None, :]) / bandwidth
+    exact = np.exp(-0.5 * z ** 2).sum(axis=1) / (len(values) * bandwidth * np.sqrt(2 * np.pi))
+    np.testing.assert_allclose(density, exact, atol=0.01 * exact.max())
+
+    weights = np.random.default_rng(20).uniform(0.5, 4, len(values))
+    grid, density = kde_curve(values, weights=weights)
+    assert np.trapezoid(density, grid) == pytest.approx(1.0, abs=0.02)
+    grid, density = kde_curve(np.full(10, 2.5))
+    assert np.isfinite(density).all() and np.trapezoid(density, grid) == pytest.approx(1.0, abs=0.05)
+
+
+def test_distribution_details_outliers_lie_beyond_the_whiskers(grouped):
+    groups, values = grouped
+    summary = box_summary(groups, values)
+    details = distribution_details(groups, values, summary, cap=50)
+    for key, detail in details.items():
+        stats = summary.loc[key]
+        vals = values.loc[groups == key[0], key[1]].dropna()
+        outside = vals[(vals < stats['lowerfence']) | (vals > stats['upperfence'])]
+        assert len(detail['outliers']) == min(len(outside), 50)
+        assert set(detail['outliers']) <= set(outside)
+        assert len(detail['points']) == 50 and detail['points'][0] == vals.min()
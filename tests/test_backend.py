@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend import load_backend
+from charts import stratified_sample
+
+
+@pytest.fixture
+def scatter_data(write_csv):
+    rng = np.random.default_rng(3)
+    x = rng.lognormal(0, 1, 5000)
+    y = 2 * x + rng.normal(0, 1, 5000)
+    x[::11], y[::13] = np.nan, np.nan
+    frame = pd.DataFrame({'lead_µg/dL': x, 'testosterone': y, 'age_years': rng.integers(12, 80, 5000)})
+    return frame, write_csv(frame)
+
+
+@pytest.mark.parametrize('name', ['pandas', 'duckdb'])
+def test_histogram2d_matches_numpy(scatter_data, name):
+    if name == 'duckdb':
+        pytest.importorskip('duckdb')
+    frame, path = scatter_data
+    backend = load_backend(path, name)
+    filters = [('age_years', '>=', 30)]
+    rows = frame[frame['age_years'] >= 30].dropna(subset=['lead_µg/dL', 'testosterone'])
+    expected, xedges, yedges = np.histogram2d(rows['lead_µg/dL'], rows['testosterone'], bins=20)
+    counts, bx, by = backend.histogram2d('lead_µg/dL', 'testosterone', 20, filters)
+    np.testing.assert_allclose(bx, xedges)
+    np.testing.assert_allclose(by, yedges)
+    np.testing.assert_array_equal(counts, expected)
+
+
+@pytest.mark.parametrize('name', ['pandas', 'duckdb'])
+def test_stratified_sample_keeps_every_bin(scatter_data, name):
+    if name == 'duckdb':
+        pytest.importorskip('duckdb')
+    _, path = scatter_data
+    backend = load_backend(path, name)
+    counts, xedges, yedges = backend.histogram2d('lead_µg/dL', 'testosterone', 20)
+    sample = backend.stratified_sample('lead_µg/dL', 'testosterone', xedges, yedges, 300)
+    sampled, _, _ = np.histogram2d(sample['lead_µg/dL'], sample['testosterone'], bins=[xedges, yedges])
+    quota = np.where(counts > 0, np.maximum(1, np.round(counts * 300 / counts.sum())), 0)
+    np.testing.assert_array_equal(sampled, quota)
+    # Sampled rows are real rows
+    rows = set(map(tuple, backend.fetch(['lead_µg/dL', 'testosterone']).dropna().to_numpy().tolist()))
+    assert set(map(tuple, sample.to_numpy().tolist())) <= rows
+
+
+def test_stratified_sample_indices():
+    bins = np.repeat([0, 1, 2], [900, 90, 10])
+    picked = stratified_sample(bins, 100)
+    assert np.bincount(bins[picked]).tolist() == [90, 9, 1]
+    assert (np.diff(picked) > 0).all()
+    assert stratified_sample(bins[:50], 100).tolist() == list(range(50))
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import chi2_contingency
+
+from backend import load_backend
+from bivariate import build_pair_summary, crosstab, numeric_by_category
+from univariate import ColumnSummaries
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(16)
+    n = 3000
+    race = rng.choice([1, 2, 3, 4, 6, 7], n, p=[0.3, 0.2, 0.2, 0.15, 0.1, 0.05]).astype(float)
+    frame = pd.DataFrame({
+        'race': race,
+        'ever_pregnant': np.where(rng.random(n) < 0.4 + race / 20, 1.0, 2.0),
+        'site': rng.choice(['north', 'south', 'east'], n),
+        'lead': rng.lognormal(size=n) * race,
+    })
+    return frame.mask(rng.random(frame.shape) < [0.05, 0.1, 0.0, 0.2])
+
+
+def _expected_crosstab(frame, x, y):
+    both = frame[[x, y]].dropna()
+    return pd.crosstab(both.iloc[:, 0], both.iloc[:, 1]).to_numpy()
+
+
+@pytest.mark.parametrize('x, y', [('race', 'ever_pregnant'), ('site', 'race'), ('race', 'race')])
+def test_crosstab_matches_scipy(frame, x, y):
+    result = crosstab(frame, x, y)
+    observed = _expected_crosstab(frame, x, y)
+    np.testing.assert_array_equal(result['counts'].to_numpy(), observed)
+    assert result['n'] == observed.sum()
+    chi2, p_value, dof, _ = chi2_contingency(observed, correction=False)
+    assert result['chi2'] == pytest.approx(chi2)
+    assert result['p_value'] == pytest.approx(p_value)
+    assert result['dof'] == dof
+    assert result['cramers_v'] == pytest.approx(np.sqrt(chi2 / (observed.sum() * (min(observed.shape) - 1))))
+    if x == y:
+        # Every row lies on the diagonal, a perfect association
+        assert (result['counts'].to_numpy() == np.diag(np.diag(observed))).all()
+        assert result['cramers_v'] == pytest.approx(1.0)
+
+
+def test_weighted_crosstab_sums_weights(frame):
+    frame['w'] = np.random.default_rng(17).uniform(0.5, 3, len(frame))
+    result = crosstab(frame, 'race', 'site', weights='w')
+    expected = frame.dropna(subset=['race']).pivot_table('w', 'race', 'site', aggfunc='sum', fill_value=0)
+    np.testing.assert_allclose(result['table'].to_numpy(), expected.to_numpy())
+    # The test stays on the unweighted counts
+    assert result['chi2'] == pytest.approx(chi2_contingency(_expected_crosstab(frame, 'race', 'site'),
+                                                            correction=False)[0])
+
+
+@pytest.mark.parametrize('numeric, category', [('lead', 'race'), ('lead', 'site'), ('race', 'race')])
+def test_numeric_by_category_quartiles_match_pandas(frame, numeric, category):
+    box = numeric_by_category(frame, numeric, category)['box']
+    values = frame[[numeric]].assign(group=frame[category]).dropna()
+    expected = values.groupby('group')[numeric].quantile([0.25, 0.5, 0.75]).unstack()
+    np.testing.assert_allclose(box[['q1', 'median', 'q3']].to_numpy(), expected.to_numpy())
+    np.testing.assert_array_equal(box['n'], values.groupby('group').size())
+    np.testing.assert_allclose(box['mean'], values.groupby('group')[numeric].mean())
+
+
+def test_same_column_pair_summary(frame, write_csv):
+    backend = load_backend(write_csv(frame), 'pandas')
+    summary = build_pair_summary(backend, ColumnSummaries(frame), 'race', 'race')
+    assert summary['kind'] == 'crosstab'
+    np.testing.assert_array_equal(summary['counts'].to_numpy(), _expected_crosstab(frame, 'race', 'race'))
+    with pytest.raises(ValueError):
+        build_pair_summary(backend, ColumnSummaries(frame), 'lead', 'lead')
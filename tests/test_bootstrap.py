@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from bootstrap import _block_fits, _block_medians, _block_rates, _replicates, poisson_counts
+from weighted import weighted_quantiles
+
+
+@pytest.fixture
+def counts():
+    return poisson_counts(np.random.default_rng(0), (50, 300)).astype(float)
+
+
+def test_poisson_counts_follow_poisson_one():
+    counts = poisson_counts(np.random.default_rng(1), (400, 2500))
+    assert abs(counts.mean() - 1) < 0.01
+    assert abs(counts.var() - 1) < 0.01
+    assert abs((counts == 0).mean() - np.exp(-1)) < 0.005
+
+
+@pytest.fixture
+def sorted_rows():
+    rng = np.random.default_rng(2)
+    values = rng.lognormal(size=200)
+    rows = np.sort(rng.choice(300, 200, replace=False))
+    order = np.argsort(values)
+    return rows[order], values[order]
+
+
+def test_block_medians_are_medians_of_redrawn_rows(counts, sorted_rows):
+    rows, values = sorted_rows
+    medians = _block_medians(counts, rows, values)
+    for replicate, drawn in enumerate(counts[:, rows].astype(int)):
+        assert medians[replicate] == pytest.approx(np.median(np.repeat(values, drawn)))
+    assert _block_medians(np.ones((1, 300)), rows, values)[0] == pytest.approx(np.median(values))
+    assert np.isnan(_block_medians(np.zeros((1, 300)), rows, values)[0])
+
+
+def test_small_group_intervals_match_resampling():
+    # Five rows, where interpolating the counts as probability weights narrowed the interval
+    values = np.array([0.5, 0.8, 1.0, 1.5, 2.2])
+    counts = poisson_counts(np.random.default_rng(13), (20000, 5)).astype(float)
+    medians = _block_medians(counts, np.arange(5), values)
+    redrawn = np.random.default_rng(14).choice(values, (20000, 5))
+    np.testing.assert_allclose(np.nanpercentile(medians, [2.5, 97.5]),
+                               np.percentile(np.median(redrawn, axis=1), [2.5, 97.5]), atol=0.1)
+
+
+def test_weighted_block_medians_interpolate_like_weighted_quantiles(counts, sorted_rows):
+    rows, values = sorted_rows
+    weights = counts * np.random.default_rng(15).uniform(0.5, 2, 300)
+    medians = _block_medians(weights, rows, values, weighted=True)
+    for replicate, w in enumerate(weights[:, rows]):
+        drawn = w > 0
+        expected = weighted_quantiles(np.zeros(drawn.sum(), dtype=int), values[drawn], w[drawn], [0.5])[0, 0]
+        assert medians[replicate] == pytest.approx(expected)
+
+
+def test_block_fits_match_polyfit_on_redrawn_rows(counts):
+    rng = np.random.default_rng(3)
+    X = rng.normal(size=(300, 2))
+    Y = X @ [[1.5], [-0.5]] + rng.normal(size=(300, 1))
+    X[::7, 0], Y[::5, 0] = np.nan, np.nan
+    slopes, intercepts = _block_fits(counts, X, Y)
+    for replicate in range(3):
+        redrawn = np.repeat(np.arange(300), counts[replicate].astype(int))
+        for j in range(2):
+            x, y = X[redrawn, j], Y[redrawn, 0]
+            keep = ~np.isnan(x) & ~np.isnan(y)
+            slope, intercept = np.polyfit(x[keep], y[keep], 1)
+            assert slopes[replicate, j, 0] == pytest.approx(slope)
+            assert intercepts[replicate, j, 0] == pytest.approx(intercept)
+
+
+def test_block_rates_match_redrawn_means(counts):
+    rng = np.random.default_rng(4)
+    codes = rng.integers(-1, 3, 300)
+    flag = rng.integers(0, 2, 300).astype(float)
+    rates = _block_rates(counts, codes, flag, 3)
+    for replicate in range(3):
+        redrawn = np.repeat(np.arange(300), counts[replicate].astype(int))
+        for g in range(3):
+            assert rates[replicate, g] == pytest.approx(flag[redrawn][codes[redrawn] == g].mean())
+
+
+def test_pooled_replicates_match_in_process(monkeypatch):
+    rng = np.random.default_rng(5)
+    X, Y = rng.normal(size=(400, 2)), rng.normal(size=(400, 1))
+    values = np.sort(rng.lognormal(size=100))
+    data = {'weights': np.ones(400), 'weighted': False, 'fit': (X, Y),
+            'rate': (rng.integers(-1, 5, 400), rng.integers(0, 2, 400).astype(float)),
+            'medians': [('fertility_box', 'Yes', 'lead', np.arange(100), values)]}
+    # Small blocks, so the replicates are split over the workers
+    monkeypatch.setattr('bootstrap.BLOCK_CELLS', 400 * 8)
+    pooled, in_process = _replicates(data, 40, workers=2), _replicates(data, 40, workers=1)
+    assert pooled.keys() == in_process.keys() == {'rate', 'slope', 'intercept', 'median'}
+    for part in pooled:
+        np.testing.assert_array_equal(pooled[part], in_process[part])
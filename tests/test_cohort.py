@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cohort import CohortIndex
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(12)
+    n = 1001  # not a multiple of 8, so the last bitmap byte is partial
+    return pd.DataFrame({
+        'race': rng.choice([1.0, 2.0, 3.0, 4.0, np.nan], n),
+        'marital_status': rng.choice([1.0, 5.0, np.nan], n),
+        'age_years': rng.integers(12, 81, n).astype(float),
+        'income_poverty_ratio': np.where(rng.random(n) < 0.1, np.nan, rng.uniform(0, 5, n).round(2)),
+    })
+
+
+COHORTS = [
+    (),
+    (('race', 'in', (1.0, 3.0)),),
+    (('race', 'in', (9.0,)),),
+    (('age_years', 'between', (20, 44)),),
+    (('income_poverty_ratio', 'between', (1, 2)),),
+    (('race', 'in', (2.0, 4.0)), ('marital_status', 'in', (5.0,)), ('age_years', 'between', (30, 30)),
+     ('income_poverty_ratio', 'between', (0, 5))),
+]
+
+
+def _pandas_mask(frame, cohort):
+    mask = pd.Series(True, index=frame.index)
+    for column, op, value in cohort:
+        mask &= frame[column].isin(value) if op == 'in' else frame[column].between(*value)
+    return mask.to_numpy()
+
+
+@pytest.mark.parametrize('cohort', COHORTS)
+def test_masks_match_pandas(frame, cohort):
+    index = CohortIndex(frame)
+    expected = _pandas_mask(frame, cohort)
+    np.testing.assert_array_equal(index.mask(cohort), expected)
+    assert index.count(cohort) == expected.sum()
+    # Memoized bitmaps give the same answer
+    np.testing.assert_array_equal(index.mask(cohort), expected)
+
+
+def test_values_ranges_and_unknown_ops(frame):
+    index = CohortIndex(frame)
+    assert index.values('race') == [1.0, 2.0, 3.0, 4.0]
+    assert index.value_range('age_years') == (frame['age_years'].min(), frame['age_years'].max())
+    with pytest.raises(ValueError):
+        index.mask((('age_years', '>', 30),))
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from correlation import benjamini_hochberg, pair_moments, pearson_from_moments
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(6)
+    base = rng.normal(size=(400, 1))
+    frame = pd.DataFrame(base + rng.normal(size=(400, 4)), columns=list('abcd'))
+    return frame.mask(rng.random(frame.shape) < [0.05, 0.2, 0.4, 0.0])
+
+
+def test_pair_moments_match_pairwise_complete_pandas(frame):
+    X = frame.to_numpy()
+    moments = pair_moments(X, X)
+    r, p = pearson_from_moments(moments)
+    np.testing.assert_allclose(r, frame.corr(), rtol=1e-10)
+    notna = frame.notna().astype(int)
+    np.testing.assert_array_equal(moments['n'], notna.T @ notna)
+    # p-values agree with scipy's on the pairwise-complete rows
+    from scipy.stats import pearsonr
+    both = frame[['a', 'c']].dropna()
+    assert p[0, 2] == pytest.approx(pearsonr(both['a'], both['c'])[1])
+
+
+def test_weighted_pair_moments_match_np_cov(frame):
+    w = np.random.default_rng(7).uniform(0.2, 5, len(frame))
+    r, _ = pearson_from_moments(pair_moments(frame[['a', 'b']].to_numpy(), frame[['c', 'd']].to_numpy(), w))
+    for i, x in enumerate('ab'):
+        for j, y in enumerate('cd'):
+            keep = frame[[x, y]].notna().all(axis=1).to_numpy()
+            cov = np.cov(frame.loc[keep, x], frame.loc[keep, y], aweights=w[keep])
+            assert r[i, j] == pytest.approx(cov[0, 1] / np.sqrt(cov[0, 0] * cov[1, 1]))
+
+
+@pytest.mark.parametrize('name', ['pandas', 'duckdb'])
+def test_backend_pair_moments_match_in_memory(frame, write_csv, name):
+    if name == 'duckdb':
+        pytest.importorskip('duckdb')
+    from backend import load_backend
+
+    backend = load_backend(write_csv(frame), name)
+    local = pair_moments(frame[['a', 'b']].to_numpy(), frame[['c', 'd']].to_numpy())
+    moments = backend.pair_moments(['a', 'b'], ['c', 'd'])
+    for key in ('n', 'cxx', 'cyy', 'cxy'):
+        np.testing.assert_allclose(moments[key], local[key], rtol=1e-9)
+
+
+def test_benjamini_hochberg_matches_statsmodels():
+    multipletests = pytest.importorskip('statsmodels.stats.multitest').multipletests
+    rng = np.random.default_rng(8)
+    p = np.r_[rng.uniform(size=150), rng.uniform(0, 1e-3, 30), [0.02, 0.02, 1.0]]
+    np.testing.assert_allclose(benjamini_hochberg(p), multipletests(p, method='fdr_bh')[1], rtol=1e-12)
+    # NaNs are left out of the family rather than counted as tests
+    with_nan = np.r_[p[:20], np.nan, p[20:40]]
+    q = benjamini_hochberg(with_nan)
+    assert np.isnan(q[20])
+    np.testing.assert_allclose(np.delete(q, 20), multipletests(p[:40], method='fdr_bh')[1], rtol=1e-12)
+    assert benjamini_hochberg([]).shape == (0,)
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader import (AGE_LABELS, build_derived_view, dataset_version, map_dataset, parquet_path, read_csv,
+                         read_dataset)
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(22)
+    return pd.DataFrame({
+        'lead_µg/dL': rng.lognormal(size=50),
+        'race': rng.choice([1.0, 3.0, 6.0, np.nan], 50),
+        'infertility_1yr': rng.choice([1.0, 2.0, np.nan], 50),
+        'site': rng.choice(['north', 'south'], 50),
+    })
+
+
+def test_read_dataset_builds_and_reuses_the_parquet_copy(frame, write_csv, cache_dir):
+    path = write_csv(frame)
+    df = read_dataset(path)
+    pd.testing.assert_frame_equal(df, read_csv(path))
+    assert df['race'].dtype == np.float32 and df['lead_µg/dL'].dtype == np.float64
+    target = parquet_path(path)
+    assert os.listdir(cache_dir) == [os.path.basename(target)]
+    pd.testing.assert_frame_equal(read_dataset(path), df)
+    pd.testing.assert_frame_equal(map_dataset(path), df)
+
+
+def test_rewritten_csv_gets_a_new_version(frame, write_csv, cache_dir):
+    path = write_csv(frame)
+    version = dataset_version(path)
+    read_dataset(path)
+    write_csv(frame.head(10))
+    assert dataset_version(path) != version
+    assert len(read_dataset(path)) == 10
+    # The copy of the old version is replaced, not kept alongside
+    assert [name for name in os.listdir(cache_dir) if name.endswith('.parquet')] == [
+        os.path.basename(parquet_path(path))]
+
+
+def test_derived_view_matches_hand_computed_frame():
+    # Codes as the loader stores them: float32 with NaN for "not asked"
+    df = pd.DataFrame({
+        'infertility_1yr': np.array([1, 2, 7, np.nan, 1], dtype='float32'),
+        'age_years': [17.0, 18.0, 49.0, 50.0, 30.0],
+        'first_period_age': np.array([7, 8, 20, 21, 12], dtype='float32'),
+        'last_period_age': [45.0, 999.0, np.nan, 52.0, 30.0],
+    }, index=[10, 11, 12, 13, 14])
+    before = df.copy()
+    derived = build_derived_view(df)
+
+    expected = pd.DataFrame({
+        'infertility_status': pd.Categorical(['Yes', 'No', None, None, 'Yes'], categories=['Yes', 'No']),
+        'age_group': pd.Categorical([None, '18-24', '45-50', None, '30-34'], categories=AGE_LABELS, ordered=True),
+        'is_infertile': [True, False, False, False, True],
+        'first_period_age': pd.Categorical([None, '8.0', '20.0', None, '12.0']),
+        'valid_menopause': [True, False, False, True, True],
+    }, index=df.index)
+    pd.testing.assert_frame_equal(derived, expected)
+    # The shared frame is left as it was
+    pd.testing.assert_frame_equal(df, before)
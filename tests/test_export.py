@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+
+import export
+from cohort import CohortIndex
+from export import ExportJob, cohort_expression, write_extract
+
+COHORTS = [
+    (),
+    (('race', 'in', (1.0, 3.0)),),
+    (('race', 'in', (9.0,)),),
+    (('income_poverty_ratio', 'between', (1, 2)),),
+    (('race', 'in', (2.0, 4.0)), ('marital_status', 'in', (5.0,)), ('age_years', 'between', (30, 60))),
+]
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(21)
+    n = 1001
+    return pd.DataFrame({
+        'row_id': np.arange(n),
+        'race': rng.choice([1.0, 2.0, 3.0, 4.0, np.nan], n),
+        'marital_status': rng.choice([1.0, 5.0, np.nan], n),
+        'age_years': rng.integers(12, 81, n).astype(float),
+        'income_poverty_ratio': np.where(rng.random(n) < 0.1, np.nan, rng.uniform(0, 5, n).round(2)),
+        'lead_µg/dL': rng.lognormal(size=n),
+    })
+
+
+@pytest.fixture
+def job(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, 'EXPORT_DIR', str(tmp_path / 'exports'))
+    job = ExportJob("extract")
+    os.makedirs(job.directory)
+    return job
+
+
+def _read_extract(job, fmt):
+    parts = [os.path.join(job.directory, name) for name in job.files]
+    if fmt == 'csv':
+        return pd.concat([pd.read_csv(part) for part in parts], ignore_index=True)
+    return pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+@pytest.mark.parametrize('cohort', [COHORTS[0], COHORTS[1], COHORTS[4]])
+def test_extract_holds_the_cohort_rows(frame, write_csv, job, fmt, cohort):
+    path = write_csv(frame)
+    # Small batches and parts, so the extract spans several files
+    write_extract(job, path, cohort, fmt, batch_rows=100, part_bytes=8 * 1024)
+    expected = frame['row_id'].to_numpy()[CohortIndex(frame).mask(cohort)]
+    extract = _read_extract(job, fmt)
+    assert job.total == job.done == len(extract) == len(expected)
+    np.testing.assert_array_equal(extract['row_id'], expected)
+    assert list(extract.columns) == list(frame.columns)
+    if fmt == 'csv' and not cohort:
+        assert len(job.files) > 1
+
+
+@pytest.mark.parametrize('cohort', COHORTS)
+def test_cohort_expression_selects_the_cohort_rows(frame, tmp_path, cohort):
+    frame.to_parquet(tmp_path / 'frame.parquet')
+    dataset = ds.dataset(tmp_path / 'frame.parquet')
+    rows = dataset.to_table(filter=cohort_expression(cohort, dataset.schema), columns=['row_id'])
+    np.testing.assert_array_equal(rows['row_id'].to_numpy(), np.flatnonzero(CohortIndex(frame).mask(cohort)))
+
+
+def test_unknown_format_and_op(frame, write_csv, job):
+    with pytest.raises(ValueError):
+        write_extract(job, write_csv(frame), (), 'xlsx')
+    with pytest.raises(ValueError):
+        cohort_expression((('age_years', '>', 30),), pa.Schema.from_pandas(frame))
@@ -0,0 +1,41 @@
+import os
+
+import pandas as pd
+import plotly.graph_objects as go
+
+import figure_cache
+from figure_cache import cached_figure, figure_dir, load_figure_cache
+from profiling import payload_size
+
+
+def test_code_change_rebuilds_figures(tmp_path, monkeypatch, write_csv):
+    path = write_csv(pd.DataFrame({'lead_µg/dL': [1.0, 2.0]}))
+    monkeypatch.setattr(figure_cache, 'FIGURE_DIR', str(tmp_path / 'figures'))
+    builds = []
+
+    def build():
+        builds.append(figure_cache.FIGURE_CODE)
+        return go.Figure(go.Bar(x=[1, 2], y=[3, 4]))
+
+    cached_figure('chart', (1,), build, path=path)
+    load_figure_cache().clear()
+    cached_figure('chart', (1,), build, path=path)
+    assert len(builds) == 1  # read back from its file
+
+    old_dir = figure_dir(path)
+    monkeypatch.setattr(figure_cache, 'FIGURE_CODE', 'changed0')
+    load_figure_cache().clear()
+    cached_figure('chart', (1,), build, path=path)
+    assert builds == [builds[0], 'changed0']
+    assert os.listdir(tmp_path / 'figures') == [os.path.basename(figure_dir(path))]
+    assert not os.path.exists(old_dir)
+
+
+def test_cached_figures_carry_their_payload_size(tmp_path, monkeypatch, write_csv):
+    path = write_csv(pd.DataFrame({'lead_µg/dL': [1.0, 2.0]}))
+    monkeypatch.setattr(figure_cache, 'FIGURE_DIR', str(tmp_path / 'figures'))
+    built = cached_figure('chart', (2,), lambda: go.Figure(go.Bar(x=[1, 2], y=[3, 4])), path=path)
+    hit = cached_figure('chart', (2,), lambda: None, path=path)
+    assert payload_size(built) == payload_size(hit) == len(built.to_json())
+    # Other figures are only measured with the Performance view open
+    assert payload_size(go.Figure()) is None
@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader import load_dataset
+from ingest import ingest, prune_files, read_ingested, read_manifest
+from inspector import query_rows
+from univariate import load_column_summaries
+
+
+def raw_cycle(seed, rows=200):
+    """A raw NHANES extract under the NHANES variable names."""
+    rng = np.random.default_rng(seed)
+    lead = rng.lognormal(0, 0.5, rows)
+    lead[::7] = np.nan
+    return pd.DataFrame({
+        'RIAGENDR': rng.integers(1, 3, rows), 'RIDAGEYR': rng.integers(12, 86, rows).astype(float),
+        'LBXBPB': lead, 'WTSH2YR': rng.uniform(1e3, 1e4, rows),
+    })
+
+
+@pytest.fixture
+def sources(tmp_path):
+    paths = {}
+    for seed, cycle in enumerate(['2015-2016', '2017-2018']):
+        paths[cycle] = str(tmp_path / f"{cycle}.csv")
+        raw_cycle(seed).to_csv(paths[cycle], index=False)
+    return paths
+
+
+def ingested_rows(out):
+    frame = read_ingested(out)
+    return frame.sort_values(['cycle', 'gender', 'age_years', 'lead_µg/dL']).reset_index(drop=True)
+
+
+def test_manifest_matches_the_partitions(tmp_path, sources):
+    out = str(tmp_path / 'out')
+    assert sorted(ingest([f"{c}={p}" for c, p in sources.items()], out)) == sorted(sources)
+    manifest = read_manifest(out)
+    frame = read_ingested(out)
+    assert len(frame) == sum(s['rows'] for s in manifest['sources'].values()) == 400
+    for entry in manifest['files']:
+        part = pd.read_parquet(os.path.join(out, entry['path']))
+        assert entry['rows'] == len(part)
+        assert (part['cycle'] == entry['partition']['cycle']).all()
+        lo, hi, nulls = entry['stats']['lead_µg/dL']
+        assert nulls == part['lead_µg/dL'].isna().sum()
+        assert (lo, hi) == (part['lead_µg/dL'].min(), part['lead_µg/dL'].max())
+    # Top-coded at 80, and the molar unit filled in from the mass unit
+    assert frame['age_years'].max() == 80
+    np.testing.assert_allclose(frame['lead_µmol/L'], frame['lead_µg/dL'] * 10 / 207.2)
+
+
+def test_rerun_skips_unchanged_sources(tmp_path, sources):
+    out = str(tmp_path / 'out')
+    ingest(list(sources.values()), out)
+    before = ingested_rows(out)
+    assert ingest(list(sources.values()), out) == {}
+    raw_cycle(5).to_csv(sources['2017-2018'], index=False)
+    assert list(ingest(list(sources.values()), out)) == ['2017-2018']
+    after = ingested_rows(out)
+    pd.testing.assert_frame_equal(after[after['cycle'] == '2015-2016'], before[before['cycle'] == '2015-2016'])
+    assert len(read_manifest(out)['files']) == len({e['path'] for e in read_manifest(out)['files']})
+
+
+@pytest.mark.parametrize('filters', [
+    [('age_years', '>=', 60)],
+    [('gender', '==', 2), ('age_years', 'between', (20, 39))],
+    [('cycle', '==', '2017-2018'), ('lead_µg/dL', '>', 1.5)],
+    [('age_years', 'in', [15, 81])],
+])
+def test_pruning_keeps_every_matching_row(tmp_path, sources, filters):
+    out = str(tmp_path / 'out')
+    ingest(list(sources.values()), out)
+    everything = read_ingested(out)
+    kept = prune_files(out, filters)
+    assert len(kept) < len(read_manifest(out)['files'])
+    ops = {'>=': lambda s, v: s >= v, '==': lambda s, v: s == v, '>': lambda s, v: s > v,
+           'between': lambda s, v: s.between(*v), 'in': lambda s, v: s.isin(v)}
+    mask = np.logical_and.reduce([ops[op](everything[column], value) for column, op, value in filters])
+    pruned = read_ingested(out, filters=filters)
+    mask_pruned = np.logical_and.reduce([ops[op](pruned[column], value) for column, op, value in filters])
+    assert mask_pruned.sum() == mask.sum()
+    assert len(pruned) == sum(entry['rows'] for entry in kept)
+
+
+def test_ingested_directory_in_the_explorers(tmp_path, sources, cache_dir):
+    out = str(tmp_path / 'out')
+    ingest(list(sources.values()), out)
+    cycles = load_dataset(out)['cycle']
+    assert cycles.iloc[query_rows('cycle', path=out)].is_monotonic_increasing
+    assert cycles.iloc[query_rows('cycle', ascending=False, path=out)].is_monotonic_decreasing
+    summaries = load_column_summaries(out)
+    assert summaries.is_categorical('cycle')
+    assert summaries.value_counts('cycle').to_dict() == {'2015-2016': 200, '2017-2018': 200}
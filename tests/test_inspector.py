@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from inspector import column_range, query_rows
+
+
+def test_sort_by_string_column(write_csv):
+    frame = pd.DataFrame({'cycle': ['2017-2018', '2015-2016', None, '2015-2016', '2011-2012'],
+                          'lead_µg/dL': [1.0, 3.0, 2.0, np.nan, 4.0]})
+    path = write_csv(frame)
+    assert query_rows('cycle', path=path).tolist() == [4, 1, 3, 0, 2]
+    # Missing values stay last in both directions, like DataFrame.sort_values
+    descending = query_rows('cycle', ascending=False, path=path)
+    expected = frame['cycle'].sort_values(ascending=False)
+    assert frame['cycle'].iloc[descending].tolist()[:-1] == expected.tolist()[:-1]
+    assert descending[-1] == 2
+
+
+def test_numeric_sort_and_range_filter(write_csv):
+    path = write_csv(pd.DataFrame({'cycle': ['a', 'b', 'c', 'd'], 'lead_µg/dL': [1.0, 3.0, 2.0, np.nan]}))
+    assert query_rows('lead_µg/dL', path=path).tolist() == [0, 2, 1, 3]
+    assert query_rows('lead_µg/dL', False, 'lead_µg/dL', 1.5, 3.0, path=path).tolist() == [1, 2]
+    assert column_range('lead_µg/dL', path=path) == (1.0, 3.0)
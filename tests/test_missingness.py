@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from missingness import MissingnessIndex
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(5)
+    frame = pd.DataFrame(rng.normal(size=(1003, 5)), columns=list('abcde'))
+    frame = frame.mask(rng.random(frame.shape) < [0.0, 0.1, 0.5, 0.9, 1.0])
+    frame['label'] = np.where(rng.random(1003) < 0.3, None, 'x')
+    frame.loc[200:260, ['a', 'b']] = np.nan  # a shared gap
+    return frame
+
+
+def test_column_missing_matches_isna(frame):
+    missing = MissingnessIndex(frame).column_missing()
+    pd.testing.assert_series_equal(missing['missing'], frame.isna().sum(), check_names=False, check_index=False)
+    np.testing.assert_allclose(missing['fraction'], frame.isna().mean())
+
+
+@pytest.mark.parametrize('start, stop, blocks', [(0, None, 200), (0, None, 7), (100, 180, 40), (5, 13, 8),
+                                                 (990, 1003, 3)])
+def test_block_fractions_match_isna_blocks(frame, start, stop, blocks):
+    fractions, edges = MissingnessIndex(frame).block_fractions(start, stop, blocks)
+    mask = frame.isna().to_numpy()
+    assert edges[0] <= start and edges[-1] >= (stop or len(frame))
+    expected = [mask[lo:hi].mean(axis=0) for lo, hi in zip(edges[:-1], edges[1:])]
+    np.testing.assert_allclose(fractions, expected, rtol=1e-6)
+
+
+def test_co_missing_and_patterns_match_isna(frame):
+    index = MissingnessIndex(frame)
+    mask = frame.isna().astype(int)
+    pd.testing.assert_frame_equal(index.co_missing(), mask.T @ mask, check_dtype=False)
+    patterns = index.patterns(top=50)
+    expected = frame.isna().value_counts()
+    assert patterns['rows'].tolist() == sorted(expected, reverse=True)[:50]
+    top = expected.index[0]
+    assert patterns['pattern'].iloc[0] == ', '.join(col for col, missing in zip(frame.columns, top) if missing)
@@ -0,0 +1,57 @@
+import logging
+import os
+
+import pandas as pd
+import pytest
+
+import figure_cache
+import prewarm
+from data_loader import DATA_PATH
+from figure_cache import figure_dir
+from insight_figures import insight_combinations
+from prewarm import CONTEXT_LOGGER, PrewarmJob
+
+
+@pytest.fixture
+def path(tmp_path, monkeypatch, write_csv):
+    monkeypatch.setattr(figure_cache, 'FIGURE_DIR', str(tmp_path / 'figures'))
+    return write_csv(pd.read_csv(DATA_PATH, nrows=400))
+
+
+def test_prewarm_renders_every_figure(path):
+    job = prewarm.prewarm(path, workers=2)
+    assert job.finished and job.error is None and job.failed == []
+    assert job.done == job.total == len(insight_combinations(path))
+    # Unweighted and survey-weighted figures alike reach their files
+    assert {weighted for *_, weighted in insight_combinations(path)} == {False, True}
+    assert len(os.listdir(figure_dir(path))) >= job.total
+
+
+def test_failed_figures_are_recorded(path, monkeypatch):
+    def render(chart_id, *params, **kwargs):
+        if chart_id == 'hormone_heatmap':
+            raise RuntimeError("no hormones")
+
+    monkeypatch.setattr(prewarm, 'insight_figure', render)
+    job = prewarm.prewarm(path, workers=2)
+    assert job.done == job.total
+    assert job.failed and {chart_id for chart_id, *_ in job.failed} == {'hormone_heatmap'}
+    assert all(error == "RuntimeError('no hormones')" for *_, error in job.failed)
+
+
+def test_background_prewarm_records_its_error(path, monkeypatch):
+    def fail(path, job):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(prewarm, 'prewarm', fail)
+    job = PrewarmJob()
+    prewarm._prewarm_in_background(path, job)
+    assert job.finished and job.error == "OSError('disk full')"
+
+
+def test_only_prewarm_threads_are_muted():
+    logger = logging.getLogger(CONTEXT_LOGGER)
+    record = logger.makeRecord(CONTEXT_LOGGER, logging.WARNING, __file__, 0, "missing ScriptRunContext", (), None)
+    assert logger.filter(record)
+    record.threadName = 'prewarm_0'
+    assert not logger.filter(record)
@@ -0,0 +1,68 @@
+import json
+import time
+
+import pandas as pd
+import pytest
+
+import profiling
+from profiling import RECORD_COLUMNS, Profiler, name_span, span, span_summary
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    profiler = Profiler()
+    monkeypatch.setattr(profiling, 'load_profiler', lambda: profiler)
+    return profiler
+
+
+def test_ring_buffer_keeps_the_latest_records(tmp_path):
+    log = tmp_path / 'spans.jsonl'
+    profiler = Profiler(max_spans=3, log_path=str(log))
+    for i in range(5):
+        profiler.add({'name': f"span {i}", 'ms': float(i)})
+    frame = profiler.frame()
+    assert list(frame.columns) == RECORD_COLUMNS
+    assert frame['name'].tolist() == ['span 2', 'span 3', 'span 4']
+    # The log file keeps every record
+    assert [json.loads(line)['name'] for line in log.read_text().splitlines()] == [f"span {i}" for i in range(5)]
+    profiler.clear()
+    assert profiler.frame().empty
+
+
+def test_spans_nest_and_time_their_block(profiler):
+    with span("section", 'section'):
+        name_span("section:Data Overview")
+        with span("compute:missingness index", 'compute') as inner:
+            time.sleep(0.02)
+            inner.bytes = 123
+        with pytest.raises(ValueError):
+            with span("figure:broken", 'figure'):
+                raise ValueError("no data")
+    records = profiler.frame().set_index('name')
+    # Inner spans close first, and a span that raised is still recorded
+    assert records.index.tolist() == ['compute:missingness index', 'figure:broken', 'section:Data Overview']
+    assert records.loc['compute:missingness index', 'parent'] == 'section:Data Overview'
+    assert pd.isna(records.loc['section:Data Overview', 'parent'])
+    assert records.loc['compute:missingness index', 'bytes'] == 123
+    assert records.loc['compute:missingness index', 'ms'] >= 20
+    assert records.loc['section:Data Overview', 'ms'] >= records.loc['compute:missingness index', 'ms']
+
+
+def test_profiling_off_records_nothing(profiler, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE', False)
+    with span("section") as current:
+        assert current.name == "section"
+    assert profiler.frame().empty
+
+
+def test_span_summary_percentiles():
+    records = pd.DataFrame({'kind': ['chart'] * 10 + ['compute'], 'name': ['chart:a'] * 10 + ['compute:b'],
+                            'ms': [float(i) for i in range(10)] + [50.0], 'rss_delta_mb': 1.0,
+                            'bytes': [2048.0] * 10 + [None]})
+    summary = span_summary(records)
+    assert summary.index.tolist() == [('compute', 'compute:b'), ('chart', 'chart:a')]  # slowest p90 first
+    chart = summary.loc[('chart', 'chart:a')]
+    assert chart['count'] == 10 and chart['mean_ms'] == 4.5 and chart['max_ms'] == 9
+    assert chart['p90_ms'] == pytest.approx(pd.Series(range(10)).quantile(0.9))
+    assert chart['payload_kb'] == 2.0
+    assert span_summary(pd.DataFrame(columns=RECORD_COLUMNS)).empty
@@ -0,0 +1,27 @@
+import os
+import re
+
+import pandas as pd
+
+import figure_cache
+from data_loader import DATA_PATH, WEIGHT_COLUMN, arrow_path
+from serve import prepare, worker_env
+
+
+def test_worker_env(monkeypatch):
+    monkeypatch.setenv('REPROSIGHT_PREWARM', '1')
+    monkeypatch.delenv('REPROSIGHT_DATA', raising=False)
+    env = worker_env('nhanes.csv')
+    assert (env['REPROSIGHT_SHARED'], env['REPROSIGHT_DATA'], env['REPROSIGHT_PREWARM']) == ('1', 'nhanes.csv', '0')
+    env = worker_env(shared=False, prepared=False)
+    assert (env['REPROSIGHT_SHARED'], env['REPROSIGHT_PREWARM']) == ('0', '1')
+    assert 'REPROSIGHT_DATA' not in env
+
+
+def test_prepare_without_weights_column(tmp_path, monkeypatch, write_csv, capsys):
+    monkeypatch.setattr(figure_cache, 'FIGURE_DIR', str(tmp_path / 'figures'))
+    path = write_csv(pd.read_csv(DATA_PATH, nrows=400).drop(columns=WEIGHT_COLUMN))
+    prepare(path)
+    assert os.path.exists(arrow_path(path))
+    done, total = re.search(r"(\d+)/(\d+) figures", capsys.readouterr().out).groups()
+    assert done == total != '0'
@@ -0,0 +1,26 @@
+import os
+
+import shared_cache
+from shared_cache import result_dir, shared_result
+
+
+def test_results_are_rebuilt_for_new_code(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, 'SHARED', True)
+    monkeypatch.setattr(shared_cache, 'RESULT_DIR', str(tmp_path / 'results'))
+    builds = []
+
+    def build():
+        builds.append(shared_cache.RESULT_CODE)
+        return {'n': len(builds)}
+
+    assert shared_result('summary', 'data.csv', 'v1', build, ('x',)) == {'n': 1}
+    assert shared_result('summary', 'data.csv', 'v1', build, ('x',)) == {'n': 1}
+    assert shared_result('summary', 'data.csv', 'v1', build, ('y',)) == {'n': 2}
+    old_dir = result_dir('data.csv', 'v1')
+
+    monkeypatch.setattr(shared_cache, 'RESULT_CODE', 'changed0')
+    assert shared_result('summary', 'data.csv', 'v1', build, ('x',)) == {'n': 3}
+    assert not os.path.exists(old_dir)
+    # A new dataset version replaces the results of the old one
+    shared_result('summary', 'data.csv', 'v2', build, ('x',))
+    assert os.listdir(tmp_path / 'results') == [os.path.basename(result_dir('data.csv', 'v2'))]
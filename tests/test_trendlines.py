@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+
+from correlation import pair_moments
+from trendlines import fit_trendlines, pair_x_ranges, trendlines_from_moments
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(13)
+    x = pd.DataFrame(rng.lognormal(size=(300, 3)), columns=['lead', 'mercury', 'cadmium'])
+    y = pd.DataFrame({'fsh': 2.0 + 1.5 * x['lead'] + rng.normal(size=300),
+                      'lh': 0.5 - 0.8 * x['mercury'] + rng.normal(size=300)})
+    return x.mask(rng.random(x.shape) < [0.0, 0.2, 0.5]), y.mask(rng.random(y.shape) < [0.1, 0.3])
+
+
+def _statsmodels_fit(x, y, w=None):
+    keep = x.notna() & y.notna()
+    exog = sm.add_constant(x[keep].to_numpy())
+    model = sm.OLS(y[keep].to_numpy(), exog) if w is None else sm.WLS(y[keep].to_numpy(), exog, weights=w[keep])
+    return model.fit(), keep
+
+
+def test_unweighted_fits_match_statsmodels_ols(frames):
+    x, y = frames
+    fits = fit_trendlines(x, y)
+    for xc in x.columns:
+        for yc in y.columns:
+            result, keep = _statsmodels_fit(x[xc], y[yc])
+            fit = fits.loc[(xc, yc)]
+            assert fit['n'] == keep.sum()
+            assert fit['intercept'] == pytest.approx(result.params[0])
+            assert fit['slope'] == pytest.approx(result.params[1])
+            assert fit['r2'] == pytest.approx(result.rsquared)
+            assert fit['p_value'] == pytest.approx(result.pvalues[1])
+            assert (fit['x_min'], fit['x_max']) == (x.loc[keep, xc].min(), x.loc[keep, xc].max())
+
+
+def test_weighted_fits_match_statsmodels_wls(frames):
+    x, y = frames
+    w = np.random.default_rng(14).uniform(0.2, 5, len(x))
+    X, Y = x.to_numpy(), y.to_numpy()
+    moments = pair_moments(X, Y, w)
+    moments.update(pair_x_ranges(X, Y))
+    fits = trendlines_from_moments(moments, x.columns, y.columns)
+    for xc in x.columns:
+        for yc in y.columns:
+            result, _ = _statsmodels_fit(x[xc], y[yc], w)
+            assert fits.loc[(xc, yc), 'intercept'] == pytest.approx(result.params[0])
+            assert fits.loc[(xc, yc), 'slope'] == pytest.approx(result.params[1])
+
+
+def test_degenerate_pairs_have_no_fit():
+    # 0.1 and 3.3 leave rounding error in the centred sum of squares
+    x = pd.DataFrame({'one_row': [1.0, np.nan, np.nan, np.nan], 'flat': [2.0, 2.0, 2.0, np.nan],
+                      'flat_inexact': [0.1, 0.1, 0.1, np.nan], 'flat_large': [3.3, 3.3, 3.3, 3.3]})
+    y = pd.DataFrame({'y': [1.0, 2.0, 4.0, 8.0]})
+    fits = fit_trendlines(x, y)
+    assert fits['n'].tolist() == [1, 3, 3, 4]
+    assert fits[['slope', 'intercept', 'r2', 'p_value']].isna().all().all()
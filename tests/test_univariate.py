@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from univariate import BIN_CHOICES, ColumnSummaries
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(15)
+    n = 20000
+    frame = pd.DataFrame({
+        'lead': rng.lognormal(size=n),
+        'estradiol': rng.normal(50, 12, n),
+        'constant': np.full(n, 3.0),
+        'empty': np.full(n, np.nan),
+        'race': rng.choice([1, 2, 3, 4, 6, 7], n).astype(float),
+        'site': rng.choice(['north', 'south', None], n),
+    })
+    return frame.mask(rng.random(frame.shape) < [0.0, 0.3, 0.1, 0.0, 0.05, 0.0])
+
+
+@pytest.mark.parametrize('bins', BIN_CHOICES)
+def test_histograms_match_np_histogram(frame, bins):
+    summaries = ColumnSummaries(frame)
+    for column in ['lead', 'estradiol', 'constant']:
+        counts, edges = summaries.histogram(column, bins)
+        values = frame[column].dropna()
+        # Against np.histogram on the same edges, and on its own
+        np.testing.assert_array_equal(counts, np.histogram(values, edges)[0])
+        expected_counts, expected_edges = np.histogram(values, bins)
+        np.testing.assert_allclose(edges, expected_edges)
+        assert np.abs(counts - expected_counts).sum() <= 2  # values on an edge the grids round differently
+        assert counts.sum() == len(values)
+    assert len(summaries.histogram('empty', bins)[0]) == 0
+    with pytest.raises(ValueError):
+        summaries.histogram('lead', 7)
+
+
+def test_describe_matches_pandas(frame):
+    expected = frame.drop(columns='site').describe()
+    pd.testing.assert_frame_equal(ColumnSummaries(frame).describe(), expected, check_dtype=False, check_names=False)
+
+
+def test_missing_rates_and_value_counts(frame):
+    summaries = ColumnSummaries(frame)
+    np.testing.assert_allclose(summaries.stats['missing_rate'], frame.isna().mean())
+    assert summaries.is_categorical('race') and summaries.is_categorical('site')
+    assert not summaries.is_categorical('lead')
+    race = summaries.value_counts('race')
+    assert race['Non-Hispanic Asian'] == (frame['race'] == 6).sum()
+    assert race.sum() == frame['race'].notna().sum()
+    pd.testing.assert_series_equal(summaries.value_counts('site'), frame['site'].value_counts().sort_index())
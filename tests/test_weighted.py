@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from weighted import weighted_means, weighted_quantile_rows, weighted_quantiles
+
+QS = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+@pytest.fixture
+def groups():
+    rng = np.random.default_rng(9)
+    codes = rng.integers(0, 4, 500)
+    codes[codes == 3] = 2  # group 3 stays empty
+    return codes, rng.lognormal(size=500).round(1)  # rounded, so values tie
+
+
+def test_equal_weights_give_np_percentile(groups):
+    codes, values = groups
+    result = weighted_quantiles(codes, values, np.ones(len(values)), QS, groups=5)
+    for g in range(3):
+        np.testing.assert_allclose(result[g], np.percentile(values[codes == g], [q * 100 for q in QS]))
+    assert np.isnan(result[3:]).all()
+    expected = pd.Series(values).groupby(codes).quantile(QS).unstack().to_numpy()
+    np.testing.assert_allclose(result[:3], expected)
+
+
+def test_scaled_weights_and_presorted_rows_agree(groups):
+    codes, values = groups
+    weights = np.random.default_rng(10).uniform(0.1, 10, len(values))
+    result = weighted_quantiles(codes, values, weights, QS)
+    np.testing.assert_allclose(weighted_quantiles(codes, values, weights * 37.5, QS), result)
+    order = np.lexsort((values, codes))
+    np.testing.assert_allclose(weighted_quantiles(codes[order], values[order], weights[order], QS, presorted=True),
+                               result)
+    # Quantiles are monotone and stay within each group's range
+    assert (np.diff(result, axis=1) >= 0).all()
+    for g in range(3):
+        assert values[codes == g].min() <= result[g, 0] and result[g, -1] <= values[codes == g].max()
+
+
+def test_single_value_groups_and_weighted_means(groups):
+    # Positions (W_i - w_i) / (W - w_last): 1 at 0 and 3 at 1 in group 1
+    np.testing.assert_allclose(weighted_quantiles([0, 1, 1], [4.0, 1.0, 3.0], [2.0, 1.0, 3.0], [0.1, 0.9]),
+                               [[4.0, 4.0], [1.2, 2.8]])
+    codes, values = groups
+    weights = np.random.default_rng(11).uniform(0.1, 10, len(values))
+    means = weighted_means(codes, values, weights, 4)
+    for g in range(3):
+        assert means[g] == pytest.approx(np.average(values[codes == g], weights=weights[codes == g]))
+    assert np.isnan(means[3])
+
+
+@pytest.mark.parametrize('q', [0.0, 0.05, 0.5, 0.9, 1.0])
+def test_quantile_rows_match_weighted_quantiles(q):
+    rng = np.random.default_rng(12)
+    values = np.sort(rng.lognormal(size=40).round(1))
+    weights = rng.poisson(1.0, (60, 40)) * rng.uniform(0.5, 2, 40)
+    weights[0] = 0  # no draws
+    weights[1], weights[2] = 0, 0
+    weights[1, 0], weights[2, -1] = 1.5, 2.0  # a single draw
+    result = weighted_quantile_rows(values, weights, q)
+    assert np.isnan(result[0])
+    assert result[1] == values[0] and result[2] == values[-1]
+    for row, w in enumerate(weights[1:], 1):
+        drawn = w > 0
+        expected = weighted_quantiles(np.zeros(drawn.sum(), dtype=int), values[drawn], w[drawn], [q])[0, 0]
+        assert result[row] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('q', [0.0, 0.1, 0.5, 0.75, 1.0])
+def test_frequency_quantile_rows_match_repeated_values(q):
+    rng = np.random.default_rng(16)
+    values = np.sort(rng.lognormal(size=12).round(1))
+    counts = rng.poisson(1.0, (200, 12)).astype(float)
+    counts[0] = 0
+    result = weighted_quantile_rows(values, counts, q, frequencies=True)
+    assert np.isnan(result[0])
+    for row, drawn in enumerate(counts[1:].astype(int), 1):
+        if drawn.any():
+            assert result[row] == pytest.approx(np.percentile(np.repeat(values, drawn), q * 100))
@@ -0,0 +1,60 @@
+"""Batched ordinary-least-squares fits for every predictor x outcome pair.
+
+Instead of letting Plotly Express fit one statsmodels OLS per chart and per
+rerun, all simple regressions y ~ a + b*x are solved at once in closed form
+from the masked matrix products in correlation.pair_moments
+(pairwise-complete rows, like px drops NaNs).
+"""
+import numpy as np
+import pandas as pd
+
+from correlation import pair_moments, pearson_from_moments
+
+FIT_COLUMNS = ['n', 'slope', 'intercept', 'r2', 'p_value', 'x_min', 'x_max']
+
+
+def pair_x_ranges(X, Y):
+    """Range of every x column over the rows it shares with each y column, to draw the fitted segment."""
+    mx, my = ~np.isnan(X), ~np.isnan(Y)
+    x_min = np.empty((X.shape[1], Y.shape[1]))
+    x_max = np.empty_like(x_min)
+    for j in range(Y.shape[1]):
+        used = mx & my[:, [j]]
+        x_min[:, j] = np.min(X, axis=0, initial=np.inf, where=used)
+        x_max[:, j] = np.max(X, axis=0, initial=-np.inf, where=used)
+    return {'x_min': x_min, 'x_max': x_max}
+
+
+def trendlines_from_moments(moments, x_columns, y_columns):
+    """Fits y ~ x for every pair from pair moments that include pair_x_ranges.
+
+    Returns a frame indexed by (x, y) with FIT_COLUMNS; p_value is the
+    two-sided t-test of the slope, as statsmodels reports it. Weighted
+    moments give the weighted least-squares fit. Pairs with fewer than two
+    rows or a constant x have no fit (NaN), rather than one fitted to the
+    rounding error left in cxx.
+    """
+    n = moments['n']
+    r, p_value = pearson_from_moments(moments)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = moments['cxy'] / moments['cxx']
+        intercept = (moments['sy'] - slope * moments['sx']) / moments.get('sw', n)
+    no_fit = (n < 2) | (moments['x_max'] <= moments['x_min'])
+    slope, intercept, r, p_value = (np.where(no_fit, np.nan, a) for a in (slope, intercept, r, p_value))
+
+    index = pd.MultiIndex.from_product([x_columns, y_columns], names=['x', 'y'])
+    values = np.stack([n, slope, intercept, r ** 2, p_value, moments['x_min'], moments['x_max']], axis=-1)
+    return pd.DataFrame(values.reshape(-1, len(FIT_COLUMNS)), index=index, columns=FIT_COLUMNS)
+
+
+def fit_trendlines(x_frame, y_frame):
+    """Fits y ~ x for every column of x_frame against every column of y_frame.
+
+    Both frames must share the same rows. Missing values are excluded pair by
+    pair.
+    """
+    X = x_frame.to_numpy(dtype=float, na_value=np.nan)
+    Y = y_frame.to_numpy(dtype=float, na_value=np.nan)
+    moments = pair_moments(X, Y)
+    moments.update(pair_x_ranges(X, Y))
+    return trendlines_from_moments(moments, x_frame.columns, y_frame.columns)
@@ -0,0 +1,146 @@
+"""Per-column summaries for the Univariate Explorer and the Data Overview.
+
+Built once per dataset version, for every column at once:
+  * the min and max of every numeric column, then one vectorized pass over
+    row blocks (ROWS_PER_PASS) that counts a base histogram of BASE_BINS
+    equal-width bins for all columns with a single np.bincount over
+    column-offset bin indexes, and sums the moments (shifted by the minimum
+    for precision) for the mean and standard deviation,
+  * quantiles per column (np.quantile partitions rather than sorts),
+  * value counts of the categorical columns: non-numeric ones, and coded
+    answers (data_loader.CODED_COLUMNS) with at most MAX_CATEGORIES values.
+Any bin count dividing BASE_BINS (BIN_CHOICES) is then the sum of adjacent
+base bins, so the bin slider never touches the rows. The base bins use
+np.histogram's arithmetic and edge correction, so a rebinned histogram
+matches np.histogram(bins=n) except for a value lying exactly on an edge
+that the two linspace grids round differently.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from data_loader import CODED_COLUMNS, VALUE_LABELS, data_path, dataset_version, load_dataset
+from profiling import span
+from shared_cache import shared_result
+
+BASE_BINS = 960
+BIN_CHOICES = [10, 20, 30, 40, 60, 80, 120, 160, 240]
+MAX_CATEGORIES = 20
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+ROWS_PER_PASS = 1 << 13
+
+
+class ColumnSummaries:
+    """Histograms, value counts, quantiles and missing rates of every column of a DataFrame."""
+
+    def __init__(self, df):
+        self.columns = list(df.columns)
+        self.rows = len(df)
+        numeric = df.select_dtypes(include=np.number).columns.tolist()
+        self.numeric = numeric
+
+        self.categories = {}
+        for column in self.columns:
+            if column not in numeric or column in CODED_COLUMNS:
+                counts = df[column].value_counts(sort=False)
+                if column not in numeric or len(counts) <= MAX_CATEGORIES:
+                    self.categories[column] = counts.sort_index()
+
+        stats = pd.DataFrame(index=pd.Index(self.columns, name='column'))
+        stats['missing'] = df.isna().sum().to_numpy()
+        stats['missing_rate'] = stats['missing'] / max(self.rows, 1)
+        for name in ['mean', 'std', 'min', 'max'] + [f"q{round(q * 100)}" for q in QUANTILES]:
+            stats[name] = np.nan
+        self.stats = stats
+        self.base_counts = np.zeros((len(numeric), BASE_BINS), dtype=np.int64)
+        self.base_edges = np.zeros((len(numeric), 0))
+        if not numeric or not self.rows:
+            return
+
+        # Per column, and per row block below, so the numeric columns are never copied whole
+        stats.loc[numeric, 'min'] = low = np.array([df[column].min() for column in numeric], dtype=float)
+        stats.loc[numeric, 'max'] = high = np.array([df[column].max() for column in numeric], dtype=float)
+        empty = np.isnan(low)
+        # np.histogram's range for a constant column
+        constant = low == high
+        low, high = np.where(constant, low - 0.5, low), np.where(constant, high + 0.5, high)
+        low, high = np.where(empty, 0.0, low), np.where(empty, 1.0, high)
+        width = high - low
+        edges = np.linspace(low, high, BASE_BINS + 1, axis=-1)
+        flat_edges = edges.ravel()
+        counts = np.zeros(len(numeric) * BASE_BINS, dtype=np.int64)
+        sums, squares = np.zeros(len(numeric)), np.zeros(len(numeric))
+        for start in range(0, self.rows, ROWS_PER_PASS):
+            block = df.iloc[start:start + ROWS_PER_PASS][numeric].to_numpy(dtype=float, na_value=np.nan)
+            present = ~np.isnan(block)
+            x, col = block[present], np.broadcast_to(np.arange(len(numeric)), block.shape)[present]
+            # np.histogram's arithmetic and edge correction, for every column at once
+            bins = ((x - low[col]) / width[col] * BASE_BINS).astype(np.int64)
+            bins[bins == BASE_BINS] = BASE_BINS - 1
+            first = col * (BASE_BINS + 1)
+            bins -= x < flat_edges[first + bins]
+            bins += (x >= flat_edges[first + bins + 1]) & (bins != BASE_BINS - 1)
+            counts += np.bincount(col * BASE_BINS + bins, minlength=len(counts))
+            shifted = np.where(present, block - low, 0.0)
+            sums += shifted.sum(axis=0)
+            squares += (shifted * shifted).sum(axis=0)
+
+        self.base_counts = counts.reshape(len(numeric), BASE_BINS)
+        self.base_edges = edges
+        self.base_edges[empty] = np.nan
+        n = (self.rows - stats.loc[numeric, 'missing']).to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stats.loc[numeric, 'mean'] = np.where(n > 0, low + sums / n, np.nan)
+            stats.loc[numeric, 'std'] = np.sqrt(np.maximum(squares - sums * sums / n, 0) / (n - 1))
+        for column in numeric:
+            present = df[column].to_numpy(dtype=float, na_value=np.nan)
+            present = present[~np.isnan(present)]
+            if len(present):
+                stats.loc[column, [f"q{round(q * 100)}" for q in QUANTILES]] = np.quantile(present, QUANTILES)
+
+    def is_categorical(self, column):
+        return column in self.categories
+
+    def histogram(self, column, bins=40):
+        """(counts, edges) of `bins` equal-width bins, summed from the base histogram.
+
+        `bins` must divide BASE_BINS; a column without values has no bins.
+        """
+        if BASE_BINS % bins:
+            raise ValueError(f"bins must divide {BASE_BINS}, got {bins}")
+        i = self.numeric.index(column)
+        if np.isnan(self.base_edges[i, 0]):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        counts = self.base_counts[i].reshape(bins, BASE_BINS // bins).sum(axis=1)
+        return counts, self.base_edges[i, ::BASE_BINS // bins]
+
+    def value_counts(self, column):
+        """Row counts per value of a categorical column, labelled with VALUE_LABELS where known."""
+        counts = self.categories[column]
+        labels = VALUE_LABELS.get(column, {})
+        if column in self.numeric:
+            counts = counts.rename(index=lambda code: labels.get(int(code), f"{code:g}"))
+        return counts
+
+    def describe(self):
+        """The numeric columns' count, mean, std, min, quartiles and max, laid out like df.describe()."""
+        stats = self.stats.loc[self.numeric]
+        return pd.DataFrame({
+            'count': self.rows - stats['missing'], 'mean': stats['mean'], 'std': stats['std'], 'min': stats['min'],
+            '25%': stats['q25'], '50%': stats['q50'], '75%': stats['q75'], 'max': stats['max'],
+        }).T
+
+
+@st.cache_resource(show_spinner="Summarizing columns ...", max_entries=1)
+def _load_column_summaries_cached(path, version):
+    def build():
+        df = load_dataset(path)
+        with span("compute:column summaries", 'compute'):
+            return ColumnSummaries(df)
+    return shared_result("column summaries", path, version, build)
+
+
+def load_column_summaries(path=None):
+    """Returns the shared ColumnSummaries for the current dataset version."""
+    path = path or data_path()
+    return _load_column_summaries_cached(path, dataset_version(path))
@@ -0,0 +1,120 @@
+"""Survey-weighted statistics from the NHANES sampling weights.
+
+NHANES oversamples some groups, so unweighted means, rates and quantiles
+describe the sample rather than the population it was drawn from. Each
+participant's weight in WEIGHT_COLUMN ('Blood metal weights', the metals
+subsample weight) is the number of people they stand for. Rows without a
+positive weight are outside the subsample and are left out.
+
+Everything here is vectorized over groups: one sort, cumulative sums and a
+searchsorted instead of a Python loop per group. Weighted Pearson
+correlations and least-squares fits come from the same pair moments as the
+unweighted ones (correlation.pair_sums with weights). Their p-values use
+Kish's effective sample size in place of n; the survey's strata and PSUs are
+not modelled, so they are approximate.
+"""
+import numpy as np
+
+
+def effective_n(weights):
+    """Kish's effective sample size (sum w)^2 / sum w^2."""
+    weights = np.asarray(weights, dtype=float)
+    return weights.sum() ** 2 / (weights ** 2).sum() if len(weights) else 0.0
+
+
+def weighted_means(codes, values, weights, groups=None):
+    """Weighted mean of `values` per group code 0..groups-1 (NaN for a group without weight)."""
+    groups = groups if groups is not None else (codes.max() + 1 if len(codes) else 0)
+    totals = np.bincount(codes, weights=weights, minlength=groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.bincount(codes, weights=weights * values, minlength=groups) / np.where(totals > 0, totals, np.nan)
+
+
+def weighted_quantiles(codes, values, weights, qs, groups=None, presorted=False):
+    """Weighted quantiles `qs` of `values` per group code, as a (groups, len(qs)) array.
+
+    Generalizes the linear interpolation of np.percentile / pandas: within
+    a group sorted by value, the i-th value sits at (W_i - w_i) / (W - w_last)
+    with W_i the cumulative weight, so equal weights give exactly the
+    unweighted quantiles. Groups without values get NaN. `presorted` skips
+    the sort for rows already ordered by code, then value.
+    """
+    codes, values, weights = np.asarray(codes), np.asarray(values, dtype=float), np.asarray(weights, dtype=float)
+    groups = groups if groups is not None else (codes.max() + 1 if len(codes) else 0)
+    if not presorted:
+        order = np.lexsort((values, codes))
+        codes, values, weights = codes[order], values[order], weights[order]
+    result = np.full((groups, len(qs)), np.nan)
+    if not len(codes):
+        return result
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+    cumulative = np.cumsum(weights)
+    before = np.repeat(np.r_[0.0, cumulative[starts[1:] - 1]], ends - starts)
+    total = np.repeat(cumulative[ends - 1], ends - starts) - before
+    last = np.repeat(weights[ends - 1], ends - starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        position = np.clip((cumulative - before - weights) / (total - last), 0.0, 1.0)
+    position = np.where(total > last, position, 0.0)  # a single value (or weight) per group
+
+    # Positions rise from 0 to 1 within each group; offsetting by twice the
+    # group code makes them one sorted array for searchsorted
+    keys = 2.0 * codes + position
+    single = ends - starts == 1
+    for k, q in enumerate(qs):
+        upper = np.minimum(np.searchsorted(keys, 2.0 * codes[starts] + q, side='left'), ends - 1)
+        lower = np.maximum(upper - 1, starts)
+        span = position[upper] - position[lower]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(span > 0, (q - position[lower]) / span, 1.0)
+        value = values[lower] + np.clip(fraction, 0.0, 1.0) * (values[upper] - values[lower])
+        result[codes[starts], k] = np.where(single, values[starts], value)
+    return result
+
+
+def weighted_quantile_rows(values, weights, q, frequencies=False):
+    """weighted_quantiles' quantile `q` of sorted `values` under every row of a weight matrix.
+
+    `weights` is (rows, len(values)), with zeros for values a row leaves
+    out. Only the two values around the target cumulative weight
+    q * (W - w_last) are interpolated, so each row takes a cumulative sum and
+    a few argmax passes rather than a sort. With `frequencies=True` the
+    weights are integer counts, e.g. bootstrap draws, and each row's quantile
+    is np.percentile's over np.repeat(values, counts). Rows without weight
+    get NaN.
+    """
+    if frequencies:
+        cumulative = np.cumsum(weights, axis=1)
+        total = cumulative[:, -1]
+        # np.percentile's rank position among the repeated values, and its two neighbours
+        rank = q * np.maximum(total - 1, 0)
+        below = np.floor(rank)
+        lower = np.argmax(cumulative > below[:, None], axis=1)
+        upper = np.argmax(cumulative > np.minimum(below + 1, total - 1)[:, None], axis=1)
+        value = values[lower] + (rank - below) * (values[upper] - values[lower])
+        return np.where(total > 0, value, np.nan)
+    r = np.arange(len(weights))
+    drawn = weights > 0
+    cumulative = np.cumsum(weights, axis=1)
+    total = cumulative[:, -1]
+    last = len(values) - 1 - np.argmax(drawn[:, ::-1], axis=1)
+    target = q * (total - weights[r, last])
+    # The lower value is the first to reach the target, the upper the next drawn one
+    lower = np.argmax(cumulative >= target[:, None], axis=1)
+    lower = np.where(target > 0, lower, np.argmax(drawn, axis=1))
+    upper = np.argmax(cumulative > cumulative[r, lower][:, None], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.clip((target - cumulative[r, lower] + weights[r, lower]) / weights[r, lower], 0.0, 1.0)
+    value = values[lower] + fraction * (values[upper] - values[lower])
+    value = np.where(total > weights[r, last], value, values[last])  # a single drawn value
+    return np.where(total > 0, value, np.nan)
+
+
+def weighted_std(values, weights):
+    """Weighted standard deviation, with the small-sample correction of the effective n."""
+    total = weights.sum()
+    mean = (weights * values).sum() / total
+    n_eff = effective_n(weights)
+    variance = (weights * (values - mean) ** 2).sum() / total
+    return np.sqrt(variance * n_eff / (n_eff - 1)) if n_eff > 1 else 0.0